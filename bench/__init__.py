@@ -0,0 +1,10 @@
+"""
+Нагрузочные замеры горячего пути обработки сообщений.
+
+    python -m bench --messages 2000 --users 1,10,100 --dict-sizes 0,100,1000
+    python -m bench --save-baseline        # сохранить результат как эталон
+    python -m bench --baseline bench/baseline.json  # сравнить с эталоном
+
+Замеры запускаются во временном каталоге с отдельным DATA_DIR, поэтому
+не трогают данные бота; Google Sheets и Telegram заменены заглушками.
+"""
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = REPO_ROOT / "bench" / "baseline.json"
+TARGETS = ("parse_message", "process_message", "handle_message")
+WARMUP_MESSAGES = 200  # Сообщений, которые прогоняются до замера каждой цели
+
+
+def _prepare_environment(workdir: Path) -> None:
+    """
+    Изолирует замер: данные бота, словари и логи создаются во временном каталоге.
+    Должна вызываться до импорта модулей бота, которые читают окружение при импорте.
+    """
+    os.environ["DATA_DIR"] = str(workdir / "data")
+    os.environ.setdefault("BOT_TOKEN", "bench")
+    os.environ["LOG_FILE"] = ""
+    os.environ["PENDING_PERSIST"] = "0"
+    os.environ["LEMMA_CACHE_PERSIST"] = "0"
+    os.environ["WARMUP_MODE"] = "lazy"
+    sys.path.insert(0, str(REPO_ROOT))
+    # Пользовательские словари (config/user_dicts) лежат относительно рабочего каталога
+    os.chdir(workdir)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(target: str, users: int, dict_size: int, durations: List[float], wall: float) -> Dict[str, Any]:
+    durations = sorted(durations)
+    return {
+        "target": target,
+        "users": users,
+        "dict_size": dict_size,
+        "messages": len(durations),
+        "ops_per_sec": round(len(durations) / wall, 1) if wall else None,
+        "p50_ms": round(_percentile(durations, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(durations, 0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(durations) * 1000, 4),
+    }
+
+
+def _time_sync(func: Callable[[str, str], Any], corpus: List[Tuple[str, str]]) -> Tuple[List[float], float]:
+    durations = []
+    started = time.perf_counter()
+    for username, text in corpus:
+        t = time.perf_counter()
+        func(text, username)
+        durations.append(time.perf_counter() - t)
+    return durations, time.perf_counter() - started
+
+
+def _time_handle_message(corpus: List[Tuple[str, str]], first_id: int) -> Tuple[List[float], float]:
+    from bot.main import handle_message
+    from .fakes import FakeUpdate
+
+    async def run() -> Tuple[List[float], float]:
+        durations = []
+        started = time.perf_counter()
+        for i, (username, text) in enumerate(corpus):
+            update = FakeUpdate(username, text, first_id + i)
+            t = time.perf_counter()
+            await handle_message(update, None)
+            durations.append(time.perf_counter() - t)
+        return durations, time.perf_counter() - started
+
+    return asyncio.run(run())
+
+
+def _install_custom_dict(usernames: List[str], mapping: Dict[str, str]) -> None:
+    """Записывает пользовательские словари в формате журналов bot.dict_store."""
+    from bot.categories import store
+
+    lines = "".join(json.dumps({"k": k, "c": c}, ensure_ascii=False) + "\n" for k, c in mapping.items())
+    for username in usernames:
+        path = store.shard_path(username)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(lines, encoding="utf-8")
+
+
+def run_benchmarks(messages: int, users: List[int], dict_sizes: List[int], seed: int) -> List[Dict[str, Any]]:
+    """Прогоняет все цели для каждого сочетания числа пользователей и размера словаря."""
+    from bot import spreadsheet
+    from bot.handlers import process_message
+    from bot.parser import parse_message
+    from bot.sheets_sync import SheetsSyncQueue
+    from .corpus import generate_corpus, make_custom_dict
+    from .fakes import FakeWorksheet
+
+    spreadsheet.sync_queue = SheetsSyncQueue(FakeWorksheet, queue_path=None)
+
+    results = []
+    message_id = 1
+    for scenario, (user_count, dict_size) in enumerate((u, d) for u in users for d in dict_sizes):
+        # Свои имена пользователей в каждом сценарии: словари и надстройки строятся заново
+        usernames = [f"bench{scenario}_user{i}" for i in range(user_count)]
+        custom_dict = make_custom_dict(dict_size, seed)
+        _install_custom_dict(usernames, custom_dict)
+        corpus = generate_corpus(messages + WARMUP_MESSAGES, usernames, custom_dict, seed + scenario)
+        warmup, measured = corpus[:WARMUP_MESSAGES], corpus[WARMUP_MESSAGES:]
+
+        for target in TARGETS:
+            if target == "handle_message":
+                _time_handle_message(warmup, message_id)
+                message_id += len(warmup)
+                durations, wall = _time_handle_message(measured, message_id)
+                message_id += len(measured)
+            else:
+                func = parse_message if target == "parse_message" else process_message
+                _time_sync(func, warmup)
+                durations, wall = _time_sync(func, measured)
+            result = _summarize(target, user_count, dict_size, durations, wall)
+            results.append(result)
+            print(
+                f"{target:16} users={user_count:<5} dict={dict_size:<6} "
+                f"{result['ops_per_sec']:>10} msg/s  p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms",
+                flush=True,
+            )
+    spreadsheet.sync_queue.stop()
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с эталоном.
+
+    Returns:
+        List[str]: Описания регрессий: p99 выросла или пропускная способность упала
+        больше чем на ``threshold`` (доля)
+    """
+    reference = {(r["target"], r["users"], r["dict_size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        base = reference.get((r["target"], r["users"], r["dict_size"]))
+        if base is None:
+            continue
+        name = f"{r['target']} users={r['users']} dict={r['dict_size']}"
+        r["baseline"] = {"ops_per_sec": base["ops_per_sec"], "p99_ms": base["p99_ms"]}
+        if base["p99_ms"] and r["p99_ms"] > base["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {base['p99_ms']:.3f} -> {r['p99_ms']:.3f} ms")
+        if base["ops_per_sec"] and r["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['ops_per_sec']} -> {r['ops_per_sec']} msg/s")
+    return regressions
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hot path benchmarks: parse_message, process_message, handle_message")
+    parser.add_argument("--messages", type=int, default=2000, help="measured messages per target and scenario")
+    parser.add_argument("--users", type=_int_list, default=[1, 10, 100], help="comma-separated user counts")
+    parser.add_argument("--dict-sizes", type=_int_list, default=[0, 100, 1000], help="comma-separated custom dict sizes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"), help="JSON results file")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression, fraction")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    output, baseline_path = args.output.resolve(), args.baseline.resolve()
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        _prepare_environment(Path(workdir))
+        from bot.logging_setup import setup_logging
+        from bot.storage import close_storage
+
+        setup_logging(log_file=None, level="WARNING")
+        try:
+            results = run_benchmarks(args.messages, args.users, args.dict_sizes, args.seed)
+        finally:
+            close_storage()
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": os.getenv("STORAGE_BACKEND", "sqlite"),
+            "messages": args.messages,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    regressions = []
+    if baseline_path.exists() and not args.save_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results: {output}")
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved: {baseline_path}")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import random
+from typing import Dict, List, Sequence, Tuple
+
+from config.categories_map import CATEGORY_MAP
+
+# Доли видов комментариев в корпусе
+MIX = (
+    ("known", 0.40),       # ключ базового словаря как есть: «такси»
+    ("inflected", 0.20),   # другая форма слова: «такси» -> «продуктами»
+    ("multiword", 0.20),   # ключ в окружении других слов: «кофе с собой утром»
+    ("custom", 0.10),      # ключ пользовательского словаря (если он не пуст)
+    ("unknown", 0.10),     # комментарий, для которого категории нет
+)
+
+FILLERS = (
+    "утром", "вечером", "на работе", "для дома", "в пятницу", "с собой",
+    "с друзьями", "по акции", "в выходные", "до работы", "маме", "на неделю",
+)
+SYLLABLES = ("ба", "ку", "ро", "ми", "зе", "лу", "тра", "вос", "нок", "пре", "шу", "дым")
+
+
+def _pseudo_word(rng: random.Random, syllables: int = 3) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def _amount(rng: random.Random) -> str:
+    value = rng.choice((rng.randint(50, 500), rng.randint(500, 5000), rng.randint(5000, 50000)))
+    kind = rng.random()
+    if kind < 0.15:
+        return f"{value}.{rng.randint(0, 99):02d}"
+    if kind < 0.25:
+        return f"{value},{rng.randint(0, 99):02d}"
+    return str(value)
+
+
+def _inflections(keys: Sequence[str]) -> Dict[str, List[str]]:
+    """Словоформы однословных ключей (через pymorphy, как это делает бот)."""
+    from pymorphy3 import MorphAnalyzer
+
+    morph = MorphAnalyzer()
+    forms: Dict[str, List[str]] = {}
+    for key in keys:
+        if " " in key:
+            continue
+        lexeme = sorted({form.word for form in morph.parse(key)[0].lexeme} - {key})
+        if lexeme:
+            forms[key] = lexeme
+    return forms
+
+
+def make_custom_dict(size: int, seed: int) -> Dict[str, str]:
+    """Пользовательский словарь из ``size`` выдуманных слов со случайными категориями."""
+    rng = random.Random(seed)
+    categories = sorted(set(CATEGORY_MAP.values()))
+    mapping: Dict[str, str] = {}
+    while len(mapping) < size:
+        mapping[_pseudo_word(rng, rng.randint(2, 4))] = rng.choice(categories)
+    return mapping
+
+
+def generate_corpus(
+    messages: int,
+    usernames: Sequence[str],
+    custom_dict: Dict[str, str],
+    seed: int,
+) -> List[Tuple[str, str]]:
+    """
+    Генерирует сообщения «сумма комментарий» от случайных пользователей.
+
+    Returns:
+        List[Tuple[str, str]]: (username, текст сообщения)
+    """
+    rng = random.Random(seed)
+    keys = sorted(CATEGORY_MAP)
+    forms = _inflections(keys)
+    inflectable = sorted(forms)
+    custom_keys = sorted(custom_dict)
+    kinds = [kind for kind, _ in MIX]
+    weights = [weight if kind != "custom" or custom_keys else 0 for kind, weight in MIX]
+
+    corpus = []
+    for _ in range(messages):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "known":
+            comment = rng.choice(keys)
+        elif kind == "inflected":
+            comment = rng.choice(forms[rng.choice(inflectable)])
+        elif kind == "multiword":
+            words = [rng.choice(keys), rng.choice(FILLERS)]
+            rng.shuffle(words)
+            comment = " ".join(words)
+        elif kind == "custom":
+            comment = rng.choice(custom_keys)
+        else:
+            comment = " ".join(_pseudo_word(rng) for _ in range(rng.randint(1, 3)))
+        separator = "" if rng.random() < 0.05 else " "
+        corpus.append((rng.choice(usernames), f"{_amount(rng)}{separator}{comment}"))
+    return corpus
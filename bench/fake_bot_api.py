@@ -0,0 +1,154 @@
+"""
+Локальный фейковый Telegram Bot API для нагрузочных тестов webhook-режима.
+
+Отвечает на методы, которые вызывает бот (getMe, setWebhook, sendMessage,
+editMessageText, answerCallbackQuery, sendDocument, ...), и запоминает
+отправленные сообщения, чтобы генератор нагрузки мог измерить время ответа.
+
+    python -m bench.fake_bot_api --port 8081
+    BOT_API_URL=http://127.0.0.1:8081 python -m bot.main
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs
+
+_MULTIPART_CHAT_ID_RE = re.compile(rb'name="chat_id"\r\n\r\n(-?\d+)')
+
+
+class SentMessage(NamedTuple):
+    """Вызов метода, отправляющего сообщение."""
+    method: str
+    chat_id: Optional[int]
+    text: Optional[str]
+    received_at: float
+
+
+class FakeBotApi:
+    """
+    HTTP-сервер, имитирующий Bot API.
+
+    Args:
+        host: Адрес для прослушивания
+        port: Порт (0 — выбрать свободный)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self.sent: List[SentMessage] = []
+        self.calls: Dict[str, int] = {}
+        self.webhook: Dict[str, Any] = {}
+        self.webhook_set = threading.Event()
+        self._listeners: List[Callable[[SentMessage], None]] = []
+        handler = type("FakeBotApiHandler", (_Handler,), {"api": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def on_sent(self, listener: Callable[[SentMessage], None]) -> None:
+        """Регистрирует функцию, которая вызывается для каждого отправленного ботом сообщения."""
+        self._listeners.append(listener)
+
+    def start(self) -> "FakeBotApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Any:
+        """Возвращает поле result ответа Bot API для метода."""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if method == "setWebhook":
+            self.webhook = params
+            self.webhook_set.set()
+            return True
+        if method == "deleteWebhook":
+            self.webhook = {}
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook.get("url", ""), "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "getUpdates":
+            time.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return []
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            chat_id = params.get("chat_id")
+            sent = SentMessage(method, int(chat_id) if chat_id is not None else None, params.get("text"), time.perf_counter())
+            with self._lock:
+                self.sent.append(sent)
+            for listener in self._listeners:
+                listener(sent)
+            if chat_id is None:
+                return True
+            return {"message_id": next(self._message_ids), "date": int(time.time()),
+                    "chat": {"id": int(chat_id), "type": "private"}, "text": params.get("text") or ""}
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api: FakeBotApi
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        # Путь вида /bot<token>/<method>
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        params = _parse_params(self.headers.get("Content-Type", ""), body)
+        self._reply({"ok": True, "result": self.api.handle(method, params)})
+
+    do_GET = do_POST
+
+    def _reply(self, data: Dict[str, Any]) -> None:
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def _parse_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        match = _MULTIPART_CHAT_ID_RE.search(body)
+        return {"chat_id": match.group(1).decode()} if match else {}
+    return {key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    api = FakeBotApi(args.host, args.port).start()
+    print(f"fake Bot API: {api.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from typing import Any, Dict, List, Optional
+
+
+class FakeWorksheet:
+    """
+    Лист Google Sheets в памяти: хранит полученные строки и считает вызовы API.
+    Поддерживает ``append_rows`` и чтение целых колонок через ``get("F:F")``.
+    """
+
+    def __init__(self) -> None:
+        self.values: List[List[str]] = []
+        self.calls: Dict[str, int] = {}
+
+    @property
+    def rows(self) -> int:
+        return len(self.values)
+
+    def append_rows(self, rows: List[List[str]], value_input_option: Optional[str] = None) -> None:
+        self.calls["append_rows"] = self.calls.get("append_rows", 0) + 1
+        self.values.extend(list(row) for row in rows)
+
+    def get(self, range_name: str) -> List[List[str]]:
+        self.calls["get"] = self.calls.get("get", 0) + 1
+        first, _, last = range_name.upper().partition(":")
+        start, end = ord(first) - ord("A"), ord(last or first) - ord("A")
+        return [row[start:end + 1] for row in self.values if len(row) > start]
+
+
+class FakeUser:
+    def __init__(self, username: str) -> None:
+        self.username = username
+
+
+class FakeMessage:
+    """Сообщение Telegram: ответы складываются в список вместо отправки."""
+
+    def __init__(self, text: str, message_id: int) -> None:
+        self.text = text
+        self.message_id = message_id
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs: Any) -> None:
+        self.replies.append(text)
+
+
+class FakeUpdate:
+    """Минимальный Update для ``bot.main.handle_message``."""
+
+    def __init__(self, username: str, text: str, message_id: int) -> None:
+        self.effective_user = FakeUser(username)
+        self.message = FakeMessage(text, message_id)
+        self.callback_query = None
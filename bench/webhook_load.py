@@ -0,0 +1,191 @@
+"""
+Сквозной нагрузочный тест webhook-режима без доступа к Telegram.
+
+Запускает фейковый Bot API, бота в отдельном процессе с BOT_MODE=webhook
+и отправляет ему обновления так, как это делает Telegram. Время ответа
+измеряется от POST обновления до вызова sendMessage в фейковом API.
+
+    python -m bench.webhook_load --users 50 --messages-per-user 20
+    python -m bench.webhook_load --shards 4   # шардированный режим (bot.sharding)
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .corpus import generate_corpus
+from .fake_bot_api import FakeBotApi, SentMessage
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SECRET = "bench-secret"
+WEBHOOK_PATH = "telegram"
+STARTUP_TIMEOUT = 60.0
+REPLY_TIMEOUT = 30.0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_bot(api_url: str, port: int, workdir: Path, concurrent_updates: int, shards: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:bench",
+        BOT_MODE="webhook",
+        BOT_API_URL=api_url,
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(port),
+        WEBHOOK_PATH=WEBHOOK_PATH,
+        WEBHOOK_SECRET=SECRET,
+        CONCURRENT_UPDATES=str(concurrent_updates),
+        DATA_DIR=str(workdir / "data"),
+        LOG_FILE="",
+        LOG_LEVEL="WARNING",
+        WARMUP_MODE="eager",
+        PENDING_PERSIST="0",
+        PYTHONPATH=str(REPO_ROOT),
+    )
+    command = ["-m", "bot.sharding", "--shards", str(shards)] if shards else ["-m", "bot.main"]
+    return subprocess.Popen([sys.executable, *command], cwd=workdir, env=env)
+
+
+def _update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    user = {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench_user{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+class _Replies:
+    """Пробрасывает ответы фейкового API из его потока в event loop генератора нагрузки."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._lock = threading.Lock()
+
+    def queue(self, chat_id: int) -> asyncio.Queue:
+        with self._lock:
+            return self._queues.setdefault(chat_id, asyncio.Queue())
+
+    def __call__(self, sent: SentMessage) -> None:
+        if sent.chat_id is not None:
+            self._loop.call_soon_threadsafe(self.queue(sent.chat_id).put_nowait, sent)
+
+
+async def _run_load(webhook_url: str, api: FakeBotApi, users: int, per_user: int, seed: int) -> Dict[str, Any]:
+    replies = _Replies(asyncio.get_running_loop())
+    api.on_sent(replies)
+    usernames = [str(1000 + i) for i in range(users)]
+    corpus = generate_corpus(users * per_user, usernames, {}, seed)
+    texts: Dict[int, List[str]] = {}
+    for user, text in corpus:
+        texts.setdefault(int(user), []).append(text)
+
+    latencies: List[float] = []
+    post_latencies: List[float] = []
+    timeouts = 0
+    update_ids = iter(range(1, users * per_user + 1))
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(limits=limits, timeout=REPLY_TIMEOUT) as client:
+        rejected = await client.post(webhook_url, json=_update(0, 1, "1 проверка"),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+
+        async def user_session(user_id: int) -> None:
+            nonlocal timeouts
+            queue = replies.queue(user_id)
+            for text in texts.get(user_id, []):
+                started = time.perf_counter()
+                response = await client.post(webhook_url, json=_update(next(update_ids), user_id, text),
+                                             headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                post_latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                try:
+                    sent = await asyncio.wait_for(queue.get(), REPLY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    timeouts += 1
+                    continue
+                latencies.append(sent.received_at - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_session(int(u)) for u in usernames))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    post_latencies.sort()
+
+    def pct(values: List[float], q: float) -> Optional[float]:
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2) if values else None
+
+    return {
+        "users": users,
+        "messages": len(corpus),
+        "replies": len(latencies),
+        "timeouts": timeouts,
+        "wrong_secret_status": rejected.status_code,
+        "updates_per_sec": round(len(latencies) / wall, 1) if wall else None,
+        "reply_p50_ms": pct(latencies, 0.50),
+        "reply_p99_ms": pct(latencies, 0.99),
+        "reply_mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+        "webhook_post_p50_ms": pct(post_latencies, 0.50),
+        "webhook_post_p99_ms": pct(post_latencies, 0.99),
+        "api_calls": dict(api.calls),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end webhook load test against a local fake Bot API")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages-per-user", type=int, default=20)
+    parser.add_argument("--concurrent-updates", type=int, default=64, help="CONCURRENT_UPDATES for the bot")
+    parser.add_argument("--shards", type=int, default=0, help="run bot.sharding with N workers (0 — single process)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="write the JSON result here")
+    args = parser.parse_args()
+
+    api = FakeBotApi().start()
+    port = _free_port()
+    with tempfile.TemporaryDirectory(prefix="bot-webhook-") as workdir:
+        bot = _start_bot(api.url, port, Path(workdir), args.concurrent_updates, args.shards)
+        try:
+            if not api.webhook_set.wait(STARTUP_TIMEOUT) or bot.poll() is not None:
+                raise SystemExit("bot did not register its webhook")
+            webhook_url = f"http://127.0.0.1:{port}/{WEBHOOK_PATH}"
+            result = asyncio.run(_run_load(webhook_url, api, args.users, args.messages_per_user, args.seed))
+        finally:
+            bot.terminate()
+            bot.wait(30)
+            api.stop()
+
+    result["concurrent_updates"] = args.concurrent_updates
+    result["shards"] = args.shards
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    if result["wrong_secret_status"] != 403 or result["timeouts"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
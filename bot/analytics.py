@@ -0,0 +1,494 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config.paths import DATA_DIR
+from .storage import (
+    CATCH_UP_OVERLAP, CatchUpBuffer, Expense, ExpenseStorage, amount_to_kopecks, expense_id, format_datetime, get_storage,
+)
+from .logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Константы
+CACHE_DIR = DATA_DIR / "analytics"
+REBUILD_CHUNK_SIZE = 100000  # Строк, кодируемых за один проход при полном пересчете
+APPEND_BATCH_SIZE = 500      # Дописываем очередь в колонки, как только в ней столько расходов
+APPEND_FLUSH_INTERVAL = 2.0  # ...или через столько секунд после первого расхода в очереди
+
+# Колонки кэша: имя файла -> тип numpy
+COLUMNS = {
+    "amounts": np.int64,      # суммы в копейках
+    "timestamps": np.int64,   # datetime64[us] как int64
+    "categories": np.int32,   # коды категорий
+    "users": np.int32,        # коды пользователей
+}
+DICTIONARY_FILE = "dictionary.json"
+WATERMARK_FILE = "watermark.json"
+
+
+class ExpenseFrame(NamedTuple):
+    """Колоночное представление истории расходов."""
+    amounts: np.ndarray        # int64, копейки
+    timestamps: np.ndarray     # datetime64[us]
+    category_codes: np.ndarray  # int32
+    user_codes: np.ndarray     # int32
+    categories: List[str]      # код -> название категории
+    users: List[str]           # код -> username
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def mask(
+        self,
+        username: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> np.ndarray:
+        """Возвращает булеву маску строк пользователя за период [start, end)."""
+        selected = np.ones(len(self), dtype=bool)
+        if username is not None:
+            if username not in self.users:
+                return np.zeros(len(self), dtype=bool)
+            selected &= self.user_codes == self.users.index(username)
+        if start is not None:
+            selected &= self.timestamps >= np.datetime64(start, "us")
+        if end is not None:
+            selected &= self.timestamps < np.datetime64(end, "us")
+        return selected
+
+
+class ColumnarCache:
+    """
+    Кэш истории расходов в бинарных колонках, отображаемых в память.
+
+    Каждая колонка — отдельный файл фиксированной ширины, поэтому новая
+    запись дописывается в конец файлов, а чтение не разбирает CSV и Decimal:
+    ``np.memmap`` отдает колонки без копирования. Категории и пользователи
+    хранятся кодами, словари кодов лежат в dictionary.json. Сверка с
+    хранилищем (``sync``) идет в фоне и не блокирует запись расходов.
+
+    ``append`` только кладет расходы в очередь в памяти; фоновый поток
+    дописывает их в колонки пачками, как очередь Google Sheets, поэтому
+    запись расхода не ждет файловых операций. Вместе с колонками сохраняется
+    отметка содержимого (watermark.json): число строк и идентификатор последнего
+    по времени расхода. Если процесс упал, не дописав очередь, отметка не совпадет
+    с хранилищем и ``sync`` пересоздаст кэш.
+
+    Args:
+        directory: Каталог с файлами кэша
+        batch_size: Дописываем пачку, как только в очереди столько расходов
+        flush_interval: ...или через столько секунд после первого расхода в очереди
+    """
+
+    def __init__(
+        self,
+        directory: Path = CACHE_DIR,
+        batch_size: int = APPEND_BATCH_SIZE,
+        flush_interval: float = APPEND_FLUSH_INTERVAL,
+    ) -> None:
+        self._dir = directory
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        # _lock охраняет файлы и словари кодов, _cond — очередь и пересчет; порядок: _lock, затем _cond
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._categories: List[str] = []
+        self._users: List[str] = []
+        self._category_codes: Dict[str, int] = {}
+        self._user_codes: Dict[str, int] = {}
+        self._rows = 0
+        self._last: Optional[Tuple[str, str]] = None  # (время, идентификатор) последнего расхода
+        self._frame: Optional[ExpenseFrame] = None
+        self._catch_up = CatchUpBuffer()
+        self._pending: List[Expense] = []
+        self._oldest_pending_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_at_exit = False  # stop() уже зарегистрирован в atexit
+        self._load_dictionary()
+
+    def _path(self, name: str) -> Path:
+        return self._dir / f"{name}.bin"
+
+    def _load_dictionary(self) -> None:
+        path = self._dir / DICTIONARY_FILE
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._categories, self._users = data["categories"], data["users"]
+        self._category_codes = {name: code for code, name in enumerate(self._categories)}
+        self._user_codes = {name: code for code, name in enumerate(self._users)}
+        # Строк столько, сколько полностью записано во все колонки
+        self._rows = min(
+            (self._path(name).stat().st_size // np.dtype(dtype).itemsize if self._path(name).exists() else 0)
+            for name, dtype in COLUMNS.items()
+        )
+        try:
+            with open(self._dir / WATERMARK_FILE, "r", encoding="utf-8") as f:
+                watermark = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        # Отметка действительна, только если описывает ровно те строки, что есть в колонках
+        if watermark.get("rows") == self._rows and watermark.get("last"):
+            self._last = tuple(watermark["last"])
+
+    def _save_json(self, name: str, data: Dict) -> None:
+        path = self._dir / name
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _save_dictionary(self) -> None:
+        self._save_json(DICTIONARY_FILE, {"categories": self._categories, "users": self._users})
+
+    def _save_watermark(self) -> None:
+        self._save_json(WATERMARK_FILE, {"rows": self._rows, "last": list(self._last) if self._last else None})
+
+    def _code(self, codes: Dict[str, int], names: List[str], name: str) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def _encode(self, expenses: Iterable[Expense]) -> Tuple[Dict[str, np.ndarray], bool]:
+        """Кодирует расходы в колонки. Возвращает колонки и признак новых кодов в словарях."""
+        known = (len(self._categories), len(self._users))
+        amounts, timestamps, categories, users = [], [], [], []
+        for e in expenses:
+            amounts.append(amount_to_kopecks(e.amount))
+            timestamps.append(np.datetime64(e.datetime, "us"))
+            categories.append(self._code(self._category_codes, self._categories, e.category))
+            users.append(self._code(self._user_codes, self._users, e.username))
+            last = (format_datetime(e.datetime), expense_id(e))
+            if self._last is None or last > self._last:
+                self._last = last
+        columns = {
+            "amounts": np.array(amounts, dtype=np.int64),
+            "timestamps": np.array(timestamps, dtype="datetime64[us]").view(np.int64),
+            "categories": np.array(categories, dtype=np.int32),
+            "users": np.array(users, dtype=np.int32),
+        }
+        return columns, known != (len(self._categories), len(self._users))
+
+    def _append_columns(self, columns: Dict[str, np.ndarray]) -> None:
+        for name, values in columns.items():
+            with open(self._path(name), "r+b" if self._path(name).exists() else "wb") as f:
+                # Отрезаем хвост, оставшийся от прерванной записи, и дописываем
+                f.truncate(self._rows * values.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(values.tobytes())
+        self._rows += len(columns["amounts"])
+        self._frame = None
+
+    def _write(self, expenses: List[Expense]) -> None:
+        """Дописывает расходы в колонки и сохраняет отметку. Вызывается под ``_lock``."""
+        if not expenses:
+            return
+        self._dir.mkdir(parents=True, exist_ok=True)
+        columns, new_codes = self._encode(expenses)
+        if new_codes:
+            # Словарь пишется раньше колонок, чтобы любой сохраненный код был расшифрован
+            self._save_dictionary()
+        self._append_columns(columns)
+        self._save_watermark()
+
+    @property
+    def rows(self) -> int:
+        """Количество строк в колонках (без расходов, ожидающих в очереди)."""
+        return self._rows
+
+    def watermark(self) -> Tuple[int, str]:
+        """Число строк и идентификатор последнего по времени расхода — как ``ExpenseStorage.watermark``."""
+        return self._rows, self._last[1] if self._last else ""
+
+    def append(self, expenses: List[Expense]) -> None:
+        """Ставит новые расходы в очередь на запись в колонки (во время сверки — откладывает до ее конца)."""
+        with self._cond:
+            fresh = self._catch_up.offer(expenses)
+            if not fresh:
+                return
+            if not self._pending:
+                self._oldest_pending_at = time.monotonic()
+            self._pending.extend(fresh)
+            if len(self._pending) >= self._batch_size:
+                self._cond.notify_all()
+        self.start()
+
+    def flush(self) -> int:
+        """Дописывает очередь в колонки. Возвращает количество дописанных расходов."""
+        with self._lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._write(batch)
+        return len(batch)
+
+    def _ready(self) -> bool:
+        if not self._pending:
+            return False
+        if len(self._pending) >= self._batch_size:
+            return True
+        return time.monotonic() - self._oldest_pending_at >= self._flush_interval
+
+    def _wait_timeout(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(0.0, self._flush_interval - (time.monotonic() - self._oldest_pending_at))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set() and not self._ready():
+                    self._cond.wait(self._wait_timeout())
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                # Кэш разойдется с хранилищем по отметке и будет пересоздан при следующей сверке
+                logger.warning("Не удалось дописать колоночный кэш расходов: %s", e)
+                self._stop.wait(self._flush_interval)
+
+    def start(self) -> None:
+        """Запускает фоновый поток записи, если он ещё не запущен."""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-append", daemon=True)
+            self._thread.start()
+            if not self._stop_at_exit:
+                atexit.register(self.stop)
+                self._stop_at_exit = True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Останавливает фоновый поток и дописывает остаток очереди."""
+        with self._cond:
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Остаток очереди колоночного кэша не записан при остановке: %s", e)
+
+    def rebuild(self, storage: ExpenseStorage, now: Optional[datetime] = None) -> None:
+        """
+        Пересоздает кэш из хранилища, кодируя историю порциями.
+
+        Блокировка берется на время записи порции, а расходы, записанные во
+        время пересчета, дописываются после него ровно один раз (см. ``CatchUpBuffer``).
+        """
+        cutoff = (now or datetime.now()) - CATCH_UP_OVERLAP
+        with self._lock:
+            with self._cond:
+                self._catch_up.start()
+                # Расходы из очереди уже в хранилище и будут прочитаны заново
+                self._pending = []
+            self._dir.mkdir(parents=True, exist_ok=True)
+            for name in COLUMNS:
+                self._path(name).unlink(missing_ok=True)
+            self._categories, self._users = [], []
+            self._category_codes, self._user_codes = {}, {}
+            self._rows = 0
+            self._last = None
+            self._frame = None
+            self._save_watermark()
+        chunk: List[Expense] = []
+        tail: List[Expense] = []
+        try:
+            for expense in storage.iter_expenses():
+                if expense.datetime >= cutoff:
+                    tail.append(expense)
+                    continue
+                chunk.append(expense)
+                if len(chunk) >= REBUILD_CHUNK_SIZE:
+                    with self._lock:
+                        self._append_columns(self._encode(chunk)[0])
+                    chunk = []
+        except BaseException:
+            with self._cond:
+                self._catch_up.finish([], cutoff)
+            raise
+        with self._lock:
+            self._append_columns(self._encode(chunk)[0])
+            with self._cond:
+                extra = self._catch_up.finish(tail, cutoff)
+            self._save_dictionary()
+            self._save_watermark()
+            self._write(extra)
+        logger.info("Колоночный кэш расходов пересоздан: %s строк", self._rows)
+
+    def sync(self, storage: ExpenseStorage) -> None:
+        """
+        Пересоздает кэш, если его отметка (число строк и последний по времени
+        расход) не совпадает с хранилищем: так замечаются и пропущенные, и
+        подмененные записи при том же числе строк.
+        """
+        with self._lock:
+            with self._cond:
+                self._catch_up.start()
+                batch, self._pending = self._pending, []
+            self._write(batch)
+        try:
+            stale = self.watermark() != storage.watermark()
+        except BaseException:
+            stale = False
+            raise
+        finally:
+            if not stale:
+                # Расходы, отложенные во время сравнения, в отметке хранилища еще не учтены
+                with self._lock:
+                    with self._cond:
+                        extra = self._catch_up.finish([], datetime.min)
+                    self._write(extra)
+        if stale:
+            self.rebuild(storage)
+
+    def frame(self) -> ExpenseFrame:
+        """Возвращает колонки, отображенные в память (только чтение), дописав очередь."""
+        self.flush()
+        with self._lock:
+            if self._frame is None:
+                self._frame = ExpenseFrame(
+                    amounts=self._map("amounts", np.int64),
+                    timestamps=self._map("timestamps", np.int64).view("datetime64[us]"),
+                    category_codes=self._map("categories", np.int32),
+                    user_codes=self._map("users", np.int32),
+                    categories=list(self._categories),
+                    users=list(self._users),
+                )
+            return self._frame
+
+    def _map(self, name: str, dtype) -> np.ndarray:
+        if self._rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=(self._rows,))
+
+
+def _sum_by_code(codes: np.ndarray, amounts: np.ndarray, size: int) -> np.ndarray:
+    """Суммирует копейки по кодам в int64 — точно, без перевода в float."""
+    sums = np.zeros(size, dtype=np.int64)
+    np.add.at(sums, codes, amounts)
+    return sums
+
+
+def totals_by_category(frame: ExpenseFrame, selected: Optional[np.ndarray] = None) -> Dict[str, int]:
+    """Суммы по категориям в копейках."""
+    codes = frame.category_codes if selected is None else frame.category_codes[selected]
+    amounts = frame.amounts if selected is None else frame.amounts[selected]
+    sums = _sum_by_code(codes, amounts, len(frame.categories))
+    return {frame.categories[code]: int(total) for code, total in enumerate(sums) if total}
+
+
+def totals_by_user(frame: ExpenseFrame, selected: Optional[np.ndarray] = None) -> Dict[str, int]:
+    """Суммы по пользователям в копейках."""
+    codes = frame.user_codes if selected is None else frame.user_codes[selected]
+    amounts = frame.amounts if selected is None else frame.amounts[selected]
+    sums = _sum_by_code(codes, amounts, len(frame.users))
+    return {frame.users[code]: int(total) for code, total in enumerate(sums) if total}
+
+
+def monthly_totals(frame: ExpenseFrame, selected: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Суммы по месяцам без пропусков: месяцы без расходов получают 0.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (месяцы datetime64[M], суммы int64 в копейках)
+    """
+    timestamps = frame.timestamps if selected is None else frame.timestamps[selected]
+    amounts = frame.amounts if selected is None else frame.amounts[selected]
+    if not len(timestamps):
+        return np.zeros(0, dtype="datetime64[M]"), np.zeros(0, dtype=np.int64)
+    months = timestamps.astype("datetime64[M]")
+    first = months.min()
+    offsets = (months - first).astype(np.int64)
+    sums = _sum_by_code(offsets, amounts, int(offsets.max()) + 1)
+    return first + np.arange(len(sums)), sums
+
+
+def rolling_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее по окну ``window``; для первых ``window - 1`` точек — среднее по доступным."""
+    if window <= 0:
+        raise ValueError("window должен быть положительным")
+    cumulative = np.cumsum(np.asarray(values, dtype=np.float64))
+    result = cumulative.copy()
+    result[window:] = cumulative[window:] - cumulative[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return result / counts
+
+
+def month_over_month(frame: ExpenseFrame, selected: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Изменение трат от месяца к месяцу.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (месяцы, суммы, разница с прошлым
+        месяцем в копейках; для первого месяца — 0)
+    """
+    months, totals = monthly_totals(frame, selected)
+    deltas = np.diff(totals, prepend=totals[:1])
+    return months, totals, deltas
+
+
+def top_categories(frame: ExpenseFrame, n: int, selected: Optional[np.ndarray] = None) -> List[Tuple[str, int]]:
+    """Возвращает n категорий с наибольшими суммами (в копейках), по убыванию."""
+    codes = frame.category_codes if selected is None else frame.category_codes[selected]
+    amounts = frame.amounts if selected is None else frame.amounts[selected]
+    sums = _sum_by_code(codes, amounts, len(frame.categories))
+    n = min(n, int(np.count_nonzero(sums)))
+    if n <= 0:
+        return []
+    top = np.argpartition(-sums, n - 1)[:n]
+    top = top[np.argsort(-sums[top])]
+    return [(frame.categories[code], int(sums[code])) for code in top]
+
+
+# Общий кэш бота: дописывается в handlers.save_expenses, сверяется с хранилищем при старте
+analytics_cache = ColumnarCache()
+
+
+def main() -> None:
+    """Командная строка: тренды трат по месяцам и топ категорий."""
+    import argparse
+    from .reports import format_amount
+
+    parser = argparse.ArgumentParser(description="Expense trend analytics")
+    parser.add_argument("--user", help="only this username")
+    parser.add_argument("--top", type=int, default=5, help="number of top categories")
+    parser.add_argument("--window", type=int, default=3, help="rolling average window, months")
+    args = parser.parse_args()
+
+    setup_logging(log_file=None)
+    storage = get_storage()
+    try:
+        analytics_cache.sync(storage)
+    finally:
+        storage.close()
+    frame = analytics_cache.frame()
+    selected = frame.mask(username=args.user)
+    months, totals, deltas = month_over_month(frame, selected)
+    averages = rolling_average(totals, args.window)
+    for month, total, delta, average in zip(months, totals, deltas, averages):
+        print(f"{month}  {format_amount(int(total)):>16}  {int(delta) / 100:+12.2f}  avg {average / 100:12.2f}")
+    print("Top categories:")
+    for category, kopecks in top_categories(frame, args.top, selected):
+        print(f"  {category}: {format_amount(kopecks)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import threading
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .categories import valid_categories
+from .reports import format_amount
+from .rollups import Rollups
+from .storage import Expense, amount_to_kopecks
+from config.paths import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Константы
+BUDGETS_PATH = DATA_DIR / "budgets.json"
+THRESHOLDS = (0.8, 1.0)  # Доли лимита, при достижении которых бот предупреждает
+
+BUDGET_USAGE = """💼 Бюджеты на месяц:
+/budget — лимиты и траты за текущий месяц
+/budget Продукты 15000 — задать лимит для категории
+/budget Продукты 0 — убрать лимит"""
+
+
+class BudgetAlert(NamedTuple):
+    """Траты категории за месяц достигли порога лимита."""
+    category: str
+    spent: int  # копейки
+    limit: int  # копейки
+    threshold: float
+
+    @property
+    def text(self) -> str:
+        if self.threshold >= 1:
+            return (f"🚨 Бюджет «{self.category}» превышен: "
+                    f"{format_amount(self.spent)} из {format_amount(self.limit)}")
+        return (f"⚠️ Бюджет «{self.category}»: потрачено {format_amount(self.spent)} "
+                f"из {format_amount(self.limit)} ({self.spent / self.limit:.0%})")
+
+
+class BudgetStore:
+    """
+    Месячные лимиты по категориям: пользователь -> категория -> лимит в копейках.
+
+    Траты за месяц не пересчитываются: проверка берет готовую сумму из
+    агрегатов (``Rollups``), которые обновляются при каждой записи и
+    пересчитываются при старте, а новый месяц начинается с нуля сам собой,
+    потому что суммы хранятся по месяцам. Предупреждение отправляется, когда
+    запись переводит сумму через порог, поэтому состояние уведомлений хранить
+    не нужно. Лимиты загружаются при первом обращении и сохраняются в JSON
+    при каждом изменении.
+
+    Args:
+        path: Файл с лимитами
+    """
+
+    def __init__(self, path: Path = BUDGETS_PATH) -> None:
+        self._path = path
+        self._limits: Optional[Dict[str, Dict[str, int]]] = None
+        self._lock = threading.Lock()
+
+    def _loaded(self) -> Dict[str, Dict[str, int]]:
+        if self._limits is None:
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error("Не удалось загрузить бюджеты из %s: %s", self._path, e)
+                data = {}
+            self._limits = {
+                username: {category: int(limit) for category, limit in limits.items()}
+                for username, limits in data.items()
+            }
+        return self._limits
+
+    def _save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._limits, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+
+    def set_limit(self, username: str, category: str, kopecks: int) -> None:
+        """Задает месячный лимит категории; 0 убирает лимит."""
+        with self._lock:
+            limits = self._loaded()
+            if kopecks > 0:
+                limits.setdefault(username, {})[category] = kopecks
+            else:
+                limits.get(username, {}).pop(category, None)
+                if not limits.get(username):
+                    limits.pop(username, None)
+            self._save()
+        logger.info("Бюджет %s для %s: %s", category, username, kopecks)
+
+    def limits(self, username: str) -> Dict[str, int]:
+        """Возвращает лимиты пользователя (категория -> копейки)."""
+        with self._lock:
+            return dict(self._loaded().get(username, {}))
+
+    def check(self, expenses: Iterable[Expense], rollups: Rollups) -> List[BudgetAlert]:
+        """
+        Проверяет лимиты после записи расходов.
+
+        Вызывается, когда ``rollups`` уже учли ``expenses``. На каждую категорию
+        с лимитом — одно обращение к словарю агрегатов.
+
+        Returns:
+            List[BudgetAlert]: Старший пройденный порог для каждой категории и месяца
+        """
+        with self._lock:
+            limits = self._loaded()
+            if not limits:
+                return []
+        added: Dict[Tuple[str, int, int, str], int] = {}
+        for e in expenses:
+            if e.category in limits.get(e.username, ()):
+                key = (e.username, e.datetime.year, e.datetime.month, e.category)
+                added[key] = added.get(key, 0) + amount_to_kopecks(e.amount)
+        alerts = []
+        for (username, year, month, category), kopecks in added.items():
+            limit = limits.get(username, {}).get(category)
+            if not limit:
+                continue
+            spent = rollups.month_category_total(username, year, month, category)
+            crossed = [t for t in THRESHOLDS if spent - kopecks < t * limit <= spent]
+            if crossed:
+                alerts.append(BudgetAlert(category, spent, limit, crossed[-1]))
+        return alerts
+
+
+def find_category(name: str) -> Optional[str]:
+    """Находит категорию по названию без учета регистра."""
+    name = " ".join(name.split()).lower()
+    for category in valid_categories():
+        if category.lower() == name:
+            return category
+    return None
+
+
+def parse_budget_args(args: List[str]) -> Tuple[str, int]:
+    """
+    Разбирает аргументы ``/budget <категория> <сумма>``.
+
+    Returns:
+        Tuple[str, int]: (категория, лимит в копейках; 0 — убрать лимит)
+
+    Raises:
+        ValueError: Если категория или сумма не распознаны
+    """
+    if len(args) < 2:
+        raise ValueError("Укажите категорию и сумму")
+    try:
+        amount = Decimal(args[-1].replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Неверная сумма: {args[-1]}")
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"Неверная сумма: {args[-1]}")
+    category = find_category(" ".join(args[:-1]))
+    if category is None:
+        raise ValueError(f"Неизвестная категория: {' '.join(args[:-1])}")
+    return category, amount_to_kopecks(amount)
+
+
+def build_budget_report(store: BudgetStore, rollups: Rollups, username: str, today: date) -> str:
+    """Строит текст со списком лимитов и тратами по ним за текущий месяц."""
+    limits = store.limits(username)
+    if not limits:
+        return f"Бюджеты не заданы.\n\n{BUDGET_USAGE}"
+    spent = rollups.month_by_category(username, today.year, today.month)
+    lines = ["💼 Бюджеты на текущий месяц:"]
+    for category, limit in sorted(limits.items()):
+        used = spent.get(category, 0)
+        mark = "🚨" if used >= limit else "⚠️" if used >= THRESHOLDS[0] * limit else "✅"
+        lines.append(f"{mark} {category}: {format_amount(used)} из {format_amount(limit)} ({used / limit:.0%})")
+    return "\n".join(lines)
+
+
+# Общие лимиты бота: проверяются в handlers.save_expenses
+budgets = BudgetStore()
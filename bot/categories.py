@@ -1,54 +1,82 @@
 import json
 import logging
+import threading
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional
 from config.categories_map import CATEGORY_MAP
+from .dict_store import UserDictStore
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Константы
 DICT_PATH = Path("config") / "category_dict.json"
 MAX_LEMMA_LENGTH = 50
 MAX_CATEGORY_LENGTH = 30
-VALID_CATEGORIES = set(CATEGORY_MAP.values())
 
-# Теперь custom_category_map: Dict[str, Dict[str, str]]
-custom_category_map: Dict[str, Dict[str, str]] = {}
+# Пользовательские словари: по файлу-журналу на пользователя, загружаются лениво
+store = UserDictStore()
+_migration_lock = threading.Lock()
+_migrated = False
+# Подписчики на новые соответствия: callback(username, lemma, category)
+_mapping_listeners: List[Callable[[str, str, str], None]] = []
+
+# Базовый словарь и множество допустимых категорий заменяются целиком (см. set_base_map),
+# поэтому читатель всегда видит согласованную пару
+_base_map: Dict[str, str] = dict(CATEGORY_MAP)
+_valid_categories: FrozenSet[str] = frozenset(CATEGORY_MAP.values())
+# Подписчики на замену базового словаря: callback(новый словарь)
+_base_map_listeners: List[Callable[[Mapping[str, str]], None]] = []
+
+def get_base_map() -> Dict[str, str]:
+    """Возвращает текущий базовый словарь категорий (не изменять)."""
+    return _base_map
+
+def valid_categories() -> FrozenSet[str]:
+    """Возвращает категории текущего базового словаря."""
+    return _valid_categories
+
+def on_base_map_changed(listener: Callable[[Mapping[str, str]], None]) -> None:
+    """Регистрирует функцию, которая вызывается после замены базового словаря."""
+    _base_map_listeners.append(listener)
+
+def set_base_map(mapping: Mapping[str, str]) -> None:
+    """
+    Заменяет базовый словарь: подписчики (сопоставитель, подсказки) строят
+    новые индексы, после чего словарь и список категорий подменяются.
+    """
+    global _base_map, _valid_categories
+    mapping = dict(mapping)
+    for listener in _base_map_listeners:
+        listener(mapping)
+    _base_map, _valid_categories = mapping, frozenset(mapping.values())
+    logger.info("Базовый словарь категорий обновлен: %s ключей, %s категорий", len(mapping), len(_valid_categories))
 
 def ensure_config_directory() -> None:
     """Создает директорию config, если она не существует."""
     try:
         DICT_PATH.parent.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Директория {DICT_PATH.parent} создана или уже существует")
+        logger.info("Директория %s создана или уже существует", DICT_PATH.parent)
     except Exception as e:
-        logger.error(f"Ошибка при создании директории {DICT_PATH.parent}: {e}")
+        logger.error("Ошибка при создании директории %s: %s", DICT_PATH.parent, e)
         raise
 
 def load_custom_keywords() -> None:
-    """Загружает пользовательские соответствия категорий из файла."""
-    global custom_category_map
-    try:
-        if DICT_PATH.exists():
-            with open(DICT_PATH, "r", encoding="utf-8") as f:
-                custom_category_map = json.load(f)
-            logger.info(f"Загружено пользовательских профилей: {len(custom_category_map)}")
-        else:
-            logger.info("Файл с пользовательскими соответствиями не найден")
-    except json.JSONDecodeError as e:
-        logger.error(f"Ошибка при чтении JSON файла: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке пользовательских соответствий: {e}")
-        raise
+    """Переносит соответствия из старого общего файла category_dict.json (один раз)."""
+    global _migrated
+    if _migrated:
+        return
+    with _migration_lock:
+        if _migrated:
+            return
+        try:
+            store.migrate_from_json(DICT_PATH)
+        except json.JSONDecodeError as e:
+            logger.error("Ошибка при чтении JSON файла: %s", e)
+            raise
+        except Exception as e:
+            logger.error("Ошибка при переносе пользовательских соответствий: %s", e)
+            raise
+        _migrated = True
 
 def save_custom_keywords(lemma: str, category: str, username: str, overwrite: bool = False) -> None:
     """Сохраняет новое соответствие в пользовательский словарь.
@@ -68,37 +96,48 @@ def save_custom_keywords(lemma: str, category: str, username: str, overwrite: bo
     if len(category) > MAX_CATEGORY_LENGTH:
         raise ValueError(f"category слишком длинный (максимум {MAX_CATEGORY_LENGTH} символов)")
     
-    if category not in VALID_CATEGORIES:
+    if category not in valid_categories():
         raise ValueError(f"Неизвестная категория: {category}")
 
-    ensure_config_directory()
-    if username not in custom_category_map:
-        custom_category_map[username] = {}
-    if lemma in custom_category_map[username] and not overwrite:
-        logger.info(f"Соответствие для '{lemma}' у пользователя '{username}' уже существует")
+    load_custom_keywords()
+    if lemma in store.get(username) and not overwrite:
+        logger.info("Соответствие для '%s' у пользователя '%s' уже существует", lemma, username)
         return
-    custom_category_map[username][lemma] = category
     try:
-        with open(DICT_PATH, "w", encoding="utf-8") as f:
-            json.dump(custom_category_map, f, ensure_ascii=False, indent=2)
-        logger.info(f"Добавлено новое соответствие: '{lemma}' -> '{category}' для пользователя '{username}'")
+        store.put(username, lemma, category)
+        logger.info("Добавлено новое соответствие: '%s' -> '%s' для пользователя '%s'", lemma, category, username)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении соответствия: {e}")
+        logger.error("Ошибка при сохранении соответствия: %s", e)
         raise
+    for listener in _mapping_listeners:
+        listener(username, lemma, category)
+
+def on_mapping_added(listener: Callable[[str, str, str], None]) -> None:
+    """Регистрирует функцию, которая вызывается после сохранения нового соответствия."""
+    _mapping_listeners.append(listener)
+
+def on_user_unloaded(listener: Callable[[str], None]) -> None:
+    """Регистрирует функцию, которая вызывается при выгрузке словаря неактивного пользователя."""
+    store.on_evict(listener)
+
+def get_user_category_map(username: str) -> Dict[str, str]:
+    """Возвращает пользовательский словарь категорий (без базового)."""
+    load_custom_keywords()
+    return store.get(username)
 
 def get_combined_category_map(username: str) -> Dict[str, str]:
     """Возвращает объединенный словарь категорий."""
     try:
-        all_map = CATEGORY_MAP.copy()
-        user_map = custom_category_map.get(username, {})
+        all_map = get_base_map().copy()
+        user_map = get_user_category_map(username)
         all_map.update(user_map)
         
         if not user_map:
-            logger.warning(f"Пользовательский словарь категорий пуст для пользователя {username}")
+            logger.warning("Пользовательский словарь категорий пуст для пользователя %s", username)
             
         return all_map
     except Exception as e:
-        logger.error(f"Ошибка при объединении словарей категорий: {e}")
+        logger.error("Ошибка при объединении словарей категорий: %s", e)
         raise
 
 def add_category_mapping(comment: str, category: str, username: str, overwrite: bool = False) -> None:
@@ -113,8 +152,5 @@ def add_category_mapping(comment: str, category: str, username: str, overwrite:
     try:
         save_custom_keywords(comment, category, username, overwrite)
     except Exception as e:
-        logger.error(f"Ошибка при добавлении соответствия категории: {e}")
-        raise
-
-# Загружаем пользовательский словарь при запуске
-load_custom_keywords()
\ No newline at end of file
+        logger.error("Ошибка при добавлении соответствия категории: %s", e)
+        raise
\ No newline at end of file
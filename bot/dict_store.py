@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Константы
+SHARDS_DIR = Path("config") / "user_dicts"
+MAX_LOADED_USERS = 1000      # Сколько пользовательских словарей держать в памяти
+COMPACT_MIN_ENTRIES = 64     # Журнал короче этого не сжимаем
+COMPACT_RATIO = 2            # Сжимаем, когда записей в журнале вдвое больше, чем ключей
+MIGRATION_MARKER = ".migrated"
+
+_SAFE_NAME_RE = re.compile(r"^[A-Za-z0-9_]{1,64}$")
+
+
+class DictStoreStats(NamedTuple):
+    """Состояние хранилища пользовательских словарей."""
+    loaded_users: int
+    loads: int
+    evictions: int
+    appends: int
+    compactions: int
+
+
+FileSignature = Tuple[int, int, int]  # (inode, mtime в наносекундах, размер)
+
+
+def file_signature(path: Path) -> Optional[FileSignature]:
+    """Возвращает признаки изменения файла или None, если файла нет."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class _Shard:
+    """Загруженный словарь пользователя, длина его журнала и состояние файла на момент чтения."""
+
+    def __init__(self, mapping: Dict[str, str], journal_entries: int, signature: Optional[FileSignature]) -> None:
+        self.mapping = mapping
+        self.journal_entries = journal_entries
+        self.signature = signature
+
+
+class UserDictStore:
+    """
+    Хранилище пользовательских соответствий «комментарий -> категория».
+
+    Словарь каждого пользователя лежит в отдельном файле-журнале (JSONL):
+    новое соответствие дописывается одной строкой, а не перезаписывает общий
+    файл. Журналы читаются лениво при первом обращении к пользователю, в памяти
+    держатся словари только недавно активных пользователей (LRU). Когда журнал
+    разрастается из-за перезаписанных ключей, он атомарно сжимается.
+
+    Args:
+        directory: Каталог с файлами пользователей
+        max_loaded: Максимум словарей в памяти
+    """
+
+    def __init__(self, directory: Path = SHARDS_DIR, max_loaded: int = MAX_LOADED_USERS) -> None:
+        if max_loaded <= 0:
+            raise ValueError("max_loaded должен быть положительным")
+        self._dir = directory
+        self._max_loaded = max_loaded
+        self._shards: "OrderedDict[str, _Shard]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._evict_listeners: List[Callable[[str], None]] = []
+        self._loads = 0
+        self._evictions = 0
+        self._appends = 0
+        self._compactions = 0
+
+    def shard_path(self, username: str) -> Path:
+        """Возвращает путь к журналу пользователя."""
+        if _SAFE_NAME_RE.match(username):
+            name = username
+        else:
+            name = "u_" + hashlib.sha1(username.encode("utf-8")).hexdigest()
+        return self._dir / f"{name}.jsonl"
+
+    def on_evict(self, listener: Callable[[str], None]) -> None:
+        """Регистрирует функцию, которая вызывается при выгрузке словаря пользователя из памяти."""
+        self._evict_listeners.append(listener)
+
+    def _read_shard(self, username: str) -> _Shard:
+        path = self.shard_path(username)
+        mapping: Dict[str, str] = {}
+        entries = 0
+        # Снимок до чтения: если файл изменят во время чтения, следующая проверка это заметит
+        signature = file_signature(path)
+        if path.exists():
+            valid_end = 0
+            with open(path, "rb+") as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        # Недописанная последняя строка (сбой во время записи) — отрезаем,
+                        # чтобы следующая запись не склеилась с ней
+                        logger.warning("Отброшена недописанная запись в %s", path)
+                        f.truncate(valid_end)
+                        break
+                    valid_end += len(raw)
+                    try:
+                        entry = json.loads(raw.decode("utf-8"))
+                        mapping[entry["k"]] = entry["c"]
+                        entries += 1
+                    except (UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError):
+                        logger.warning("Пропущена поврежденная запись в %s: %r", path, raw[:100])
+        self._loads += 1
+        return _Shard(mapping, entries, signature)
+
+    def _shard(self, username: str) -> _Shard:
+        shard = self._shards.get(username)
+        if shard is not None:
+            self._shards.move_to_end(username)
+            return shard
+        shard = self._shards[username] = self._read_shard(username)
+        while len(self._shards) > self._max_loaded:
+            evicted, _ = self._shards.popitem(last=False)
+            self._evictions += 1
+            for listener in self._evict_listeners:
+                listener(evicted)
+        return shard
+
+    def get(self, username: str) -> Dict[str, str]:
+        """Возвращает словарь пользователя, при необходимости загружая его с диска."""
+        with self._lock:
+            return self._shard(username).mapping
+
+    def put(self, username: str, key: str, category: str) -> None:
+        """
+        Сохраняет соответствие: дописывает одну запись в журнал пользователя.
+
+        Raises:
+            OSError: Если не удалось записать журнал
+        """
+        with self._lock:
+            shard = self._shard(username)
+            path = self.shard_path(username)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            line = json.dumps({"k": key, "c": category}, ensure_ascii=False) + "\n"
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            shard.mapping[key] = category
+            shard.journal_entries += 1
+            self._appends += 1
+            if shard.journal_entries >= max(COMPACT_MIN_ENTRIES, COMPACT_RATIO * len(shard.mapping)):
+                self._compact(username, shard)
+            # Собственная запись не должна считаться внешним изменением
+            shard.signature = file_signature(path)
+
+    def _compact(self, username: str, shard: _Shard) -> None:
+        path = self.shard_path(username)
+        tmp_path = path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, category in shard.mapping.items():
+                f.write(json.dumps({"k": key, "c": category}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        shard.journal_entries = len(shard.mapping)
+        self._compactions += 1
+        logger.info("Журнал словаря пользователя %s сжат до %s записей", username, len(shard.mapping))
+
+    def unload_changed(self) -> List[str]:
+        """
+        Выгружает словари пользователей, файлы которых изменились на диске
+        в обход бота (по inode, времени изменения и размеру). Они будут
+        перечитаны при следующем обращении, остальные не трогаются.
+
+        Returns:
+            List[str]: Пользователи, словари которых выгружены
+        """
+        with self._lock:
+            changed = [
+                username for username, shard in self._shards.items()
+                if file_signature(self.shard_path(username)) != shard.signature
+            ]
+            for username in changed:
+                del self._shards[username]
+                for listener in self._evict_listeners:
+                    listener(username)
+        if changed:
+            logger.info("Словари изменены на диске, будут перечитаны: %s", ", ".join(changed))
+        return changed
+
+    def compact(self, username: str) -> None:
+        """Переписывает журнал пользователя, оставляя по одной записи на ключ."""
+        with self._lock:
+            self._compact(username, self._shard(username))
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """
+        Переносит словари из старого общего файла category_dict.json.
+
+        Выполняется один раз: после переноса в каталоге остается маркер.
+        Записи верхнего уровня без пользователя (формат до появления
+        пользовательских словарей) не переносятся.
+
+        Returns:
+            int: Количество перенесенных соответствий
+        """
+        marker = self._dir / MIGRATION_MARKER
+        if marker.exists() or not json_path.exists():
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        migrated = 0
+        with self._lock:
+            for username, mapping in data.items():
+                if not isinstance(mapping, dict):
+                    logger.warning("Пропущено соответствие без пользователя: '%s' -> '%s'", username, mapping)
+                    continue
+                for key, category in mapping.items():
+                    if self.get(username).get(key) != category:
+                        self.put(username, key, category)
+                        migrated += 1
+            self._dir.mkdir(parents=True, exist_ok=True)
+            marker.write_text(str(json_path), encoding="utf-8")
+        logger.info("Перенесено соответствий из %s: %s", json_path, migrated)
+        return migrated
+
+    def stats(self) -> DictStoreStats:
+        """Возвращает количество загруженных словарей и счетчики операций."""
+        with self._lock:
+            return DictStoreStats(len(self._shards), self._loads, self._evictions, self._appends, self._compactions)
@@ -0,0 +1,93 @@
+"""
+Перечитывание словарей категорий на лету, без перезапуска бота.
+
+Фоновый поток раз в ``DICT_RELOAD_INTERVAL`` секунд сравнивает inode, время
+изменения и размер файлов со снимком, сделанным при их чтении. Проверка
+стоит один ``stat`` на файл, файлы перечитываются, только если изменились:
+
+- базовый словарь ``config/categories_map.json`` разбирается и проверяется,
+  новые индексы (сопоставитель и подсказки) строятся рядом со старыми и
+  подменяются одной операцией (см. ``categories.set_base_map``); если файл
+  испорчен, бот продолжает работать со старым словарем;
+- журналы пользовательских словарей ``config/user_dicts/<user>.jsonl``
+  проверяются только у загруженных пользователей; изменившиеся выгружаются
+  и перечитываются при следующем сообщении пользователя.
+
+Редактировать файлы лучше заменой целиком (запись во временный файл и
+переименование), чтобы бот не прочитал наполовину записанный файл.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from .categories import set_base_map, store
+from .dict_store import file_signature
+from .metrics import metrics
+from config.categories_map import CATEGORY_MAP_PATH, load_category_map
+
+logger = logging.getLogger(__name__)
+
+
+class DictionaryWatcher:
+    """
+    Следит за файлами словарей категорий.
+
+    Args:
+        interval: Период проверки в секундах
+        path: Файл базового словаря
+    """
+
+    def __init__(self, interval: float, path: Path = CATEGORY_MAP_PATH) -> None:
+        if interval <= 0:
+            raise ValueError("interval должен быть положительным")
+        self._interval = interval
+        self._path = path
+        # Базовый словарь прочитан при импорте config.categories_map
+        self._signature = file_signature(path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """
+        Проверяет файлы один раз и применяет изменения.
+
+        Returns:
+            bool: Был ли заменен базовый словарь
+        """
+        reloaded = len(store.unload_changed())
+        metrics.inc("bot_dict_reloads_total", reloaded)
+        signature = file_signature(self._path)
+        if signature == self._signature:
+            return False
+        # Снимок до чтения: изменение во время чтения будет замечено на следующей проверке
+        self._signature = signature
+        try:
+            mapping = load_category_map(self._path)
+        except (OSError, ValueError) as e:
+            metrics.inc("bot_dict_reload_errors_total")
+            logger.error("Базовый словарь %s не перечитан, остается прежний: %s", self._path, e)
+            return False
+        set_base_map(mapping)
+        metrics.inc("bot_dict_reloads_total")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Ошибка проверки словарей категорий")
+
+    def start(self) -> None:
+        """Запускает фоновую проверку."""
+        self._thread = threading.Thread(target=self._run, name="dict-watch", daemon=True)
+        self._thread.start()
+        logger.info("Словари категорий проверяются каждые %s с", self._interval)
+
+    def stop(self) -> None:
+        """Останавливает фоновую проверку."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
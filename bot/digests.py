@@ -0,0 +1,371 @@
+"""
+Сводки расходов по расписанию: ежедневная, еженедельная и ежемесячная.
+
+Пользователь подписывается командой /digest. Раз в день в ``DIGEST_TIME``
+задача JobQueue планирует рассылку: в потоке пула, а не в цикле событий,
+для каждого подписчика строится текст из агрегатов (``Rollups``) — несколько
+обращений к словарям, без чтения хранилища. Подписчики распределяются по окну
+``DIGEST_WINDOW`` по хэшу имени, а отправка идет каждую секунду пачками не
+больше ``DIGEST_RATE`` сообщений и не больше ``MAX_CONCURRENT_SENDS``
+одновременных запросов, поэтому рассылка не забирает соединения и время
+цикла у обработки сообщений и укладывается в ограничения Telegram.
+
+В один день пользователь получает одно сообщение: по понедельникам к
+ежедневной сводке добавляется недельная, первого числа — месячная.
+Дата последней отправки хранится вместе с подпиской, так что перезапуск
+посреди окна не приводит к повторной рассылке. Отметки об отправке
+записываются на диск не чаще раза в ``SENT_SAVE_INTERVAL``, в конце рассылки
+и при остановке бота: после аварийного завершения повторно могут уйти
+только сводки последнего интервала.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.ext import ContextTypes, JobQueue
+
+from .metrics import metrics
+from .reports import MONTH_NAMES, format_amount, previous_month
+from .rollups import Rollups
+from config.paths import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Константы
+DIGESTS_PATH = DATA_DIR / "digests.json"
+PERIODS = ("daily", "weekly", "monthly")
+PERIOD_ALIASES = {
+    "daily": "daily", "day": "daily", "день": "daily", "ежедневно": "daily",
+    "weekly": "weekly", "week": "weekly", "неделя": "weekly", "еженедельно": "weekly",
+    "monthly": "monthly", "month": "monthly", "месяц": "monthly", "ежемесячно": "monthly",
+}
+PERIOD_TITLES = {"daily": "ежедневная", "weekly": "еженедельная", "monthly": "ежемесячная"}
+MAX_CATEGORIES = 5  # Сколько крупнейших категорий показывать в сводке
+MAX_CONCURRENT_SENDS = 4  # Одновременных запросов рассылки (пул соединений общий с ответами)
+SEND_INTERVAL = 1.0  # Период отправки пачек, в секундах
+ROLLUPS_RETRY = 60.0  # Через сколько секунд повторить планирование, если агрегаты еще пересчитываются
+SENT_SAVE_INTERVAL = 30.0  # Как часто сохранять отметки об отправке во время рассылки, в секундах
+
+DIGEST_USAGE = """📬 Сводки расходов:
+/digest — текущие подписки
+/digest daily — каждый день за вчера
+/digest weekly — по понедельникам за прошлую неделю
+/digest monthly — первого числа за прошлый месяц
+/digest daily weekly — несколько сводок сразу
+/digest off — отписаться"""
+
+
+class Subscription(NamedTuple):
+    """Подписка пользователя на сводки."""
+    chat_id: int
+    periods: Tuple[str, ...]
+    # Дата последней отправленной сводки (ISO) или None
+    sent: Optional[str] = None
+
+
+class Delivery(NamedTuple):
+    """Подготовленная к отправке сводка."""
+    offset: float  # Секунды от начала окна рассылки
+    username: str
+    chat_id: int
+    text: str
+
+
+def parse_digest_args(args: List[str]) -> Tuple[str, ...]:
+    """
+    Разбирает аргументы ``/digest``.
+
+    Returns:
+        Tuple[str, ...]: Периоды подписки в порядке ``PERIODS``; пустой кортеж — отписка
+
+    Raises:
+        ValueError: Если период не распознан
+    """
+    periods = set()
+    for arg in (a.lower() for a in args):
+        if arg in ("off", "stop", "выкл", "нет"):
+            return ()
+        if arg not in PERIOD_ALIASES:
+            raise ValueError(f"Неизвестный период: {arg}")
+        periods.add(PERIOD_ALIASES[arg])
+    return tuple(p for p in PERIODS if p in periods)
+
+
+class DigestStore:
+    """
+    Подписки на сводки: пользователь -> чат, периоды и дата последней отправки.
+
+    Загружаются при первом обращении и сохраняются в JSON при каждом
+    изменении подписки. Отметки об отправке (``mark_sent``) меняют только
+    память, на диск их записывает ``flush``.
+
+    Args:
+        path: Файл с подписками
+    """
+
+    def __init__(self, path: Path = DIGESTS_PATH) -> None:
+        self._path = path
+        self._subscriptions: Optional[Dict[str, Subscription]] = None
+        self._lock = threading.Lock()
+        self._dirty = False  # Есть отметки об отправке, не записанные на диск
+
+    def _loaded(self) -> Dict[str, Subscription]:
+        if self._subscriptions is None:
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error("Не удалось загрузить подписки на сводки из %s: %s", self._path, e)
+                data = {}
+            self._subscriptions = {
+                username: Subscription(int(item["chat_id"]), tuple(item["periods"]), item.get("sent"))
+                for username, item in data.items()
+            }
+        return self._subscriptions
+
+    def _save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({username: s._asdict() for username, s in self._subscriptions.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+        self._dirty = False
+
+    def subscribe(self, username: str, chat_id: int, periods: Tuple[str, ...]) -> None:
+        """Задает периоды подписки; пустой кортеж отписывает пользователя."""
+        with self._lock:
+            subscriptions = self._loaded()
+            if periods:
+                previous = subscriptions.get(username)
+                subscriptions[username] = Subscription(chat_id, periods, previous.sent if previous else None)
+            else:
+                subscriptions.pop(username, None)
+            self._save()
+        logger.info("Сводки для %s: %s", username, ", ".join(periods) or "отключены")
+
+    def get(self, username: str) -> Optional[Subscription]:
+        with self._lock:
+            return self._loaded().get(username)
+
+    def subscriptions(self) -> Dict[str, Subscription]:
+        """Возвращает копию всех подписок."""
+        with self._lock:
+            return dict(self._loaded())
+
+    def mark_sent(self, usernames: Iterable[str], day: date) -> None:
+        """Отмечает, что сводки за ``day`` отправлены; на диск отметки записывает ``flush``."""
+        with self._lock:
+            subscriptions = self._loaded()
+            for username in usernames:
+                subscription = subscriptions.get(username)
+                if subscription is not None:
+                    subscriptions[username] = subscription._replace(sent=day.isoformat())
+                    self._dirty = True
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def flush(self) -> None:
+        """Записывает на диск отметки об отправке, если они есть."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+
+def delivery_offset(username: str, window: float) -> float:
+    """Сдвиг отправки от начала окна: постоянный для пользователя и равномерный по окну."""
+    return zlib.crc32(username.encode("utf-8")) % 1_000_000 / 1_000_000 * window
+
+
+def due_periods(periods: Iterable[str], today: date) -> List[str]:
+    """Периоды, сводки за которые отправляются сегодня."""
+    due = {"daily": True, "weekly": today.weekday() == 0, "monthly": today.day == 1}
+    return [period for period in periods if due[period]]
+
+
+def _top_lines(totals: Dict[str, int]) -> List[str]:
+    ranked = sorted(totals.items(), key=lambda item: -item[1])
+    lines = [f"• {category} — {format_amount(kopecks)}" for category, kopecks in ranked[:MAX_CATEGORIES]]
+    if len(ranked) > MAX_CATEGORIES:
+        lines.append(f"• прочее — {format_amount(sum(k for _, k in ranked[MAX_CATEGORIES:]))}")
+    return lines
+
+
+def _change(current: int, previous: int) -> str:
+    if not previous:
+        return ""
+    return f" ({(current - previous) / previous:+.0%} к предыдущему периоду)"
+
+
+def build_period_digest(rollups: Rollups, username: str, period: str, today: date) -> Optional[str]:
+    """
+    Строит сводку за завершившийся период: вчера, прошлую неделю или прошлый месяц.
+
+    Returns:
+        Optional[str]: Текст сводки или None, если расходов за период не было
+    """
+    if period == "daily":
+        day = today - timedelta(days=1)
+        totals = rollups.day_by_category(username, day)
+        previous = rollups.day_by_category(username, day - timedelta(days=7))
+        title = f"🗓 Вчера, {day:%d.%m}"
+    elif period == "weekly":
+        end = today - timedelta(days=today.weekday() + 1)
+        start = end - timedelta(days=6)
+        totals = rollups.range_by_category(username, start, end)
+        previous = rollups.range_by_category(username, start - timedelta(days=7), end - timedelta(days=7))
+        title = f"📅 Неделя {start:%d.%m}–{end:%d.%m}"
+    elif period == "monthly":
+        year, month = previous_month(today.year, today.month)
+        totals = rollups.month_by_category(username, year, month)
+        previous = rollups.month_by_category(username, *previous_month(year, month))
+        title = f"📊 {MONTH_NAMES[month - 1].capitalize()} {year}"
+    else:
+        raise ValueError(f"Неизвестный период: {period}")
+    if not totals:
+        return None
+    total = sum(totals.values())
+    lines = [f"{title}: {format_amount(total)}{_change(total, sum(previous.values()))}"]
+    return "\n".join(lines + _top_lines(totals))
+
+
+def build_digest(rollups: Rollups, username: str, periods: Iterable[str], today: date) -> Optional[str]:
+    """Собирает сводки за все наступившие сегодня периоды в одно сообщение."""
+    parts = [build_period_digest(rollups, username, period, today) for period in due_periods(periods, today)]
+    parts = [part for part in parts if part]
+    return "\n\n".join(parts) if parts else None
+
+
+def plan_deliveries(store: DigestStore, rollups: Rollups, today: date, window: float) -> List[Delivery]:
+    """
+    Готовит сводки на сегодня для всех подписчиков, которым они еще не отправлены.
+
+    Returns:
+        List[Delivery]: Сводки в порядке отправки
+    """
+    deliveries = []
+    for username, subscription in store.subscriptions().items():
+        if subscription.sent == today.isoformat():
+            continue
+        text = build_digest(rollups, username, subscription.periods, today)
+        if text:
+            deliveries.append(Delivery(delivery_offset(username, window), username, subscription.chat_id, text))
+    deliveries.sort()
+    return deliveries
+
+
+class DigestScheduler:
+    """
+    Рассылка сводок через JobQueue приложения.
+
+    Args:
+        store: Подписки
+        rollups: Агрегаты расходов
+        at: Начало окна рассылки (местное время)
+        window: Длительность окна рассылки, в секундах
+        rate: Максимум сообщений в секунду
+    """
+
+    def __init__(self, store: DigestStore, rollups: Rollups, at: dtime, window: float, rate: int) -> None:
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self._store = store
+        self._rollups = rollups
+        self._at = at
+        self._window = window
+        self._rate = rate
+        self._queue: Deque[Delivery] = deque()
+        self._started = 0.0  # time.monotonic() начала окна
+        self._paused_until = 0.0
+        self._day: Optional[date] = None
+        self._saved_at = time.monotonic()  # Последнее сохранение отметок или начало рассылки
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _window_start(self, now: datetime) -> datetime:
+        return datetime.combine(now.date(), self._at)
+
+    def schedule(self, job_queue: JobQueue) -> None:
+        """Регистрирует ежедневное планирование; если окно уже идет, планирует рассылку сразу."""
+        tz = datetime.now().astimezone().tzinfo
+        job_queue.run_daily(self._plan, self._at.replace(tzinfo=tz), name="digest-plan")
+        job_queue.run_repeating(self._send_due, SEND_INTERVAL, name="digest-send")
+        now = datetime.now()
+        if timedelta(0) <= now - self._window_start(now) < timedelta(seconds=self._window):
+            job_queue.run_once(self._plan, 0, name="digest-plan-late")
+        logger.info("Сводки рассылаются с %s в течение %s с, до %s сообщений в секунду",
+                    self._at.strftime("%H:%M"), int(self._window), self._rate)
+
+    async def _plan(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not self._rollups.ready:
+            logger.info("Агрегаты еще пересчитываются, сводки будут запланированы через %s с", int(ROLLUPS_RETRY))
+            context.job_queue.run_once(self._plan, ROLLUPS_RETRY, name="digest-plan-retry")
+            return
+        now = datetime.now()
+        elapsed = max(0.0, (now - self._window_start(now)).total_seconds())
+        # Сводки строятся в потоке: цикл событий в это время обслуживает сообщения
+        deliveries = await asyncio.to_thread(plan_deliveries, self._store, self._rollups, now.date(), self._window)
+        self._day = now.date()
+        self._started = time.monotonic() - elapsed
+        self._queue = deque(deliveries)
+        self._saved_at = time.monotonic()
+        logger.info("Запланировано сводок: %s", len(deliveries))
+
+    async def _send_due(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        now = time.monotonic()
+        if not self._queue or now < self._paused_until:
+            return
+        batch = []
+        while self._queue and len(batch) < self._rate and self._queue[0].offset <= now - self._started:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+        async def send(delivery: Delivery) -> Optional[bool]:
+            async with semaphore:
+                try:
+                    await context.bot.send_message(delivery.chat_id, delivery.text)
+                    return True
+                except RetryAfter as e:
+                    # Telegram просит подождать: сводка вернется в очередь, рассылка приостанавливается
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    self._queue.appendleft(delivery)
+                    return None
+                except Forbidden:
+                    logger.info("Пользователь %s заблокировал бота, подписка на сводки снята", delivery.username)
+                    await asyncio.to_thread(self._store.subscribe, delivery.username, delivery.chat_id, ())
+                    return False
+                except TelegramError as e:
+                    logger.warning("Не удалось отправить сводку %s: %s", delivery.username, e)
+                    return False
+
+        results = await asyncio.gather(*(send(delivery) for delivery in batch))
+        sent = [d.username for d, ok in zip(batch, results) if ok]
+        failed = sum(1 for ok in results if ok is False)
+        metrics.inc("bot_digests_sent_total", len(sent))
+        metrics.inc("bot_digest_failures_total", failed)
+        done = [d.username for d, ok in zip(batch, results) if ok is not None]
+        if done:
+            self._store.mark_sent(done, self._day)
+        # Файл подписок переписывается целиком: раз в интервал и в конце рассылки, а не на каждую пачку
+        if self._store.dirty and (not self._queue or now - self._saved_at >= SENT_SAVE_INTERVAL):
+            self._saved_at = now
+            await asyncio.to_thread(self._store.flush)
+
+
+# Общие подписки бота: команда /digest в bot.main
+digests = DigestStore()
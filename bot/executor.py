@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Константы
+MAX_WORKERS = 8      # Потоков для синхронной обработки (парсинг, файлы, Sheets)
+MAX_PENDING = 32     # Задач, одновременно переданных в пул; остальные ждут
+
+T = TypeVar("T")
+
+
+class ExecutorStats(NamedTuple):
+    """Состояние пула обработки сообщений."""
+    max_workers: int
+    in_flight: int
+    waiting: int
+    completed: int
+
+
+class OrderedExecutor:
+    """
+    Выполняет синхронную обработку сообщений вне event loop.
+
+    Работа уходит в ограниченный пул потоков, поэтому лемматизация,
+    запись файлов и обращения к Sheets одного пользователя не блокируют
+    остальных. Задачи одного ключа (username) выполняются строго по очереди
+    в порядке поступления, а при заполненном пуле новые задачи ждут
+    свободного места, не накапливаясь в пуле без ограничений.
+
+    Args:
+        max_workers: Количество потоков пула
+        max_pending: Максимум задач, одновременно находящихся в пуле
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_pending: int = MAX_PENDING) -> None:
+        if max_workers <= 0 or max_pending <= 0:
+            raise ValueError("max_workers и max_pending должны быть положительными")
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._slots: Optional[asyncio.Semaphore] = None  # создается в работающем event loop
+        self._key_locks: Dict[str, asyncio.Lock] = {}
+        self._key_users: Dict[str, int] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+
+    async def run(self, key: str, func: Callable[..., T], *args: Any) -> T:
+        """
+        Выполняет ``func(*args)`` в пуле после всех ранее поставленных задач того же ключа.
+
+        Args:
+            key: Ключ упорядочивания (обычно username)
+            func: Синхронная функция
+            *args: Аргументы функции
+
+        Returns:
+            Результат ``func``; исключения пробрасываются вызывающему
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+
+        lock = self._key_locks.get(key)
+        if lock is None:
+            lock = self._key_locks[key] = asyncio.Lock()
+        self._key_users[key] = self._key_users.get(key, 0) + 1
+        started = False
+        self._waiting += 1
+        try:
+            # asyncio.Lock будит ожидающих в порядке FIFO — так сохраняется порядок сообщений
+            async with lock:
+                async with self._slots:
+                    started = True
+                    self._waiting -= 1
+                    self._in_flight += 1
+                    try:
+                        loop = asyncio.get_running_loop()
+                        return await loop.run_in_executor(self._pool, func, *args)
+                    finally:
+                        self._in_flight -= 1
+                        self._completed += 1
+        finally:
+            if not started:
+                self._waiting -= 1
+            self._key_users[key] -= 1
+            if not self._key_users[key]:
+                del self._key_users[key]
+                del self._key_locks[key]
+
+    def stats(self) -> ExecutorStats:
+        """Возвращает количество выполняемых, ожидающих и завершенных задач."""
+        return ExecutorStats(self._max_workers, self._in_flight, self._waiting, self._completed)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает пул, дожидаясь выполнения начатых задач."""
+        logger.info("Остановка пула обработки сообщений")
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,161 @@
+import codecs
+import csv
+import io
+import re
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import IO, Iterable, Iterator, List, NamedTuple, Tuple
+
+from .reports import previous_month
+from .storage import CSV_HEADER, Expense, ExpenseStorage
+
+# Константы
+CHUNK_ROWS = 1000                  # Строк, кодируемых за один шаг
+SPOOL_MAX_SIZE = 1024 * 1024       # До этого размера файл выгрузки держится в памяти
+
+EXPORT_USAGE = """📤 Выгрузка расходов:
+/export — текущий месяц
+/export prev — прошлый месяц
+/export 2025-06 — указанный месяц
+/export 2025-06-01 2025-06-15 — период (включительно)
+Добавьте xlsx, чтобы получить таблицу Excel: /export 2025-06 xlsx"""
+
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{1,2})$")
+_DAY_RE = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$")
+
+
+class ExportRequest(NamedTuple):
+    """Параметры выгрузки: период [start, end) и формат файла."""
+    start: datetime
+    end: datetime
+    fmt: str
+
+
+class ExportResult(NamedTuple):
+    """Готовый файл выгрузки."""
+    file: IO[bytes]
+    filename: str
+    rows: int
+
+
+def _month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def _parse_bound(arg: str, is_end: bool) -> datetime:
+    match = _MONTH_RE.match(arg)
+    if match:
+        year, month = (int(x) for x in match.groups())
+        if not 1 <= month <= 12:
+            raise ValueError(f"Неверный месяц: {arg}")
+        start, end = _month_bounds(year, month)
+        return end if is_end else start
+    if _DAY_RE.match(arg):
+        try:
+            day = date(*(int(x) for x in arg.split("-")))
+        except ValueError:
+            raise ValueError(f"Неверная дата: {arg}")
+        moment = datetime(day.year, day.month, day.day)
+        return moment + timedelta(days=1) if is_end else moment
+    raise ValueError(f"Неизвестный параметр: {arg}")
+
+
+def parse_export_args(args: List[str], today: date) -> ExportRequest:
+    """
+    Разбирает аргументы /export.
+
+    Raises:
+        ValueError: Если аргументы не распознаны
+    """
+    fmt = "csv"
+    bounds = []
+    for arg in (a.lower() for a in args):
+        if arg in ("csv", "xlsx"):
+            fmt = arg
+        elif arg in ("prev", "прошлый"):
+            bounds.append("%04d-%02d" % previous_month(today.year, today.month))
+        else:
+            bounds.append(arg)
+    if not bounds:
+        start, end = _month_bounds(today.year, today.month)
+    elif len(bounds) <= 2:
+        start, end = _parse_bound(bounds[0], False), _parse_bound(bounds[-1], True)
+    else:
+        raise ValueError("Слишком много параметров")
+    if start >= end:
+        raise ValueError("Начало периода должно быть раньше конца")
+    return ExportRequest(start, end, fmt)
+
+
+def iter_csv_chunks(expenses: Iterable[Expense], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Кодирует расходы в CSV порциями по ``chunk_rows`` строк (первая порция — с заголовком)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    rows = 0
+    for e in expenses:
+        writer.writerow([e.datetime.strftime("%Y-%m-%d %H:%M:%S"), e.amount, e.category, e.comment, e.username])
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _Counter:
+    """Пропускает расходы, подсчитывая их количество."""
+
+    def __init__(self, expenses: Iterable[Expense]) -> None:
+        self._expenses = expenses
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Expense]:
+        for e in self._expenses:
+            self.count += 1
+            yield e
+
+
+def _write_xlsx(expenses: Iterable[Expense], out: IO[bytes]) -> None:
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ValueError("Выгрузка в XLSX недоступна: не установлен пакет openpyxl")
+    # write_only не держит все строки в памяти
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Расходы")
+    sheet.append(CSV_HEADER)
+    for e in expenses:
+        sheet.append([e.datetime, float(e.amount), e.category, e.comment, e.username])
+    workbook.save(out)
+
+
+def build_export(storage: ExpenseStorage, username: str, request: ExportRequest) -> ExportResult:
+    """
+    Выгружает расходы пользователя за период во временный файл.
+
+    Строки читаются из хранилища потоком и кодируются порциями; небольшие
+    выгрузки остаются в памяти, большие сбрасываются на диск.
+
+    Raises:
+        ValueError: Если формат недоступен
+    """
+    expenses = _Counter(storage.iter_expenses(username=username, start=request.start, end=request.end))
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        if request.fmt == "xlsx":
+            _write_xlsx(expenses, out)
+        else:
+            out.write(codecs.BOM_UTF8)  # BOM, чтобы Excel распознал UTF-8
+            for chunk in iter_csv_chunks(expenses):
+                out.write(chunk)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    last_day = (request.end - timedelta(microseconds=1)).date()
+    filename = f"expenses_{username}_{request.start.date()}_{last_day}.{request.fmt}"
+    return ExportResult(out, filename, expenses.count)
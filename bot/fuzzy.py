@@ -0,0 +1,329 @@
+import logging
+import math
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from config.settings import FUZZY_AUTO_SIMILARITY
+
+from .matcher import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Константы
+MIN_SIMILARITY = 0.45      # Ниже этого сходства (коэффициент Дайса по триграммам) кандидат не предлагается
+AUTO_SIMILARITY = FUZZY_AUTO_SIMILARITY  # От этого сходства категория назначается без вопроса
+MAX_SUGGESTIONS = 3        # Сколько категорий предлагать короткой клавиатурой
+MIN_TOKEN_LENGTH = 4       # Отдельные слова комментария короче этого не ищутся
+MAX_LOADED_USERS = 1000    # Сколько пользовательских индексов держать в памяти
+MAX_POSTINGS = 1000        # Сколько позиций списков триграмм подсчитывать за один поиск
+MAX_CANDIDATES = 64        # Сколько кандидатов с наибольшим пересечением проверять
+
+
+class Suggestion(NamedTuple):
+    """Вероятная категория для комментария."""
+    category: str
+    similarity: float
+    # Известный комментарий, на который похож искомый
+    known: str
+
+
+def normalize(text: str) -> str:
+    """Приводит комментарий к виду, в котором он индексируется."""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Символьные триграммы строки, дополненной пробелами по краям."""
+    padded = f" {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """
+    Инвертированный индекс по символьным триграммам: «комментарий -> категория».
+
+    Поиск не перебирает все комментарии: пересечения с запросом считаются
+    по спискам комментариев только для триграмм запроса (подсчет выполняется
+    ``Counter`` на C), а сходство вычисляется из размера пересечения и числа
+    триграмм комментария без сравнения множеств. Работа поиска ограничена:
+    списки подсчитываются от самых коротких, пока не наберется ``MAX_POSTINGS``
+    позиций, а остальные (частые) триграммы только проверяются вхождением
+    в ``MAX_CANDIDATES`` лучших кандидатов.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._comments: List[str] = []
+        self._sizes: List[int] = []
+        self._categories: List[str] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._comments)
+
+    def add(self, comment: str, category: str) -> None:
+        """Добавляет комментарий или заменяет его категорию (побеждает последняя)."""
+        comment = normalize(comment)
+        if not comment:
+            return
+        with self._lock:
+            known = self._ids.get(comment)
+            if known is not None:
+                self._categories[known] = category
+                return
+            known = self._ids[comment] = len(self._comments)
+            grams = trigrams(comment)
+            self._comments.append(comment)
+            self._sizes.append(len(grams))
+            self._categories.append(category)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(known)
+
+    def search(self, text: str, min_similarity: float = MIN_SIMILARITY) -> Dict[str, Suggestion]:
+        """
+        Ищет комментарии, похожие на ``text``.
+
+        Returns:
+            Dict[str, Suggestion]: Лучшее совпадение для каждой найденной категории
+        """
+        query = trigrams(normalize(text))
+        # Минимальное пересечение, при котором сходство Дайса может достичь min_similarity
+        need = max(1, math.ceil(min_similarity * len(query) / (2 - min_similarity)))
+        overlaps: Counter = Counter()
+        # Частые триграммы: не подсчитываются, а проверяются у отобранных кандидатов
+        checked: List[str] = []
+        best: Dict[str, Suggestion] = {}
+        with self._lock:
+            budget = MAX_POSTINGS
+            for gram in sorted(query, key=lambda g: len(self._postings.get(g, ()))):
+                postings = self._postings.get(gram)
+                if not postings:
+                    continue
+                if len(postings) <= budget:
+                    overlaps.update(postings)
+                    budget -= len(postings)
+                elif not overlaps:
+                    # Даже самая редкая триграмма встречается слишком часто: берем последние комментарии
+                    overlaps.update(postings[-budget:])
+                    budget = 0
+                else:
+                    checked.append(gram)
+            for known, overlap in overlaps.most_common(MAX_CANDIDATES):
+                if overlap + len(checked) < need:
+                    break
+                comment = self._comments[known]
+                if checked:
+                    padded = f" {comment} "
+                    overlap += sum(1 for gram in checked if gram in padded)
+                similarity = 2 * overlap / (len(query) + self._sizes[known])
+                category = self._categories[known]
+                if similarity >= min_similarity and similarity > best.get(category, (None, 0.0))[1]:
+                    best[category] = Suggestion(category, similarity, comment)
+        return best
+
+
+class FuzzyStats(NamedTuple):
+    """Состояние нечеткого поиска категорий."""
+    loaded_users: int
+    comments: int
+    loads: int
+    # Индексы, которые сейчас строятся в фоне
+    building: int
+
+
+class FuzzyCategoryIndex:
+    """
+    Подсказки категорий для комментариев, которые не нашлись в словарях.
+
+    Для каждого пользователя строится триграммный индекс по его уже
+    распознанным комментариям и ключам его словаря, плюс общий индекс по
+    базовому словарю. Индексы строятся в фоновом потоке: базовый — при прогреве
+    (``warm``) или после смены словаря, пользовательский — при первом промахе
+    (``load_user``). Пока нужный индекс не готов, ``suggest`` ничего не предлагает,
+    а не читает историю в обработчике сообщения. Готовый индекс дополняется при
+    каждом сохранении расхода и новом соответствии (в том числе во время
+    построения). В памяти держатся индексы недавно активных пользователей (LRU):
+    выгруженный индекс при следующем промахе строится заново из хранилища,
+    так что пропущенные за это время обновления не теряются.
+
+    Args:
+        base_map: Базовый словарь «ключ -> категория»
+        load_user: Функция, возвращающая пары (комментарий, категория) пользователя
+        max_loaded: Максимум пользовательских индексов в памяти
+    """
+
+    def __init__(
+        self,
+        base_map: Mapping[str, str],
+        load_user: Callable[[str], Iterable[Tuple[str, str]]],
+        max_loaded: int = MAX_LOADED_USERS,
+    ) -> None:
+        if max_loaded <= 0:
+            raise ValueError("max_loaded должен быть положительным")
+        self._base_map = base_map
+        self._base: Optional[TrigramIndex] = None
+        self._base_building = False
+        self._load_user = load_user
+        self._max_loaded = max_loaded
+        self._users: "OrderedDict[str, TrigramIndex]" = OrderedDict()
+        # Пользователи, чей индекс строится: соответствия, пришедшие во время построения
+        self._building: Dict[str, List[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fuzzy-index")
+
+    def _build_base(self) -> None:
+        base_map = self._base_map
+        base: Optional[TrigramIndex] = None
+        try:
+            base = TrigramIndex()
+            for key, category in base_map.items():
+                base.add(key, category)
+        finally:
+            with self._lock:
+                self._base_building = False
+                if self._base_map is not base_map:
+                    # Словарь сменился во время построения: строим заново
+                    self._schedule_base()
+                elif base is not None:
+                    self._base = base
+
+    def _schedule_base(self) -> None:
+        # Вызывается под self._lock
+        if not self._base_building:
+            self._base_building = True
+            self._executor.submit(self._run, "базового словаря", self._build_base)
+
+    def warm(self) -> None:
+        """Строит индекс базового словаря (этап прогрева)."""
+        with self._lock:
+            if self._base is not None or self._base_building:
+                return
+            self._base_building = True
+        self._build_base()
+
+    def _base_index(self) -> Optional[TrigramIndex]:
+        with self._lock:
+            if self._base is None:
+                self._schedule_base()
+            return self._base
+
+    def set_base(self, base_map: Mapping[str, str]) -> None:
+        """
+        Заменяет базовый словарь (подходит как подписчик ``on_base_map_changed``).
+
+        Индекс перестраивается в фоне, до готовности поиск идет по прежнему.
+        """
+        with self._lock:
+            self._base_map = base_map
+            self._schedule_base()
+
+    def _build_user(self, username: str) -> None:
+        with self._lock:
+            updates = self._building.get(username)
+        if updates is None:
+            return
+        index = TrigramIndex()
+        try:
+            for comment, category in self._load_user(username):
+                index.add(comment, category)
+        except Exception:
+            with self._lock:
+                if self._building.get(username) is updates:
+                    del self._building[username]
+            raise
+        with self._lock:
+            if self._building.get(username) is not updates:
+                # Индекс выгрузили во время построения: он может быть устаревшим
+                return
+            del self._building[username]
+            # Повторное добавление безопасно: категория комментария просто заменяется
+            for comment, category in updates:
+                index.add(comment, category)
+            self._loads += 1
+            self._users[username] = index
+            while len(self._users) > self._max_loaded:
+                self._users.popitem(last=False)
+        logger.debug("Построен индекс подсказок для %s: %s комментариев", username, len(index))
+
+    def _run(self, name: str, build: Callable[[], None]) -> None:
+        try:
+            build()
+        except Exception as e:
+            logger.exception("Не удалось построить индекс подсказок %s: %s", name, e)
+
+    def _user_index(self, username: str) -> Optional[TrigramIndex]:
+        """Возвращает индекс пользователя или ставит его построение в очередь и возвращает None."""
+        with self._lock:
+            index = self._users.get(username)
+            if index is not None:
+                self._users.move_to_end(username)
+                return index
+            if username not in self._building:
+                self._building[username] = []
+                self._executor.submit(self._run, username, lambda: self._build_user(username))
+        return None
+
+    def wait_built(self, timeout: Optional[float] = None) -> None:
+        """Ждет завершения построений, поставленных в очередь до вызова."""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def drop_user(self, username: str) -> None:
+        """Выгружает индекс пользователя (подходит как подписчик ``on_user_unloaded``)."""
+        with self._lock:
+            self._users.pop(username, None)
+            self._building.pop(username, None)
+
+    def add(self, username: str, comment: str, category: str) -> None:
+        """Учитывает соответствие (подходит как подписчик ``on_mapping_added``)."""
+        with self._lock:
+            updates = self._building.get(username)
+            if updates is not None:
+                updates.append((comment, category))
+                return
+            index = self._users.get(username)
+        if index is not None:
+            index.add(comment, category)
+
+    def add_expenses(self, expenses) -> None:
+        """Учитывает сохраненные расходы (подходит как подписчик ``on_expenses_saved``)."""
+        for e in expenses:
+            self.add(e.username, e.comment, e.category)
+
+    def suggest(self, comment: str, username: str, limit: int = MAX_SUGGESTIONS) -> List[Suggestion]:
+        """
+        Возвращает до ``limit`` вероятных категорий, от самой похожей.
+
+        Ищется весь комментарий и каждое его слово длиной от ``MIN_TOKEN_LENGTH``,
+        так что «вкусвил молоко» находит известный «вкусвилл». Пока индекс
+        пользователя или базового словаря строится, подсказок нет.
+        """
+        indexes = (self._user_index(username), self._base_index())
+        if None in indexes:
+            return []
+        queries = dict.fromkeys([normalize(comment)] + [word for word in tokenize(comment) if len(word) >= MIN_TOKEN_LENGTH])
+        best: Dict[str, Suggestion] = {}
+        for index in indexes:
+            for query in queries:
+                for category, found in index.search(query).items():
+                    if found.similarity > best.get(category, (None, 0.0))[1]:
+                        best[category] = found
+        return sorted(best.values(), key=lambda s: -s.similarity)[:limit]
+
+    def auto_category(self, suggestions: List[Suggestion], threshold: float = AUTO_SIMILARITY) -> Optional[str]:
+        """Возвращает категорию, если лучшая подсказка уверенная и у нее нет уверенного конкурента."""
+        if not suggestions or suggestions[0].similarity < threshold:
+            return None
+        if len(suggestions) > 1 and suggestions[1].similarity >= threshold:
+            return None
+        return suggestions[0].category
+
+    def stats(self) -> FuzzyStats:
+        with self._lock:
+            users = list(self._users.values())
+            loads = self._loads
+            building = len(self._building)
+        return FuzzyStats(len(users), sum(len(index) for index in users), loads, building)
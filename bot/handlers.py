@@ -1,97 +1,144 @@
-import csv
 import logging
-from .spreadsheet import save_to_google_sheets
+import sqlite3
+from .spreadsheet import save_many_to_google_sheets
 from datetime import datetime
 from decimal import Decimal
-from pathlib import Path
-from typing import NamedTuple, Optional
-from .parser import parse_message
-from .categories import add_category_mapping
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from .parser import parse_batch, parse_message
+from .categories import (
+    add_category_mapping, get_base_map, get_user_category_map, on_base_map_changed, on_mapping_added, on_user_unloaded,
 )
+from .fuzzy import FuzzyCategoryIndex, Suggestion
+from .storage import Expense, get_storage, with_ids
+from .rollups import rollups
+from .analytics import analytics_cache
+from .budgets import BudgetAlert, budgets
+from .logging_setup import SAMPLED
+from .metrics import metrics, timed
+
 logger = logging.getLogger(__name__)
 
+# Подписчики на сохраненные расходы: callback(expenses) — список расходов одной записи
+_expense_listeners: List[Callable[[List[Expense]], None]] = []
+
+def on_expenses_saved(listener: Callable[[List[Expense]], None]) -> None:
+    """Регистрирует функцию, которая вызывается после каждой записи расходов."""
+    _expense_listeners.append(listener)
+
+# Агрегаты для отчетов и колоночный кэш аналитики обновляются при записи
+on_expenses_saved(rollups.add_many)
+on_expenses_saved(analytics_cache.append)
+
+def _known_comments(username: str) -> Iterator[Tuple[str, str]]:
+    """Комментарии пользователя с категориями: история расходов, затем его словарь (он важнее)."""
+    for e in get_storage().iter_expenses(username=username):
+        yield e.comment, e.category
+    yield from get_user_category_map(username).items()
+
+# Подсказки категорий по похожим комментариям, если словари не помогли
+fuzzy_index = FuzzyCategoryIndex(get_base_map(), _known_comments)
+on_base_map_changed(fuzzy_index.set_base)
+on_user_unloaded(fuzzy_index.drop_user)
+on_expenses_saved(fuzzy_index.add_expenses)
+on_mapping_added(fuzzy_index.add)
+
 class ProcessResult(NamedTuple):
     """Результат обработки сообщения."""
     amount: Optional[Decimal]
     category: Optional[str]
     error_message: Optional[str]
+    # Вероятные категории, если категория не определена
+    suggestions: Tuple[str, ...] = ()
+    # Предупреждения о бюджетах после записи
+    alerts: Tuple[BudgetAlert, ...] = ()
 
-def ensure_data_directory() -> Path:
+class BatchResult(NamedTuple):
+    """Результат обработки многострочного сообщения."""
+    saved: List[Expense]
+    # Комментарии без категории, сгруппированные: (комментарий, [суммы])
+    unknown: List[Tuple[str, List[Decimal]]]
+    # Строки, которые не удалось разобрать
+    invalid: List[str]
+    # Предупреждения о бюджетах после записи
+    alerts: Tuple[BudgetAlert, ...] = ()
+
+def save_expense(amount: Decimal, category: str, comment: str, username: str) -> List[BudgetAlert]:
     """
-    Создает директорию data и файл expenses.csv если они не существуют.
+    Сохраняет расход в хранилище (SQLite или CSV, см. STORAGE_BACKEND).
     
+    Args:
+        amount: Сумма расхода
+        category: Категория расхода
+        comment: Комментарий к расходу
+        username: Имя пользователя
+        
     Returns:
-        Path: Путь к файлу expenses.csv
+        List[BudgetAlert]: Пройденные пороги бюджетов
         
     Raises:
-        OSError: Если не удалось создать директорию или файл
+        ValueError: Если входные данные невалидны
+        OSError, sqlite3.Error: Если не удалось сохранить данные
     """
-    try:
-        data_dir = Path('data')
-        if not data_dir.exists():
-            data_dir.mkdir()
-            logger.info(f"Created directory: {data_dir}")
-            
-        csv_path = data_dir / 'expenses.csv'
-        if not csv_path.exists():
-            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['datetime', 'amount', 'category', 'comment', 'username'])
-            logger.info(f"Created file: {csv_path}")
-            
-        return csv_path
-    except OSError as e:
-        logger.error(f"Failed to create data directory or file: {e}")
-        raise
+    return save_expenses([Expense(datetime.now(), amount, category, comment, username)])
 
-def save_expense(amount: Decimal, category: str, comment: str, username: str) -> None:
+def save_expenses(expenses: List[Expense]) -> List[BudgetAlert]:
     """
-    Сохраняет расход в CSV файл.
+    Сохраняет несколько расходов одной записью в хранилище.
     
     Args:
-        amount: Сумма расхода
-        category: Категория расхода
-        comment: Комментарий к расходу
-        username: Имя пользователя
+        expenses: Расходы для сохранения
+        
+    Returns:
+        List[BudgetAlert]: Пройденные пороги бюджетов (проверяются по агрегатам, без чтения истории)
         
     Raises:
-        ValueError: Если входные данные невалидны
-        OSError: Если не удалось сохранить данные
+        ValueError: Если входные данные невалидны (в этом случае не сохраняется ничего)
+        OSError, sqlite3.Error: Если не удалось сохранить данные
     """
     # Валидация входных данных
-    if not isinstance(amount, Decimal) or amount <= 0:
-        raise ValueError("Amount must be a positive Decimal")
-    if not category or not isinstance(category, str):
-        raise ValueError("Category must be a non-empty string")
-    if not comment or not isinstance(comment, str):
-        raise ValueError("Comment must be a non-empty string")
-    if not username or not isinstance(username, str):
-        raise ValueError("Username must be a non-empty string")
-        
+    for expense in expenses:
+        if not isinstance(expense.amount, Decimal) or expense.amount <= 0:
+            raise ValueError("Amount must be a positive Decimal")
+        if not expense.category or not isinstance(expense.category, str):
+            raise ValueError("Category must be a non-empty string")
+        if not expense.comment or not isinstance(expense.comment, str):
+            raise ValueError("Comment must be a non-empty string")
+        if not expense.username or not isinstance(expense.username, str):
+            raise ValueError("Username must be a non-empty string")
+    if not expenses:
+        return []
+    # Идентификатор присваивается один раз, до записи: его получают хранилище, подписчики и Sheets
+    expenses = with_ids(expenses)
+
     try:
-        csv_path = ensure_data_directory()
-        with open(csv_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([datetime.now(), amount, category, comment, username])
-        logger.info(f"Saved expense: {amount} {category} for {username}")
-
-        # Пробуем дублировать в Google Таблицу
-        try:
-            save_to_google_sheets(amount, category, comment, username)
-            logger.info(f"Also saved to Google Sheets: {amount} {category} for {username}")
-        except Exception as e:
-            logger.warning(f"Could not save to Google Sheets: {e}")
-    except OSError as e:
-        logger.error(f"Failed to save expense: {e}")
+        with timed("save_storage"):
+            get_storage().add_many(expenses)
+        metrics.inc("bot_expenses_saved_total", len(expenses))
+        for e in expenses:
+            logger.debug("Saved expense: %s %s for %s", e.amount, e.category, e.username)
+        with timed("save_listeners"):
+            for listener in _expense_listeners:
+                try:
+                    listener(expenses)
+                except Exception as e:
+                    logger.exception("Expense listener %r failed: %s", listener, e)
+
+        # Ставим в очередь на дублирование в Google Таблицу (отправит фоновый поток)
+        with timed("save_sheets_enqueue"):
+            try:
+                save_many_to_google_sheets(expenses)
+                logger.debug("Queued for Google Sheets: %s rows", len(expenses))
+            except Exception as exc:
+                logger.warning("Could not save to Google Sheets: %s", exc)
+
+        # Агрегаты уже учли записанные расходы (подписчик rollups.add_many);
+        # пока они пересчитываются после старта, пороги бюджетов не проверяются
+        if not rollups.ready:
+            return []
+        with timed("save_budget_check"):
+            return budgets.check(expenses, rollups)
+    except (OSError, sqlite3.Error) as e:
+        logger.error("Failed to save expenses: %s", e)
         raise
 
 def process_message(text: str, username: str) -> ProcessResult:
@@ -117,18 +164,75 @@ def process_message(text: str, username: str) -> ProcessResult:
             
         amount, comment, category = parse_message(text, username)
         if not amount or not comment:
+            metrics.inc("bot_parse_failed_total")
             return ProcessResult(None, None, "Не удалось распознать сообщение. Введите сумму и комментарий, например: 200 кофе.")
 
+        if not category:
+            suggestions = suggest_categories(comment, username)
+            category = fuzzy_index.auto_category(suggestions)
+            if category:
+                metrics.inc("bot_fuzzy_auto_total")
         if category:
             # Если категория найдена, сохраняем расход
-            save_expense(amount, category, comment, username)
-            logger.info(f"Successfully processed expense: {amount} {category} for {username}")
-            return ProcessResult(amount, category, None)
+            alerts = save_expense(amount, category, comment, username)
+            logger.info("Successfully processed expense: %s %s for %s", amount, category, username, extra=SAMPLED)
+            return ProcessResult(amount, category, None, alerts=tuple(alerts))
         else:
             # Если категория не найдена, возвращаем сумму и комментарий для выбора категории
-            logger.info(f"Category not found for comment: {comment}, amount: {amount}")
-            return ProcessResult(amount, None, comment)
+            metrics.inc("bot_unknown_category_total")
+            logger.debug("Category not found for comment: %s, amount: %s", comment, amount)
+            return ProcessResult(amount, None, comment, tuple(s.category for s in suggestions))
             
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
-        return ProcessResult(None, None, f"Произошла ошибка при обработке сообщения: {str(e)}")
\ No newline at end of file
+        logger.error("Error processing message: %s", e)
+        return ProcessResult(None, None, f"Произошла ошибка при обработке сообщения: {str(e)}")
+
+def suggest_categories(comment: str, username: str) -> List[Suggestion]:
+    """Возвращает вероятные категории для комментария по похожим известным комментариям."""
+    with timed("parse_fuzzy"):
+        return fuzzy_index.suggest(comment, username)
+
+def is_batch_message(text: str) -> bool:
+    """Проверяет, содержит ли сообщение несколько непустых строк."""
+    return sum(1 for line in text.splitlines() if line.strip()) > 1
+
+def process_batch(text: str, username: str) -> BatchResult:
+    """
+    Обрабатывает многострочное сообщение: по расходу на строку.
+    
+    Все распознанные строки с известной категорией сохраняются одной записью.
+    Строки без категории группируются по комментарию, чтобы пользователь выбрал
+    категорию для каждого комментария один раз.
+    
+    Args:
+        text: Текст сообщения, строки в формате "сумма комментарий"
+        username: Имя пользователя
+        
+    Raises:
+        OSError, sqlite3.Error: Если не удалось сохранить данные
+    """
+    now = datetime.now()
+    saved: List[Expense] = []
+    unknown: Dict[str, List[Decimal]] = {}
+    invalid: List[str] = []
+    with timed("parse_batch"):
+        parsed = parse_batch(text.splitlines(), username)
+    for line in parsed:
+        if line.amount is None:
+            invalid.append(line.text)
+        elif line.category:
+            saved.append(Expense(now, line.amount, line.category, line.comment, username))
+        else:
+            unknown.setdefault(line.comment, []).append(line.amount)
+    for comment in list(unknown):
+        category = fuzzy_index.auto_category(suggest_categories(comment, username))
+        if category:
+            metrics.inc("bot_fuzzy_auto_total")
+            saved += [Expense(now, amount, category, comment, username) for amount in unknown.pop(comment)]
+    alerts = save_expenses(saved)
+    if unknown:
+        metrics.inc("bot_unknown_category_total")
+    if invalid:
+        metrics.inc("bot_parse_failed_total")
+    logger.info("Processed batch for %s: saved=%s, unknown=%s, invalid=%s", username, len(saved), len(unknown), len(invalid), extra=SAMPLED)
+    return BatchResult(saved, list(unknown.items()), invalid, tuple(alerts))
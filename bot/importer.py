@@ -0,0 +1,233 @@
+"""
+Массовый импорт расходов из файла.
+
+Использует тот же пакетный разбор, что и многострочные сообщения бота.
+Поддерживаются текстовые файлы (по расходу "сумма комментарий" на строку)
+и CSV-выписки с колонками суммы, описания и, при наличии, даты.
+
+Импорт пишет только в хранилище (с идентификаторами расходов) и не трогает
+файлы, которые держит открытыми работающий бот: очередь Google Sheets и
+колоночный кэш аналитики. Агрегаты, аналитику и подсказки бот пересчитает
+из хранилища при следующем запуске, а в Google Таблицу импортированные
+строки дописывает сверка (``python -m bot.reconcile --since <дата>``).
+
+    python -m bot.importer statement.csv --user marina_tikh
+"""
+import argparse
+import csv
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .categories import valid_categories
+from .logging_setup import setup_logging
+from .parser import lemma_cache, parse_batch, prefetch_lemmas
+from .storage import Expense, close_storage, get_storage, with_ids
+
+logger = logging.getLogger(__name__)
+
+# Константы
+LEMMA_CHUNK_SIZE = 2000   # Слов в одной задаче для процесса-лемматизатора
+SAVE_BATCH_SIZE = 1000    # Расходов в одной записи в хранилище
+
+AMOUNT_COLUMNS = ("amount", "сумма", "сумма операции", "sum")
+COMMENT_COLUMNS = ("comment", "description", "описание", "назначение платежа", "комментарий", "category", "категория")
+DATE_COLUMNS = ("datetime", "date", "дата", "дата операции")
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y")
+
+
+class StatementLine(NamedTuple):
+    """Строка выписки в виде текста "сумма комментарий" и дата операции."""
+    text: str
+    when: Optional[datetime]
+
+
+class ImportReport(NamedTuple):
+    """Итог импорта."""
+    imported: int
+    unknown: int
+    invalid: int
+
+
+_morph = None
+
+
+def _init_worker() -> None:
+    global _morph
+    from pymorphy3 import MorphAnalyzer
+    _morph = MorphAnalyzer()
+
+
+def _lemmatize_chunk(words: List[str]) -> Dict[str, str]:
+    lemmas = {}
+    for word in words:
+        try:
+            lemmas[word] = _morph.parse(word)[0].normal_form
+        except (IndexError, AttributeError):
+            continue
+    return lemmas
+
+
+def parallel_prefetch(workers: int):
+    """
+    Возвращает функцию предварительной лемматизации для ``parse_batch``,
+    которая разбирает слова, которых еще нет в общем кэше лемм, в пуле процессов
+    и кладет леммы в этот кэш.
+    """
+    def prefetch(words: Iterable[str]) -> None:
+        unique = sorted(lemma_cache.missing(words))
+        if not unique:
+            return
+        chunks = [unique[i:i + LEMMA_CHUNK_SIZE] for i in range(0, len(unique), LEMMA_CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for lemmas in pool.map(_lemmatize_chunk, chunks):
+                lemma_cache.update(lemmas)
+        logger.info("Лемматизировано уникальных слов: %s в %s процессах", len(unique), workers)
+    return prefetch
+
+
+def _find_column(header: List[str], names: Iterable[str]) -> Optional[int]:
+    normalized = [h.strip().lower() for h in header]
+    for name in names:
+        if name in normalized:
+            return normalized.index(name)
+    return None
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def read_statement(path: Path, negative_only: bool = False) -> List[StatementLine]:
+    """
+    Читает файл выписки.
+
+    Файлы .csv разбираются по колонкам суммы, описания и даты (разделитель
+    определяется автоматически), остальные файлы — как строки "сумма комментарий".
+
+    Args:
+        path: Путь к файлу
+        negative_only: Импортировать только отрицательные суммы (списания в
+            банковской выписке), меняя их знак
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() != ".csv":
+            return [StatementLine(line, None) for line in f]
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        rows = csv.reader(f, dialect)
+        header = next(rows, [])
+        amount_col = _find_column(header, AMOUNT_COLUMNS)
+        comment_col = _find_column(header, COMMENT_COLUMNS)
+        date_col = _find_column(header, DATE_COLUMNS)
+        if amount_col is None or comment_col is None:
+            raise ValueError(f"В {path} не найдены колонки суммы и описания: {header}")
+
+        lines = []
+        for row in rows:
+            if len(row) <= max(amount_col, comment_col):
+                continue
+            raw_amount = row[amount_col].replace(" ", "").replace("\xa0", "").replace(",", ".")
+            try:
+                amount = Decimal(raw_amount)
+            except InvalidOperation:
+                lines.append(StatementLine(" ".join(row), None))  # попадет в нераспознанные
+                continue
+            if negative_only:
+                if amount >= 0:
+                    continue
+                amount = -amount
+            when = _parse_date(row[date_col]) if date_col is not None and len(row) > date_col else None
+            lines.append(StatementLine(f"{amount} {row[comment_col]}", when))
+        return lines
+
+
+def import_statement(
+    path: Path,
+    username: str,
+    workers: int = 1,
+    unknown_category: Optional[str] = None,
+    negative_only: bool = False,
+    dry_run: bool = False,
+) -> ImportReport:
+    """
+    Импортирует выписку пользователя.
+
+    Args:
+        path: Путь к файлу выписки
+        username: Пользователь, которому принадлежат расходы
+        workers: Количество процессов для лемматизации (1 — без пула процессов)
+        unknown_category: Категория для строк, которые не удалось распознать по словарю;
+            если не задана, такие строки пропускаются
+        negative_only: Импортировать только списания (отрицательные суммы)
+        dry_run: Только разобрать, ничего не сохраняя
+
+    Raises:
+        ValueError: Если файл не удалось разобрать или категория неизвестна
+    """
+    if unknown_category is not None and unknown_category not in valid_categories():
+        raise ValueError(f"Неизвестная категория: {unknown_category}")
+    statement = read_statement(path, negative_only)
+    prefetch = parallel_prefetch(workers) if workers > 1 else prefetch_lemmas
+    parsed = parse_batch((line.text for line in statement), username, prefetch)
+
+    # parse_batch пропускает пустые строки — сопоставляем результаты с непустыми строками выписки
+    dated = [line for line in statement if line.text.strip()]
+    now = datetime.now()
+    expenses: List[Expense] = []
+    unknown = invalid = 0
+    for source, line in zip(dated, parsed):
+        if line.amount is None:
+            invalid += 1
+            logger.warning("Строка не распознана: %s", line.text)
+            continue
+        category = line.category or unknown_category
+        if category is None:
+            unknown += 1
+            continue
+        expenses.append(Expense(source.when or now, line.amount, category, line.comment, username))
+
+    if not dry_run:
+        storage = get_storage()
+        for i in range(0, len(expenses), SAVE_BATCH_SIZE):
+            storage.add_many(with_ids(expenses[i:i + SAVE_BATCH_SIZE]))
+    return ImportReport(len(expenses), unknown, invalid)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import of expenses from a text file or bank statement CSV")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--user", required=True, help="username the expenses belong to")
+    parser.add_argument("--workers", type=int, default=1, help="processes for lemmatization")
+    parser.add_argument("--unknown-category", help="category for lines with no dictionary match")
+    parser.add_argument("--negative-only", action="store_true", help="import only negative amounts (bank debits)")
+    parser.add_argument("--dry-run", action="store_true", help="parse without saving")
+    args = parser.parse_args()
+
+    setup_logging(log_file=None)
+    # Кэш лемм общий с ботом: импорт начинает с прогретого кэша и оставляет в нем новые слова
+    lemma_cache.load()
+    try:
+        report = import_statement(args.path, args.user, args.workers, args.unknown_category,
+                                  args.negative_only, args.dry_run)
+    finally:
+        close_storage()
+        lemma_cache.save()
+    print(f"imported: {report.imported}, unknown category: {report.unknown}, invalid: {report.invalid}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Единая настройка логирования бота.
+
+Обработчики модулей только создают записи: ``QueueHandler`` кладет их в
+очередь, а запись в файл и консоль выполняет фоновый ``QueueListener``,
+поэтому файловый ввод-вывод не добавляется к обработке сообщения.
+
+Параметры берутся из окружения:
+    LOG_LEVEL        — уровень (INFO)
+    LOG_FILE         — файл лога (bot.log); пустое значение — без файла
+    LOG_ROTATION     — size (по размеру), time (по суткам) или none
+    LOG_MAX_BYTES    — размер файла для ротации по размеру (10 МБ)
+    LOG_BACKUP_COUNT — сколько старых файлов хранить (5)
+    LOG_JSON         — 1, чтобы писать записи в JSON по одной на строку
+    LOG_SAMPLE_EVERY — пропускать каждую N-ю запись горячего пути (1 — все)
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+from typing import Optional
+
+# Константы
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1"))
+
+# Отметка записей горячего пути (по записи на сообщение), которые можно прореживать:
+#     logger.info("Сообщение обработано за %.1f мс", ms, extra=SAMPLED)
+SAMPLED = {"sampled": True}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как JSON-объект в одну строку."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает каждую ``every``-ю запись, отмеченную ``extra=SAMPLED``.
+    Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, every: int) -> None:
+        super().__init__()
+        self._every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        return next(self._counter) % self._every == 0
+
+
+def _file_handler(path: str, rotation: str) -> logging.Handler:
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when="midnight", backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    if rotation == "none":
+        return logging.FileHandler(path, encoding="utf-8")
+    raise ValueError(f"LOG_ROTATION должен быть size, time или none, получено: {rotation}")
+
+
+def setup_logging(
+    log_file: Optional[str] = LOG_FILE,
+    level: str = LOG_LEVEL,
+    rotation: str = LOG_ROTATION,
+    json_format: bool = LOG_JSON,
+    sample_every: int = LOG_SAMPLE_EVERY,
+    records: Optional[queue.Queue] = None,
+) -> None:
+    """
+    Настраивает корневой логгер: очередь в памяти и фоновый поток, пишущий в консоль и файл.
+    Повторный вызов заменяет предыдущую настройку.
+
+    Args:
+        log_file: Путь к файлу лога или None, чтобы писать только в консоль
+        level: Минимальный уровень записей
+        rotation: Ротация файла: size, time или none
+        json_format: Писать записи в JSON
+        sample_every: Пропускать каждую N-ю запись горячего пути
+        records: Очередь записей (например, ``multiprocessing.Queue``, в которую
+            пишут и другие процессы, см. forward_logging); по умолчанию — новая очередь в памяти
+
+    Raises:
+        ValueError: Если указан неизвестный вид ротации
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(_file_handler(log_file, rotation))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if records is None:
+        records = queue.SimpleQueue()
+    _install_queue_handler(records, level, sample_every)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def forward_logging(records: queue.Queue, level: str = LOG_LEVEL, sample_every: int = LOG_SAMPLE_EVERY) -> None:
+    """
+    Настраивает корневой логгер дочернего процесса: записи отправляются в очередь
+    ``records``, которую разбирает слушатель основного процесса (см. setup_logging).
+    Так файл лога пишет один процесс и его ротация не ломается.
+    """
+    stop_logging()
+    _install_queue_handler(records, level, sample_every)
+
+
+def _install_queue_handler(records: queue.Queue, level: str, sample_every: int) -> None:
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_every))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Библиотека HTTP-клиента логирует каждый запрос к Bot API на уровне INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и закрывает файлы."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(stop_logging)
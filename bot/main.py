@@ -1,25 +1,139 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
 import csv
 import os
 import logging
 from datetime import datetime
+from decimal import Decimal
+from typing import List, NamedTuple, Optional, Tuple
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
-from .handlers import process_message, save_expense
-from .categories import add_category_mapping, get_combined_category_map
-from config.settings import BOT_TOKEN
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from .handlers import fuzzy_index, is_batch_message, process_batch, process_message, save_expenses, suggest_categories
+from .storage import Expense
+from .categories import add_category_mapping
+from .executor import OrderedExecutor
+from .pending import PENDING_PATH, PendingStore
+from .logging_setup import SAMPLED, setup_logging
+from .metrics import format_stats, metrics, start_metrics_server, timed
+from .startup import WARMUP_MODES, StartupTimer, start_background_sync, start_background_warm_up, warm_up
+from .parser import lemma_cache, category_matcher
+from .categories import store as dict_store
+from .dict_watch import DictionaryWatcher
+from .spreadsheet import get_sync_stats
+from .storage import close_storage, get_storage
+from .rollups import Rollups, rollups, user_rollups
+from .analytics import analytics_cache
+from .reports import REPORT_USAGE, build_report, format_amount
+from .budgets import BUDGET_USAGE, BudgetAlert, budgets, build_budget_report, parse_budget_args
+from .export import EXPORT_USAGE, build_export, parse_export_args
+from .reconcile import reconcile_recent
+from .digests import DIGEST_USAGE, PERIOD_TITLES, DigestScheduler, digests, parse_digest_args
+from .serving import application_builder, check_bot_mode, run
+from config.settings import (
+    PIPELINE_WORKERS, PIPELINE_MAX_PENDING, LEMMA_CACHE_PERSIST,
+    PENDING_MAX_ENTRIES, PENDING_TTL, PENDING_PERSIST, WARMUP_MODE,
+    ADMIN_USERNAMES, METRICS_HOST, METRICS_PORT, DICT_RELOAD_INTERVAL,
+    DIGEST_TIME, DIGEST_WINDOW, DIGEST_RATE, RECONCILE_INTERVAL,
 )
+
 logger = logging.getLogger(__name__)
 
-user_inputs = {}  # временное хранилище для выбора категории
+# Расходы, ожидающие выбора категории: (username, id сообщения) -> [(комментарий, [суммы]), ...]
+pending = PendingStore(PENDING_PATH if PENDING_PERSIST else None, max_entries=PENDING_MAX_ENTRIES, ttl=PENDING_TTL)
+
+MAX_SUMMARY_LINES = 30  # Сколько строк пакета перечислять в ответе
+
+# Синхронный парсинг и сохранение выполняются в пуле потоков, по очереди для каждого пользователя
+executor = OrderedExecutor(max_workers=PIPELINE_WORKERS, max_pending=PIPELINE_MAX_PENDING)
+
+# Файлы словарей категорий перечитываются на лету (см. bot.dict_watch)
+dict_watcher = DictionaryWatcher(DICT_RELOAD_INTERVAL) if DICT_RELOAD_INTERVAL > 0 else None
+
+# Сводки по расписанию строятся из агрегатов и рассылаются пачками через JobQueue (см. bot.digests)
+digest_scheduler = DigestScheduler(
+    digests, rollups, datetime.strptime(DIGEST_TIME, "%H:%M").time(), DIGEST_WINDOW * 60, DIGEST_RATE,
+)
+
+CHOICE_PREFIX = "pc"  # callback_data кнопки выбора: pc:<id сообщения>:<осталось вопросов>:<номер категории>
+MORE_PREFIX = "pm"  # callback_data кнопки «Другая категория»: pm:<id сообщения>:<осталось вопросов>
+MORE_BUTTON_TEXT = "Другая категория…"
+
+def get_category_keyboard(categories: Tuple[str, ...], prompt_id: int, remaining: int,
+                          more: bool = False) -> InlineKeyboardMarkup:
+    """
+    Возвращает клавиатуру выбора категории для вопроса о сообщении ``prompt_id``.
+
+    В callback_data передаются id сообщения, число оставшихся вопросов и номер
+    кнопки, а не название категории: так запись находится однозначно и
+    укладывается в лимит Telegram в 64 байта. Число оставшихся вопросов
+    определяет, к какому комментарию цепочки относится клавиатура: нажатие на
+    устаревшую клавиатуру (повторное или после перехода к следующему вопросу)
+    отклоняется. С ``more=True`` добавляется кнопка, раскрывающая полный список категорий.
+    """
+    rows = [
+        [InlineKeyboardButton(cat, callback_data=f"{CHOICE_PREFIX}:{prompt_id}:{remaining}:{i}")]
+        for i, cat in enumerate(categories)
+    ]
+    if more:
+        rows.append([InlineKeyboardButton(MORE_BUTTON_TEXT, callback_data=f"{MORE_PREFIX}:{prompt_id}:{remaining}")])
+    return InlineKeyboardMarkup(rows)
+
+def category_keyboard(username: str, prompt_id: int, remaining: int,
+                      suggestions: Tuple[str, ...] = ()) -> InlineKeyboardMarkup:
+    """Короткая клавиатура из вероятных категорий или, если их нет, полный список."""
+    if suggestions:
+        return get_category_keyboard(suggestions, prompt_id, remaining, more=True)
+    return get_category_keyboard(category_matcher.categories(username), prompt_id, remaining)
+
+async def suggested_keyboard(username: str, comment: str, prompt_id: int, remaining: int) -> InlineKeyboardMarkup:
+    """Клавиатура для вопроса о ``comment``: подсказки ищутся в пуле обработки."""
+    suggestions = await executor.run(username, suggest_categories, comment, username)
+    return category_keyboard(username, prompt_id, remaining, tuple(s.category for s in suggestions))
+
+def _parse_callback(data: Optional[str], prefix: str, fields: int) -> Optional[Tuple[int, ...]]:
+    parts = (data or "").split(":")
+    if len(parts) != fields + 1 or parts[0] != prefix or not all(p.isdigit() for p in parts[1:]):
+        return None
+    return tuple(int(p) for p in parts[1:])
+
+def parse_more(data: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Разбирает callback_data кнопки «Другая категория» в (id сообщения, осталось вопросов)."""
+    return _parse_callback(data, MORE_PREFIX, 2)
+
+def parse_choice(data: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """Разбирает callback_data кнопки выбора категории в (id сообщения, осталось вопросов, номер кнопки)."""
+    return _parse_callback(data, CHOICE_PREFIX, 3)
+
+# Показатели подсистем, которые /stats и /metrics считывают в момент запроса
+metrics.gauge("bot_lemma_cache_hit_ratio", "Доля попаданий в кэш лемм", lambda: lemma_cache.stats().hit_rate)
+metrics.gauge("bot_lemma_cache_size", "Слов в кэше лемм", lambda: lemma_cache.stats().size)
+metrics.gauge("bot_user_dicts_loaded", "Загруженные словари пользователей", lambda: dict_store.stats().loaded_users)
+metrics.gauge("bot_pipeline_in_flight", "Задачи, выполняемые в пуле обработки", lambda: executor.stats().in_flight)
+metrics.gauge("bot_pipeline_waiting", "Задачи, ожидающие места в пуле обработки", lambda: executor.stats().waiting)
+metrics.gauge("bot_fuzzy_users_loaded", "Загруженные индексы подсказок категорий", lambda: fuzzy_index.stats().loaded_users)
+metrics.gauge("bot_fuzzy_users_building", "Индексы подсказок категорий, которые строятся в фоне", lambda: fuzzy_index.stats().building)
+metrics.gauge("bot_digest_queue", "Сводки, ожидающие отправки", digest_scheduler.queue_depth)
+metrics.gauge("bot_pending_choices", "Незавершенные выборы категории", lambda: pending.stats().entries)
+metrics.gauge("bot_sheets_queue_depth", "Строки, ожидающие отправки в Google Sheets", lambda: get_sync_stats().queue_depth)
+metrics.gauge("bot_sheets_last_flush_seconds", "Длительность последней отправки в Google Sheets",
+              lambda: get_sync_stats().last_flush_latency or 0.0)
+
+def with_alerts(text: str, alerts) -> str:
+    """Добавляет к ответу предупреждения о бюджетах."""
+    return "\n\n".join([text] + [alert.text for alert in alerts])
+
+async def reply_text(message, text: str, **kwargs):
+    """Отвечает на сообщение, замеряя время запроса к Telegram."""
+    with timed("telegram_reply"):
+        return await message.reply_text(text, **kwargs)
+
+async def edit_message_text(query, text: str, **kwargs):
+    """Редактирует сообщение с кнопками, замеряя время запроса к Telegram."""
+    with timed("telegram_reply"):
+        return await query.edit_message_text(text, **kwargs)
 
 HELP_MESSAGE = """🤖 Я помогу тебе вести учет расходов!
 
@@ -31,6 +145,9 @@ HELP_MESSAGE = """🤖 Я помогу тебе вести учет расход
    1500 продукты
    3000 подписка
 
+   Можно прислать несколько расходов в одном сообщении —
+   по одному на строку.
+
 2. Я автоматически определю категорию расхода.
    Если не смогу - предложу выбрать из списка.
 
@@ -42,15 +159,20 @@ HELP_MESSAGE = """🤖 Я помогу тебе вести учет расход
 • Комментарий используется для определения категории
 • Можно добавлять свои соответствия комментариев и категорий
 
+📊 /report — отчет за месяц (подробнее: /report help)
+📤 /export — выгрузка расходов в CSV или XLSX (подробнее: /export help)
+💼 /budget — месячные лимиты по категориям (подробнее: /budget help)
+📬 /digest — сводки расходов за день, неделю или месяц (подробнее: /digest help)
+
 ❓ Если формат не распознан, я подскажу правильный формат."""
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"/start от пользователя: {update.effective_user.username if update.effective_user else 'unknown'}")
-    await update.message.reply_text("Привет! Я — твой персональный финпомощник 💸\n\nИспользуй /help чтобы узнать, как я работаю!")
+    logger.info("/start от пользователя: %s", update.effective_user.username if update.effective_user else 'unknown')
+    await reply_text(update.message, "Привет! Я — твой персональный финпомощник 💸\n\nИспользуй /help чтобы узнать, как я работаю!")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"/help от пользователя: {update.effective_user.username if update.effective_user else 'unknown'}")
-    await update.message.reply_text(HELP_MESSAGE)
+    logger.info("/help от пользователя: %s", update.effective_user.username if update.effective_user else 'unknown')
+    await reply_text(update.message, HELP_MESSAGE)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем, что update.message существует
@@ -60,86 +182,405 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     username = update.effective_user.username if update.effective_user else 'unknown'
     if update.message.text:
-        logger.info(f"Новое сообщение от @{username}: {update.message.text}")
+        logger.info("Новое сообщение от @%s", username, extra=SAMPLED)
+        logger.debug("Текст сообщения от @%s: %s", username, update.message.text)
     else:
-        logger.info(f"Новое сообщение от @{username}, но текст отсутствует (update.message.text is None)")
+        logger.debug("Новое сообщение от @%s, но текст отсутствует (update.message.text is None)", username)
         return
         
     if not update.effective_user or not update.effective_user.username:
         logger.warning("Пользователь без username попытался отправить сообщение")
-        await update.message.reply_text("Для работы с ботом необходимо указать username в настройках Telegram.")
+        await reply_text(update.message, "Для работы с ботом необходимо указать username в настройках Telegram.")
         return
 
     user_input = update.message.text
+    metrics.inc("bot_messages_total")
+    if is_batch_message(user_input):
+        metrics.inc("bot_batch_messages_total")
+        await handle_batch_message(update, username, user_input)
+        return
 
     try:
-        result = process_message(user_input, username)
-        logger.info(f"Результат парсинга: amount={result.amount}, category={result.category}, error_message={result.error_message}")
+        with timed("pipeline"):
+            result = await executor.run(username, process_message, user_input, username)
+        logger.debug("Результат парсинга: amount=%s, category=%s, error_message=%s", result.amount, result.category, result.error_message)
 
         # Если парсер вернул ошибку (нет суммы или нет комментария) — сообщаем об ошибке
         if result.amount is None or (result.error_message and result.category is None and result.amount is None):
-            logger.warning(f"Ошибка парсинга: {result.error_message}")
-            await update.message.reply_text(result.error_message)
+            logger.warning("Ошибка парсинга: %s", result.error_message)
+            await reply_text(update.message, result.error_message)
             return
 
         # Если категория определена — сохраняем расход
         if result.category:
-            logger.info(f"Категория определена автоматически: {result.category}")
-            await update.message.reply_text(f"Записано: {result.amount} ₽ на категорию «{result.category}»")
+            logger.debug("Категория определена автоматически: %s", result.category)
+            await reply_text(update.message, with_alerts(f"Записано: {result.amount} ₽ на категорию «{result.category}»", result.alerts))
         # Если сумма и комментарий есть, но категория не определена — предлагаем выбрать категорию
         elif result.amount is not None and result.error_message:
-            user_inputs[username] = (result.amount, result.error_message)  # error_message содержит comment
-            categories = sorted(set(get_combined_category_map(username).values()))
-            logger.info(f"Категория не определена. Доступные категории: {categories}")
+            categories = category_matcher.categories(username)
+            logger.debug("Категория не определена. Доступные категории: %s", categories)
             if not categories:
                 logger.error("Список категорий пуст! Клавиатура не будет отправлена.")
-                await update.message.reply_text("Не удалось определить категорию и список категорий пуст. Обратитесь к администратору.")
+                await reply_text(update.message, "Не удалось определить категорию и список категорий пуст. Обратитесь к администратору.")
                 return
-            keyboard = [[InlineKeyboardButton(cat, callback_data=cat)] for cat in categories]
-            await update.message.reply_text("Не удалось определить категорию. Пожалуйста, выбери:",
-                                          reply_markup=InlineKeyboardMarkup(keyboard))
+            prompt_id = update.message.message_id
+            # error_message содержит comment
+            await executor.run(username, pending.put, username, prompt_id, [(result.error_message, [result.amount])])
+            await reply_text(update.message, "Не удалось определить категорию. Пожалуйста, выбери:",
+                                          reply_markup=category_keyboard(username, prompt_id, 1, result.suggestions))
         else:
             logger.warning("Не удалось распознать сообщение. Неизвестная ошибка парсинга.")
-            await update.message.reply_text("Формат не распознан. Введи как: 200 кофе")
+            await reply_text(update.message, "Формат не распознан. Введи как: 200 кофе")
+    except Exception as e:
+        logger.exception("Ошибка при обработке сообщения: %s", e)
+        await reply_text(update.message, f"Произошла ошибка при обработке сообщения: {str(e)}")
+
+def category_prompt(groups) -> str:
+    """
+    Текст вопроса о категории для первого из ожидающих комментариев пакета.
+
+    Комментарий и сумма показываются всегда, даже в последнем вопросе: без них
+    непонятно, к какой строке сообщения относится выбор.
+    """
+    comment, amounts = groups[0]
+    total = sum(amounts)
+    details = f"{total} ₽" if len(amounts) == 1 else f"{total} ₽, строк: {len(amounts)}"
+    remaining = f" Осталось вопросов: {len(groups)}." if len(groups) > 1 else ""
+    return f"Не удалось определить категорию для «{comment}» ({details}).{remaining} Пожалуйста, выбери:"
+
+async def handle_batch_message(update: Update, username: str, text: str):
+    """Обрабатывает многострочное сообщение: одна запись, один ответ и одна цепочка выбора категорий."""
+    try:
+        with timed("pipeline"):
+            result = await executor.run(username, process_batch, text, username)
+    except Exception as e:
+        logger.exception("Ошибка при обработке пакета: %s", e)
+        await reply_text(update.message, f"Произошла ошибка при обработке сообщения: {str(e)}")
+        return
+
+    lines = []
+    if result.saved:
+        lines.append(f"Записано расходов: {len(result.saved)} на сумму {sum(e.amount for e in result.saved)} ₽")
+        lines += [f"• {e.amount} ₽ — {e.category} ({e.comment})" for e in result.saved[:MAX_SUMMARY_LINES]]
+        if len(result.saved) > MAX_SUMMARY_LINES:
+            lines.append(f"…и ещё {len(result.saved) - MAX_SUMMARY_LINES}")
+    lines += [alert.text for alert in result.alerts]
+    if result.invalid:
+        lines.append(f"Не распознаны строки ({len(result.invalid)}): " + "; ".join(result.invalid[:MAX_SUMMARY_LINES]))
+    if not lines and not result.unknown:
+        await reply_text(update.message, "Формат не распознан. Введи как: 200 кофе")
+        return
+    if lines:
+        await reply_text(update.message, "\n".join(lines))
+
+    if result.unknown:
+        prompt_id = update.message.message_id
+        await executor.run(username, pending.put, username, prompt_id, list(result.unknown))
+        await reply_text(update.message, category_prompt(result.unknown),
+                                        reply_markup=await suggested_keyboard(username, result.unknown[0][0], prompt_id,
+                                                                              len(result.unknown)))
+
+async def current_rollups(username: str) -> Rollups:
+    """Общие агрегаты или, пока они пересчитываются после старта, агрегаты пользователя из хранилища."""
+    if rollups.ready:
+        return rollups
+    return await executor.run(username, user_rollups, get_storage(), username)
+
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.effective_user.username:
+        await reply_text(update.message, "Для работы с ботом необходимо указать username в настройках Telegram.")
+        return
+    username = update.effective_user.username
+    logger.info("/report %s от пользователя: %s", ' '.join(context.args), username)
+    try:
+        text = build_report(await current_rollups(username), username, context.args, datetime.now().date())
+    except ValueError as e:
+        await reply_text(update.message, f"{e}\n\n{REPORT_USAGE}")
+        return
+    await reply_text(update.message, text)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.effective_user.username:
+        await reply_text(update.message, "Для работы с ботом необходимо указать username в настройках Telegram.")
+        return
+    username = update.effective_user.username
+    logger.info("/export %s от пользователя: %s", ' '.join(context.args), username)
+    try:
+        request = parse_export_args(context.args, datetime.now().date())
+        # Чтение и кодирование идут в пуле, чтобы большая выгрузка не блокировала event loop
+        result = await executor.run(username, build_export, get_storage(), username, request)
+    except ValueError as e:
+        await reply_text(update.message, f"{e}\n\n{EXPORT_USAGE}")
+        return
     except Exception as e:
-        logger.exception(f"Ошибка при обработке сообщения: {str(e)}")
-        await update.message.reply_text(f"Произошла ошибка при обработке сообщения: {str(e)}")
+        logger.exception("Ошибка при выгрузке расходов: %s", e)
+        await reply_text(update.message, f"Произошла ошибка при выгрузке: {str(e)}")
+        return
+    try:
+        if not result.rows:
+            await reply_text(update.message, "За этот период расходов нет.")
+            return
+        await update.message.reply_document(document=result.file, filename=result.filename,
+                                            caption=f"Расходов: {result.rows}")
+    finally:
+        result.file.close()
+
+async def budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.effective_user.username:
+        await reply_text(update.message, "Для работы с ботом необходимо указать username в настройках Telegram.")
+        return
+    username = update.effective_user.username
+    logger.info("/budget %s от пользователя: %s", ' '.join(context.args), username)
+    if not context.args:
+        await reply_text(update.message, build_budget_report(budgets, await current_rollups(username), username,
+                                                             datetime.now().date()))
+        return
+    if context.args[0].lower() in ("help", "помощь"):
+        await reply_text(update.message, BUDGET_USAGE)
+        return
+    try:
+        category, limit = parse_budget_args(context.args)
+    except ValueError as e:
+        await reply_text(update.message, f"{e}\n\n{BUDGET_USAGE}")
+        return
+    await executor.run(username, budgets.set_limit, username, category, limit)
+    if limit:
+        await reply_text(update.message, f"Бюджет «{category}»: {format_amount(limit)} в месяц")
+    else:
+        await reply_text(update.message, f"Бюджет «{category}» убран")
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.effective_user.username:
+        await reply_text(update.message, "Для работы с ботом необходимо указать username в настройках Telegram.")
+        return
+    username = update.effective_user.username
+    logger.info("/digest %s от пользователя: %s", ' '.join(context.args), username)
+    if not context.args:
+        subscription = digests.get(username)
+        if subscription is None:
+            await reply_text(update.message, f"Подписок на сводки нет.\n\n{DIGEST_USAGE}")
+        else:
+            titles = ", ".join(PERIOD_TITLES[p] for p in subscription.periods)
+            await reply_text(update.message, f"📬 Сводки: {titles}. Приходят с {DIGEST_TIME} в течение {DIGEST_WINDOW} мин.")
+        return
+    if context.args[0].lower() in ("help", "помощь"):
+        await reply_text(update.message, DIGEST_USAGE)
+        return
+    try:
+        periods = parse_digest_args(context.args)
+    except ValueError as e:
+        await reply_text(update.message, f"{e}\n\n{DIGEST_USAGE}")
+        return
+    await executor.run(username, digests.subscribe, username, update.effective_chat.id, periods)
+    if periods:
+        await reply_text(update.message, f"📬 Подписка на сводки: {', '.join(PERIOD_TITLES[p] for p in periods)}")
+    else:
+        await reply_text(update.message, "Подписка на сводки отменена")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    username = update.effective_user.username if update.effective_user else None
+    if username not in ADMIN_USERNAMES:
+        logger.warning("/stats от пользователя без прав: %s", username)
+        await reply_text(update.message, "Команда доступна только администраторам.")
+        return
+    await reply_text(update.message, format_stats(metrics))
+
+def save_category_choice(amounts: List[Decimal], comment: str, category: str, username: str) -> List[BudgetAlert]:
+    """Запоминает выбранную категорию для комментария и сохраняет все расходы с этим комментарием."""
+    add_category_mapping(comment, category, username)
+    now = datetime.now()
+    return save_expenses([Expense(now, amount, category, comment, username) for amount in amounts])
+
+class ChoiceResult(NamedTuple):
+    """Результат выбора категории для первого из ожидающих комментариев."""
+    amounts: List[Decimal]
+    alerts: List[BudgetAlert]
+    # Оставшиеся вопросы цепочки
+    rest: List[Tuple[str, List[Decimal]]]
+    # Клавиатура устарела: вопрос, к которому она относилась, уже обработан
+    stale: bool = False
+
+def apply_category_choice(username: str, prompt_id: int, remaining: int, category: str) -> Optional[ChoiceResult]:
+    """
+    Сохраняет расходы первого ожидающего комментария с выбранной категорией.
+
+    Выполняется в пуле по очереди с остальными задачами пользователя, поэтому
+    два нажатия не обработают один вопрос дважды. Вопрос снимается только после
+    успешного сохранения: при ошибке его можно ответить еще раз.
+
+    Returns:
+        Optional[ChoiceResult]: None, если ожидающих расходов нет (вопрос истек)
+    """
+    groups = pending.get(username, prompt_id)
+    if not groups:
+        return None
+    if len(groups) != remaining:
+        return ChoiceResult([], [], groups, stale=True)
+    comment, amounts = groups[0]
+    alerts = save_category_choice(amounts, comment, category, username)
+    rest = groups[1:]
+    if rest:
+        pending.put(username, prompt_id, rest)
+    else:
+        pending.take(username, prompt_id)
+    return ChoiceResult(amounts, alerts, rest)
+
+def _button_text(query) -> Optional[str]:
+    """Возвращает название категории на нажатой кнопке."""
+    markup = query.message.reply_markup if query.message else None
+    for row in (markup.inline_keyboard if markup else ()):
+        for button in row:
+            if button.callback_data == query.data:
+                return button.text
+    return None
 
 async def handle_category_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
     username = query.from_user.username if query.from_user else 'unknown'
-    logger.info(f"Выбор категории пользователем @{username}: {query.data}")
+    logger.debug("Выбор категории пользователем @%s: %s", username, query.data)
 
     if not query.from_user or not query.from_user.username:
         logger.warning("Пользователь без username попытался выбрать категорию")
-        await query.edit_message_text("Для работы с ботом необходимо указать username в настройках Telegram.")
+        await edit_message_text(query, "Для работы с ботом необходимо указать username в настройках Telegram.")
         return
 
-    if username not in user_inputs:
-        logger.warning(f"Пользователь @{username} попытался выбрать категорию, но данных нет в user_inputs")
-        await query.edit_message_text("Время выбора категории истекло. Пожалуйста, отправьте сообщение заново.")
+    more = parse_more(query.data)
+    if more is not None:
+        # Подсказки не подошли — показываем все категории в том же сообщении
+        prompt_id, remaining = more
+        with timed("telegram_reply"):
+            await query.edit_message_reply_markup(
+                get_category_keyboard(category_matcher.categories(username), prompt_id, remaining))
         return
 
+    metrics.inc("bot_category_choices_total")
+    choice = parse_choice(query.data)
+    category = _button_text(query) if choice else None
+    if not category:
+        logger.warning("Пользователь @%s прислал неизвестную кнопку выбора категории: %s", username, query.data)
+        await edit_message_text(query, "Время выбора категории истекло. Пожалуйста, отправьте сообщение заново.")
+        return
+
+    prompt_id, remaining, _ = choice
     try:
-        amount, comment = user_inputs.pop(username)
-        add_category_mapping(comment, query.data, username)
-        save_expense(amount, query.data, comment, username)
-        logger.info(f"Сохранён расход: {amount} {query.data} {comment} @{username}")
-        await query.edit_message_text(f"Записано: {amount} ₽ на категорию «{query.data}»")
+        with timed("pipeline"):
+            result = await executor.run(username, apply_category_choice, username, prompt_id, remaining, category)
+        if result is None:
+            logger.warning("Пользователь @%s попытался выбрать категорию, но ожидающих расходов нет", username)
+            await edit_message_text(query, "Время выбора категории истекло. Пожалуйста, отправьте сообщение заново.")
+            return
+        if result.stale:
+            # Повторное нажатие: сообщение уже показывает следующий вопрос, его не трогаем
+            logger.info("Пользователь @%s нажал устаревшую кнопку выбора категории: %s", username, query.data)
+            return
+        logger.debug("Сохранён расход: %s %s @%s", result.amounts, category, username)
+        saved = with_alerts(f"Записано: {sum(result.amounts)} ₽ на категорию «{category}»", result.alerts)
+        if result.rest:
+            await edit_message_text(query, f"{saved}\n\n{category_prompt(result.rest)}",
+                                          reply_markup=await suggested_keyboard(username, result.rest[0][0], prompt_id,
+                                                                                len(result.rest)))
+        else:
+            await edit_message_text(query, saved)
     except Exception as e:
-        logger.exception(f"Ошибка при сохранении расхода: {str(e)}")
-        await query.edit_message_text(f"Произошла ошибка при сохранении: {str(e)}")
+        logger.exception("Ошибка при сохранении расхода: %s", e)
+        await edit_message_text(query, f"Произошла ошибка при сохранении: {str(e)}")
 
-def main():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+async def reconcile_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Дописывает в Google Таблицу расходы последних дней, которых там нет (в потоке, вне цикла событий)."""
+    try:
+        report = await asyncio.to_thread(reconcile_recent)
+    except Exception as e:
+        logger.warning("Сверка с Google Sheets не выполнена: %s", e)
+        return
+    metrics.inc("bot_reconcile_pushed_total", report.pushed)
+    logger.info("Сверка с Google Sheets: расходов %s, в листе %s, в очереди %s, дописано %s",
+                report.local, report.sheet, report.queued, report.pushed)
+
+async def on_shutdown(app) -> None:
+    """Дожидается завершения задач пула, закрывает хранилища, сохраняет отметки сводок и кэш лемм при остановке бота."""
+    if dict_watcher is not None:
+        dict_watcher.stop()
+    executor.shutdown()
+    analytics_cache.stop()
+    digests.flush()
+    close_storage()
+    pending.close()
+    if LEMMA_CACHE_PERSIST:
+        lemma_cache.save()
+
+def build_application(post_init=None, updater: bool = True) -> Application:
+    """
+    Собирает приложение со всеми обработчиками и настройками параллельности и пула соединений.
+
+    Args:
+        post_init: Функция, вызываемая после инициализации приложения
+        updater: Создавать ли собственный прием обновлений (polling/webhook).
+            Воркеры шардированного режима получают обновления от диспетчера (см. bot.sharding)
+    """
+    builder = application_builder().post_shutdown(on_shutdown)
+    if not updater:
+        builder = builder.updater(None)
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    app = builder.build()
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('help', help_command))
+    app.add_handler(CommandHandler('report', report_command))
+    app.add_handler(CommandHandler('export', export_command))
+    app.add_handler(CommandHandler('budget', budget_command))
+    app.add_handler(CommandHandler('digest', digest_command))
+    app.add_handler(CommandHandler('stats', stats_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(CallbackQueryHandler(handle_category_choice))
-    logger.info("Бот запущен и ожидает сообщения...")
-    app.run_polling()
+    return app
+
+def prepare(timer: StartupTimer) -> None:
+    """
+    Загружает кэш лемм перед приемом обновлений. Агрегаты и аналитика
+    пересчитываются из хранилища в фоне (см. ``startup_hook``); до конца
+    пересчета /report и /budget читают расходы пользователя из хранилища.
+    """
+    if WARMUP_MODE not in WARMUP_MODES:
+        raise ValueError(f"WARMUP_MODE должен быть одним из {WARMUP_MODES}, получено: {WARMUP_MODE}")
+    if LEMMA_CACHE_PERSIST:
+        with timer.phase("кэш лемм"):
+            lemma_cache.load()
+    rollups.begin_rebuild()
+    if WARMUP_MODE == "eager":
+        warm_up(timer)
+
+def startup_hook(timer: StartupTimer, metrics_port: int = METRICS_PORT):
+    """Возвращает post_init: отчет о запуске, сервер метрик, фоновые пересчет и прогрев, слежение за словарями."""
+    async def on_startup(app) -> None:
+        logger.info("Бот готов принимать обновления за %s", timer.report())
+        if metrics_port:
+            start_metrics_server(metrics, METRICS_HOST, metrics_port)
+        start_background_sync(timer, (
+            ("агрегаты", lambda: rollups.rebuild(get_storage())),
+            ("аналитика", lambda: analytics_cache.sync(get_storage())),
+        ))
+        if WARMUP_MODE == "background":
+            start_background_warm_up(timer)
+        if dict_watcher is not None:
+            dict_watcher.start()
+        if app.job_queue is None:
+            logger.warning("JobQueue недоступна (нужен python-telegram-bot[job-queue]), сводки не рассылаются")
+        else:
+            digest_scheduler.schedule(app.job_queue)
+            if RECONCILE_INTERVAL > 0:
+                app.job_queue.run_repeating(reconcile_job, RECONCILE_INTERVAL * 3600,
+                                            first=RECONCILE_INTERVAL * 3600, name="sheets-reconcile")
+    return on_startup
+
+def main():
+    check_bot_mode()
+    timer = StartupTimer(_import_started)
+    setup_logging()
+    timer.mark("импорт")
+    prepare(timer)
+    run(build_application(post_init=startup_hook(timer)))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,314 @@
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Ключ узла, в котором хранится категория фразы (пустая строка не бывает леммой)
+_CATEGORY = ""
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова в нижнем регистре, отбрасывая пунктуацию."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class PhraseTrie:
+    """Префиксное дерево по последовательностям лемм: «еда вне дома» -> («еда», «вне», «дом»)."""
+
+    def __init__(self) -> None:
+        self._root: Dict[str, dict] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, lemmas: Sequence[str], category: str) -> None:
+        """Добавляет фразу или заменяет категорию существующей фразы."""
+        if not lemmas:
+            return
+        node = self._root
+        for lemma in lemmas:
+            node = node.setdefault(lemma, {})
+        if _CATEGORY not in node:
+            self._size += 1
+        node[_CATEGORY] = category
+
+    def patched(
+        self,
+        removed: Iterable[Sequence[str]],
+        added: Iterable[Tuple[Sequence[str], str]],
+    ) -> "PhraseTrie":
+        """
+        Возвращает новое дерево без фраз ``removed`` и с фразами ``added``; исходное не меняется.
+
+        Копируются только узлы на путях измененных фраз, остальные поддеревья
+        общие со старым деревом, поэтому стоимость зависит от числа измененных
+        фраз, а не от размера словаря. Сопоставления, идущие по старому дереву,
+        видят его целиком неизменным.
+        """
+        trie = PhraseTrie()
+        trie._root = dict(self._root)
+        trie._size = self._size
+        copied: Set[int] = {id(trie._root)}
+
+        def path(lemmas: Sequence[str], create: bool) -> Optional[List[dict]]:
+            # Узлы от корня до фразы; чужие (общие со старым деревом) узлы заменяются копиями
+            nodes = [trie._root]
+            for lemma in lemmas:
+                child = nodes[-1].get(lemma)
+                if child is None:
+                    if not create:
+                        return None
+                    child = {}
+                elif id(child) not in copied:
+                    child = dict(child)
+                else:
+                    nodes.append(child)
+                    continue
+                copied.add(id(child))
+                nodes[-1][lemma] = child
+                nodes.append(child)
+            return nodes
+
+        for lemmas in removed:
+            nodes = path(lemmas, create=False) if lemmas else None
+            if nodes is None or _CATEGORY not in nodes[-1]:
+                continue
+            del nodes[-1][_CATEGORY]
+            trie._size -= 1
+            # Убираем опустевшие узлы снизу вверх
+            for depth in range(len(lemmas), 0, -1):
+                if nodes[depth]:
+                    break
+                del nodes[depth - 1][lemmas[depth - 1]]
+        for lemmas, category in added:
+            if not lemmas:
+                continue
+            node = path(lemmas, create=True)[-1]
+            if _CATEGORY not in node:
+                trie._size += 1
+            node[_CATEGORY] = category
+        return trie
+
+    def longest_match(self, lemmas: Sequence[str], start: int) -> Optional[Tuple[int, str]]:
+        """
+        Ищет самую длинную фразу, начинающуюся с позиции ``start``.
+
+        Returns:
+            Optional[Tuple[int, str]]: (длина фразы в словах, категория) или None
+        """
+        node = self._root
+        best = None
+        for i in range(start, len(lemmas)):
+            node = node.get(lemmas[i])
+            if node is None:
+                break
+            category = node.get(_CATEGORY)
+            if category is not None:
+                best = (i - start + 1, category)
+        return best
+
+
+class _BaseIndex:
+    """Неизменяемый снимок базового словаря; при обновлении словаря заменяется целиком."""
+
+    def __init__(self, base_map: Mapping[str, str]) -> None:
+        self.exact: Dict[str, str] = dict(base_map)
+        self.categories = tuple(sorted(set(self.exact.values())))
+        # Компилируется при первом сопоставлении: ключ -> леммы, леммы -> ключи и дерево фраз
+        self.phrases: Optional[Dict[str, Tuple[str, ...]]] = None
+        # Ключи с одинаковыми леммами в порядке добавления; в дереве категория последнего
+        self.owners: Optional[Dict[Tuple[str, ...], Tuple[str, ...]]] = None
+        self.trie: Optional[PhraseTrie] = None
+
+
+class _UserOverlay:
+    """Пользовательские соответствия поверх базового словаря."""
+
+    def __init__(self) -> None:
+        self.exact: Dict[str, str] = {}
+        self.trie = PhraseTrie()
+        self.categories: Optional[Tuple[str, ...]] = None
+
+
+class CategoryMatcher:
+    """
+    Скомпилированный индекс категорий.
+
+    Ключи базового словаря лемматизируются один раз — при первом
+    сопоставлении или заранее через ``warm``, а пользовательские соответствия хранятся в отдельных надстройках, которые
+    строятся при первом обращении и дополняются по одному ключу. Сопоставление
+    проходит по комментарию один раз и находит в том числе многословные ключи,
+    а его стоимость не зависит от размера словарей.
+
+    Базовый словарь можно заменить на лету (``set_base``): новый индекс
+    строится рядом со старым, лемматизируются только добавленные ключи,
+    а дерево фраз не строится заново — в копии меняются только пути
+    удаленных, добавленных и измененных фраз. Сравнение старого и нового
+    словарей по-прежнему проходит по ним целиком (операциями над множествами
+    ключей). Сопоставления, уже начатые на старом индексе, доходят до конца на нем.
+
+    Args:
+        base_map: Базовый словарь «ключ -> категория»
+        lemmatize: Функция нормализации слова
+        user_map_loader: Функция, возвращающая пользовательский словарь по username
+    """
+
+    def __init__(
+        self,
+        base_map: Mapping[str, str],
+        lemmatize: Callable[[str], str],
+        user_map_loader: Callable[[str], Mapping[str, str]],
+    ) -> None:
+        self._lemmatize = lemmatize
+        self._user_map_loader = user_map_loader
+        self._base_index = _BaseIndex(base_map)
+        self._overlays: Dict[str, _UserOverlay] = {}
+        self._lock = threading.Lock()
+
+    def lemmatize_phrase(self, text: str) -> Tuple[str, ...]:
+        """Возвращает последовательность лемм фразы. Неразобранные слова остаются как есть."""
+        lemmas = []
+        for word in tokenize(text):
+            try:
+                lemmas.append(self._lemmatize(word))
+            except (IndexError, AttributeError):
+                lemmas.append(word)
+        return tuple(lemmas)
+
+    def _compile(self, index: _BaseIndex, previous: Optional[_BaseIndex] = None) -> None:
+        """
+        Строит дерево фраз снимка. Если ``previous`` скомпилирован, его дерево
+        не строится заново, а дополняется: лемматизируются только добавленные
+        ключи, а в дереве меняются только фразы удаленных, добавленных и
+        измененных ключей (см. ``PhraseTrie.patched``).
+        """
+        if previous is not None and previous.trie is not None:
+            self._patch(index, previous)
+            return
+        phrases: Dict[str, Tuple[str, ...]] = {}
+        owners: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        trie = PhraseTrie()
+        for key, category in index.exact.items():
+            lemmas = self.lemmatize_phrase(key)
+            phrases[key] = lemmas
+            owners[lemmas] = owners.get(lemmas, ()) + (key,)
+            trie.add(lemmas, category)
+        index.phrases = phrases
+        index.owners = owners
+        index.trie = trie
+
+    def _patch(self, index: _BaseIndex, previous: _BaseIndex) -> None:
+        old, new = previous.exact, index.exact
+        phrases = dict(previous.phrases)
+        owners = dict(previous.owners)
+        touched: Set[Tuple[str, ...]] = set()
+        for key in old.keys() - new.keys():
+            lemmas = phrases.pop(key)
+            owners[lemmas] = tuple(k for k in owners[lemmas] if k != key)
+            touched.add(lemmas)
+        for key in [k for k, category in new.items() if old.get(k) != category]:
+            lemmas = phrases.get(key)
+            if lemmas is None:
+                lemmas = phrases[key] = self.lemmatize_phrase(key)
+                owners[lemmas] = owners.get(lemmas, ()) + (key,)
+            touched.add(lemmas)
+        removed, added = [], []
+        for lemmas in touched:
+            keys = owners.get(lemmas)
+            if keys:
+                added.append((lemmas, new[keys[-1]]))
+            else:
+                owners.pop(lemmas, None)
+                removed.append(lemmas)
+        index.phrases = phrases
+        index.owners = owners
+        index.trie = previous.trie.patched(removed, added)
+
+    def _base_trie(self, index: _BaseIndex) -> PhraseTrie:
+        trie = index.trie
+        if trie is not None:
+            return trie
+        with self._lock:
+            if index.trie is None:
+                self._compile(index)
+            return index.trie
+
+    def warm(self) -> None:
+        """Компилирует базовый словарь заранее, чтобы первое сообщение не платило за это."""
+        self._base_trie(self._base_index)
+
+    def set_base(self, base_map: Mapping[str, str]) -> None:
+        """
+        Заменяет базовый словарь (подходит как подписчик ``on_base_map_changed``).
+
+        Если старый словарь уже был скомпилирован, новый компилируется сразу,
+        до подмены, чтобы сообщения не ждали лемматизации.
+        """
+        index = _BaseIndex(base_map)
+        previous = self._base_index
+        if previous.trie is not None:
+            self._compile(index, previous)
+        with self._lock:
+            self._base_index = index
+            for overlay in self._overlays.values():
+                overlay.categories = None
+
+    def _overlay(self, username: str) -> _UserOverlay:
+        overlay = self._overlays.get(username)
+        if overlay is not None:
+            return overlay
+        built = _UserOverlay()
+        for key, category in self._user_map_loader(username).items():
+            built.exact[key] = category
+            built.trie.add(self.lemmatize_phrase(key), category)
+        with self._lock:
+            return self._overlays.setdefault(username, built)
+
+    def add_user_mapping(self, username: str, key: str, category: str) -> None:
+        """Добавляет соответствие в надстройку пользователя без её перестроения."""
+        overlay = self._overlays.get(username)
+        if overlay is None:
+            # Надстройка ещё не строилась — при первом обращении она прочитает словарь целиком
+            return
+        overlay.exact[key] = category
+        overlay.trie.add(self.lemmatize_phrase(key), category)
+        if overlay.categories is not None and category not in overlay.categories:
+            overlay.categories = None
+
+    def drop_user(self, username: str) -> None:
+        """Выгружает надстройку неактивного пользователя; при следующем обращении она построится заново."""
+        with self._lock:
+            self._overlays.pop(username, None)
+
+    def match(self, comment: str, username: str) -> Optional[str]:
+        """
+        Находит категорию для комментария.
+        Сначала ищет полное совпадение, затем самую длинную фразу с самой ранней позиции.
+        При равной длине пользовательское соответствие важнее базового.
+        """
+        overlay = self._overlay(username)
+        # Снимок берется один раз: замена словаря не меняет его посреди сопоставления
+        base = self._base_index
+        category = overlay.exact.get(comment) or base.exact.get(comment)
+        if category:
+            return category
+
+        lemmas = self.lemmatize_phrase(comment)
+        base_trie = self._base_trie(base)
+        for start in range(len(lemmas)):
+            user_hit = overlay.trie.longest_match(lemmas, start)
+            base_hit = base_trie.longest_match(lemmas, start)
+            if user_hit and (not base_hit or user_hit[0] >= base_hit[0]):
+                return user_hit[1]
+            if base_hit:
+                return base_hit[1]
+        return None
+
+    def categories(self, username: str) -> Tuple[str, ...]:
+        """Возвращает отсортированный список категорий пользователя (кэшируется)."""
+        overlay = self._overlay(username)
+        if overlay.categories is None:
+            overlay.categories = tuple(sorted(set(self._base_index.categories) | set(overlay.exact.values())))
+        return overlay.categories
@@ -0,0 +1,269 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Константы
+# Границы корзин гистограмм, в секундах: от долей миллисекунды (разбор) до секунд (ответ Telegram)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RATE_WINDOW = 60  # Окно для скорости «за последнюю минуту», в секундах
+
+
+class HistogramSnapshot(NamedTuple):
+    """Состояние гистограммы: количество наблюдений, их сумма и накопленные счетчики по корзинам."""
+    count: int
+    total: float
+    buckets: Tuple[Tuple[float, int], ...]
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценивает квантиль по границам корзин (верхняя граница первой корзины, покрывшей q)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulative in self.buckets:
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self._bounds = buckets
+        self._counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self._count = 0
+        self._total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._total += value
+
+    def snapshot(self) -> HistogramSnapshot:
+        with self._lock:
+            counts, count, total = list(self._counts), self._count, self._total
+        cumulative, buckets = 0, []
+        for bound, n in zip(self._bounds + (float("inf"),), counts):
+            cumulative += n
+            buckets.append((bound, cumulative))
+        return HistogramSnapshot(count, total, tuple(buckets))
+
+
+class RateMeter:
+    """Количество событий за последние ``window`` секунд (по корзинам на секунду)."""
+
+    def __init__(self, window: int = RATE_WINDOW) -> None:
+        self._window = window
+        self._slots = [0] * window
+        self._stamps = [0] * window
+        self._lock = threading.Lock()
+
+    def mark(self, n: int = 1) -> None:
+        second = int(time.time())
+        slot = second % self._window
+        with self._lock:
+            if self._stamps[slot] != second:
+                self._stamps[slot] = second
+                self._slots[slot] = 0
+            self._slots[slot] += n
+
+    def per_second(self) -> float:
+        now = int(time.time())
+        with self._lock:
+            recent = sum(n for n, stamp in zip(self._slots, self._stamps) if now - stamp < self._window)
+        return recent / self._window
+
+
+class MetricsRegistry:
+    """
+    Метрики бота в памяти процесса: гистограммы длительностей этапов обработки,
+    счетчики событий и показатели, которые считываются из других подсистем
+    (кэш лемм, очередь Sheets, пул обработки) в момент запроса.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._rates: Dict[str, RateMeter] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Записывает длительность этапа."""
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Замеряет длительность блока ``with`` (в том числе с ``await`` внутри) как этап ``stage``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def inc(self, name: str, n: int = 1) -> None:
+        """Увеличивает счетчик событий ``name``."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            rate = self._rates.get(name)
+            if rate is None:
+                rate = self._rates[name] = RateMeter()
+        rate.mark(n)
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Регистрирует показатель, значение которого возвращает ``read`` в момент запроса."""
+        with self._lock:
+            self._gauges[name] = (help_text, read)
+
+    def describe(self, name: str, help_text: str) -> None:
+        """Задает описание счетчика для формата Prometheus."""
+        with self._lock:
+            self._help[name] = help_text
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def rate(self, name: str) -> float:
+        """Событий в секунду за последнюю минуту."""
+        meter = self._rates.get(name)
+        return meter.per_second() if meter else 0.0
+
+    def stages(self) -> Dict[str, HistogramSnapshot]:
+        with self._lock:
+            stages = dict(self._stages)
+        return {stage: histogram.snapshot() for stage, histogram in sorted(stages.items())}
+
+    def gauges(self) -> Dict[str, float]:
+        with self._lock:
+            gauges = dict(self._gauges)
+        values = {}
+        for name, (_, read) in sorted(gauges.items()):
+            try:
+                values[name] = float(read())
+            except Exception as e:
+                logger.warning("Не удалось прочитать показатель %s: %s", name, e)
+        return values
+
+    @property
+    def uptime(self) -> float:
+        return time.time() - self._started
+
+    def render_prometheus(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        lines: List[str] = []
+        for name, value in sorted(self.counters().items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        with self._lock:
+            gauge_help = {name: help_text for name, (help_text, _) in self._gauges.items()}
+        for name, value in self.gauges().items():
+            lines.append(f"# HELP {name} {gauge_help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        lines.append("# HELP bot_stage_duration_seconds Длительность этапов обработки сообщения")
+        lines.append("# TYPE bot_stage_duration_seconds histogram")
+        for stage, snapshot in self.stages().items():
+            for bound, cumulative in snapshot.buckets:
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'bot_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'bot_stage_duration_seconds_sum{{stage="{stage}"}} {snapshot.total:.6f}')
+            lines.append(f'bot_stage_duration_seconds_count{{stage="{stage}"}} {snapshot.count}')
+        lines.append("# HELP bot_uptime_seconds Время работы процесса")
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {self.uptime:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    if seconds == float("inf"):
+        return f">{BUCKETS[-1] * 1000:.0f}"
+    return f"{seconds * 1000:.1f}"
+
+
+def format_stats(registry: "MetricsRegistry") -> str:
+    """Строит текст ответа на /stats: скорость, доли событий, задержки этапов и показатели подсистем."""
+    counters = registry.counters()
+    messages = counters.get("bot_messages_total", 0)
+    unknown = counters.get("bot_unknown_category_total", 0)
+    lines = [
+        f"📈 Работает {registry.uptime / 3600:.1f} ч",
+        f"Сообщений: {messages} ({registry.rate('bot_messages_total'):.2f}/с за минуту)",
+        f"Сохранено расходов: {counters.get('bot_expenses_saved_total', 0)}",
+        f"Без категории: {unknown / messages:.1%}" if messages else "Без категории: —",
+        "",
+        "⏱ Этапы, мс (p50 / p95 / p99, количество):",
+    ]
+    for stage, snapshot in registry.stages().items():
+        lines.append(
+            f"{stage}: {_ms(snapshot.quantile(0.5))} / {_ms(snapshot.quantile(0.95))} / "
+            f"{_ms(snapshot.quantile(0.99))} ({snapshot.count})"
+        )
+    gauges = registry.gauges()
+    if gauges:
+        lines.append("")
+        lines += [f"{name}: {value:g}" for name, value in gauges.items()]
+    return "\n".join(lines)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: "MetricsRegistry"
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("Запрос метрик: " + format, *args)
+
+
+def start_metrics_server(registry: "MetricsRegistry", host: str, port: int) -> ThreadingHTTPServer:
+    """Запускает HTTP-сервер с метриками в формате Prometheus (/metrics) в фоновом потоке."""
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Метрики Prometheus доступны на http://%s:%s/metrics", host, server.server_address[1])
+    return server
+
+
+# Общие метрики процесса
+metrics = MetricsRegistry()
+metrics.describe("bot_messages_total", "Входящие сообщения с расходами")
+metrics.describe("bot_batch_messages_total", "Многострочные сообщения")
+metrics.describe("bot_expenses_saved_total", "Сохраненные расходы")
+metrics.describe("bot_unknown_category_total", "Сообщения, для которых не удалось определить категорию")
+metrics.describe("bot_parse_failed_total", "Сообщения, которые не удалось разобрать")
+metrics.describe("bot_category_choices_total", "Нажатия кнопок выбора категории")
+metrics.describe("bot_fuzzy_auto_total", "Категории, назначенные по похожему комментарию")
+metrics.describe("bot_dict_reloads_total", "Перечитанные на лету словари категорий (базовый и пользовательские)")
+metrics.describe("bot_dict_reload_errors_total", "Отклоненные изменения базового словаря категорий")
+metrics.describe("bot_digests_sent_total", "Отправленные сводки расходов")
+metrics.describe("bot_digest_failures_total", "Сводки, которые не удалось отправить")
+metrics.describe("bot_reconcile_pushed_total", "Строки, дописанные в Google Sheets плановой сверкой")
+timed = metrics.timed
@@ -1,10 +1,220 @@
+import json
+import logging
+import os
 import re
+import threading
+from collections import OrderedDict
 from decimal import Decimal
-from pymorphy3 import MorphAnalyzer
-from typing import Tuple, Optional
-from .categories import get_combined_category_map
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple, Optional, NamedTuple
+from .categories import get_base_map, get_user_category_map, on_base_map_changed, on_mapping_added, on_user_unloaded
+from .matcher import CategoryMatcher, tokenize
+from .metrics import timed
+from config.paths import DATA_DIR
 
-morph = MorphAnalyzer()
+if TYPE_CHECKING:
+    from pymorphy3 import MorphAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# Константы
+LEMMA_CACHE_SIZE = 50000
+LEMMA_CACHE_PATH = DATA_DIR / "lemma_cache.json"
+
+_morph: Optional["MorphAnalyzer"] = None
+_morph_lock = threading.Lock()
+
+def get_morph() -> "MorphAnalyzer":
+    """Возвращает общий MorphAnalyzer, загружая словари pymorphy при первом обращении."""
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                from pymorphy3 import MorphAnalyzer
+                _morph = MorphAnalyzer()
+    return _morph
+
+class LemmaCacheStats(NamedTuple):
+    """Счетчики кэша лемм."""
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class LemmaCache:
+    """
+    Ограниченный LRU-кэш нормальных форм слов перед MorphAnalyzer.
+
+    Пользователи повторяют одни и те же слова, поэтому разбор pymorphy
+    выполняется только при первом появлении слова. Кэш можно сохранить
+    на диск и загрузить при старте, чтобы новый процесс начинал с прогретым кэшем.
+
+    Args:
+        get_analyzer: Функция, возвращающая морфологический анализатор с методом
+            ``parse``; вызывается только при промахе, так что загруженный с диска
+            кэш работает без загрузки словарей pymorphy
+        max_size: Максимальное количество слов в кэше
+    """
+
+    def __init__(self, get_analyzer: Callable[[], "MorphAnalyzer"], max_size: int = LEMMA_CACHE_SIZE) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size должен быть положительным")
+        self._get_analyzer = get_analyzer
+        self._max_size = max_size
+        self._lemmas: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, word: str) -> str:
+        """
+        Возвращает нормальную форму слова.
+
+        Raises:
+            IndexError, AttributeError: Если анализатор не смог разобрать слово
+        """
+        with self._lock:
+            lemma = self._lemmas.get(word)
+            if lemma is not None:
+                self._lemmas.move_to_end(word)
+                self._hits += 1
+                return lemma
+            self._misses += 1
+
+        lemma = self._get_analyzer().parse(word)[0].normal_form
+        with self._lock:
+            self._put(word, lemma)
+        return lemma
+
+    def _put(self, word: str, lemma: str) -> None:
+        self._lemmas[word] = lemma
+        self._lemmas.move_to_end(word)
+        while len(self._lemmas) > self._max_size:
+            self._lemmas.popitem(last=False)
+            self._evictions += 1
+
+    def update(self, lemmas: Dict[str, str]) -> None:
+        """Добавляет готовые леммы (например, посчитанные в других процессах)."""
+        with self._lock:
+            for word, lemma in lemmas.items():
+                self._put(word, lemma)
+
+    def missing(self, words: Iterable[str]) -> List[str]:
+        """
+        Возвращает уникальные слова, которых нет в кэше (в порядке первого появления).
+
+        Слова, найденные в кэше, считаются попаданиями, как при ``get``.
+        """
+        missing: Dict[str, None] = {}
+        with self._lock:
+            for word in words:
+                if word in missing:
+                    continue
+                if word in self._lemmas:
+                    self._lemmas.move_to_end(word)
+                    self._hits += 1
+                else:
+                    missing[word] = None
+        return list(missing)
+
+    def stats(self) -> LemmaCacheStats:
+        """Возвращает размер кэша и счетчики попаданий, промахов и вытеснений."""
+        with self._lock:
+            return LemmaCacheStats(len(self._lemmas), self._hits, self._misses, self._evictions)
+
+    def load(self, path: Path = LEMMA_CACHE_PATH) -> int:
+        """
+        Загружает сохраненный кэш. Отсутствующий или поврежденный файл игнорируется.
+
+        Returns:
+            int: Количество загруженных слов
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Не удалось загрузить кэш лемм из %s: %s", path, e)
+            return 0
+        with self._lock:
+            for word, lemma in data.items():
+                if isinstance(word, str) and isinstance(lemma, str):
+                    self._put(word, lemma)
+            loaded = len(self._lemmas)
+        logger.info("Загружено слов в кэш лемм: %s", loaded)
+        return loaded
+
+    def save(self, path: Path = LEMMA_CACHE_PATH) -> None:
+        """Атомарно сохраняет кэш на диск (от старых слов к недавним)."""
+        with self._lock:
+            data = dict(self._lemmas)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info("Кэш лемм сохранен: %s слов", len(data))
+
+lemma_cache = LemmaCache(get_morph)
+
+def lemmatize(word: str) -> str:
+    """Возвращает нормальную форму слова через общий кэш лемм."""
+    return lemma_cache.get(word)
+
+# Базовый словарь и пользовательские надстройки компилируются при первом обращении (или заранее, см. bot.startup)
+category_matcher = CategoryMatcher(get_base_map(), lemmatize, get_user_category_map)
+on_base_map_changed(category_matcher.set_base)
+on_mapping_added(category_matcher.add_user_mapping)
+on_user_unloaded(category_matcher.drop_user)
+
+# Сумма (целая или десятичная через точку или запятую) и комментарий, в том числе без пробела между ними
+MESSAGE_RE = re.compile(r"(\d+(?:[.,]\d+)?)[\s]*(.+)")
+MAX_COMMENT_LENGTH = 100
+
+class ParsedLine(NamedTuple):
+    """Результат разбора одной строки пакетного сообщения."""
+    text: str
+    amount: Optional[Decimal]
+    comment: Optional[str]
+    category: Optional[str]
+
+def split_amount(text: str) -> Tuple[Optional[Decimal], Optional[str]]:
+    """
+    Выделяет сумму и комментарий из строки без определения категории.
+
+    Returns:
+        Tuple[Optional[Decimal], Optional[str]]: (сумма, комментарий) или (None, None)
+    """
+    # Удаляем лишние пробелы и приводим к нижнему регистру
+    text = ' '.join(text.strip().lower().split())
+    
+    match = MESSAGE_RE.match(text)
+    if not match:
+        return None, None
+        
+    try:
+        # Заменяем запятую на точку для корректного парсинга десятичного числа
+        amount = Decimal(match.group(1).replace(',', '.'))
+    except (ValueError, TypeError, ArithmeticError):
+        return None, None
+        
+    # Проверяем, что сумма положительная
+    if amount <= 0:
+        return None, None
+        
+    comment = match.group(2).strip()
+    
+    # Проверяем длину комментария
+    if len(comment) > MAX_COMMENT_LENGTH:
+        return None, None
+    return amount, comment
 
 def parse_message(text: str, username: str) -> Tuple[Optional[Decimal], Optional[str], Optional[str]]:
     """
@@ -23,40 +233,62 @@ def parse_message(text: str, username: str) -> Tuple[Optional[Decimal], Optional
         Tuple[Optional[Decimal], Optional[str], Optional[str]]: (сумма, комментарий, категория)
         Если формат не распознан, возвращает (None, None, None)
     """
-    # Удаляем лишние пробелы и приводим к нижнему регистру
-    text = ' '.join(text.strip().lower().split())
-    
-    # Поддерживаем разные форматы чисел: целые и десятичные (через точку или запятую)
-    # Также поддерживаем формат без пробела между суммой и комментарием
-    match = re.match(r"(\d+(?:[.,]\d+)?)[\s]*(.+)", text)
-    if not match:
+    with timed("parse_regex"):
+        amount, comment = split_amount(text)
+    if amount is None:
         return None, None, None
-        
-    try:
-        # Заменяем запятую на точку для корректного парсинга десятичного числа
-        amount_str = match.group(1).replace(',', '.')
-        amount = Decimal(amount_str)
-        
-        # Проверяем, что сумма положительная
-        if amount <= 0:
-            return None, None, None
-            
-        comment = match.group(2).strip()
-        
-        # Проверяем длину комментария
-        if len(comment) > 100:  # Максимальная длина комментария
-            return None, None, None
-            
+    # Леммы считаются отдельно от поиска категории, чтобы их время было видно в метриках
+    with timed("parse_lemmatize"):
+        prefetch_lemmas(tokenize(comment))
+    with timed("parse_category_lookup"):
         category = match_category(comment, username)
-        return amount, comment, category
-        
-    except (ValueError, TypeError, ArithmeticError):
-        return None, None, None
+    return amount, comment, category
+
+def prefetch_lemmas(words: Iterable[str]) -> None:
+    """Лемматизирует каждое уникальное слово один раз, заполняя кэш лемм."""
+    for word in set(words):
+        try:
+            lemma_cache.get(word)
+        except (IndexError, AttributeError):
+            continue
+
+def parse_batch(
+    lines: Iterable[str],
+    username: str,
+    prefetch: Callable[[Iterable[str]], None] = prefetch_lemmas,
+) -> List[ParsedLine]:
+    """
+    Разбирает несколько строк "сумма комментарий" за один проход.
+
+    Сначала выделяются суммы и комментарии всех строк, затем уникальные
+    слова всех комментариев лемматизируются один раз (``prefetch`` можно
+    заменить, например, на параллельную лемматизацию), и только после этого
+    определяются категории.
+
+    Args:
+        lines: Строки сообщения или выписки; пустые строки пропускаются
+        username: Имя пользователя
+        prefetch: Функция, заранее заполняющая кэш лемм для набора слов
+
+    Returns:
+        List[ParsedLine]: По строке результата на каждую непустую строку;
+        у нераспознанных строк amount равен None
+    """
+    split = []
+    for line in lines:
+        if line.strip():
+            split.append((line.strip(), *split_amount(line)))
+    prefetch(word for _, _, comment in split if comment for word in tokenize(comment))
+    return [
+        ParsedLine(text, amount, comment, match_category(comment, username) if amount is not None else None)
+        for text, amount, comment in split
+    ]
 
 def match_category(comment: str, username: str) -> Optional[str]:
     """
     Находит категорию для комментария.
-    Сначала ищет полное совпадение, затем каждое слово в нормальной форме.
+    Сначала ищет полное совпадение, затем фразы словаря (в том числе многословные)
+    по нормальным формам слов.
     
     Args:
         comment: Комментарий к расходу
@@ -65,21 +297,4 @@ def match_category(comment: str, username: str) -> Optional[str]:
     Returns:
         Optional[str]: Найденная категория или None
     """
-    category_map = get_combined_category_map(username)
-    
-    # Проверяем полное совпадение комментария
-    if comment in category_map:
-        return category_map[comment]
-    
-    # Проверяем каждое слово в нормальной форме
-    words = comment.split()
-    for word in words:
-        try:
-            lemma = morph.parse(word)[0].normal_form
-            if lemma in category_map:
-                return category_map[lemma]
-        except (IndexError, AttributeError):
-            # Пропускаем слова, которые не удалось проанализировать
-            continue
-    
-    return None
\ No newline at end of file
+    return category_matcher.match(comment, username)
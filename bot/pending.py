@@ -0,0 +1,202 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from config.paths import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Константы
+PENDING_PATH = DATA_DIR / "pending.sqlite3"
+MAX_ENTRIES = 10000         # Максимум незавершенных выборов категории в памяти
+TTL = 24 * 60 * 60          # Через столько секунд выбор категории считается брошенным
+SWEEP_INTERVAL = 60.0       # Как часто удалять истекшие записи, в секундах
+
+# Комментарий и суммы расходов, ожидающих выбора категории
+Group = Tuple[str, List[Decimal]]
+Key = Tuple[str, int]  # (username, id сообщения с вопросом)
+
+
+class PendingStats(NamedTuple):
+    """Состояние хранилища незавершенных выборов категории."""
+    entries: int
+    expired: int
+    evicted: int
+
+
+class _Entry(NamedTuple):
+    groups: List[Group]
+    expires_at: float
+
+
+class PendingStore:
+    """
+    Незавершенные выборы категории: расходы, для которых бот задал вопрос
+    и ждет нажатия кнопки.
+
+    Запись определяется пользователем и id сообщения, на которое отвечает
+    вопрос (этот id передается в ``callback_data`` кнопок), поэтому у одного
+    пользователя может быть несколько вопросов одновременно. Записей в памяти
+    не больше ``max_entries`` (самые старые вытесняются), брошенные вопросы
+    удаляются через ``ttl`` секунд. Если задан ``path``, записи дублируются
+    в SQLite и переживают перезапуск бота.
+
+    Args:
+        path: Путь к файлу SQLite или None, чтобы хранить только в памяти
+        max_entries: Максимальное количество записей
+        ttl: Время жизни записи, в секундах
+        sweep_interval: Минимальный интервал между очистками истекших записей
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = PENDING_PATH,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = TTL,
+        sweep_interval: float = SWEEP_INTERVAL,
+    ) -> None:
+        if max_entries <= 0 or ttl <= 0:
+            raise ValueError("max_entries и ttl должны быть положительными")
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # Порядок вставки совпадает с порядком истечения: у всех записей одинаковый ttl,
+        # а обновленная запись переносится в конец
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._last_sweep = time.time()
+        self._expired = 0
+        self._evicted = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " username TEXT NOT NULL,"
+            " prompt_id INTEGER NOT NULL,"
+            " groups TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (username, prompt_id))"
+        )
+        now = time.time()
+        with self._conn:
+            self._conn.execute("DELETE FROM pending WHERE expires_at <= ?", (now,))
+        rows = self._conn.execute(
+            "SELECT username, prompt_id, groups, expires_at FROM pending ORDER BY expires_at DESC LIMIT ?",
+            (self._max_entries,),
+        ).fetchall()
+        for username, prompt_id, groups, expires_at in reversed(rows):
+            try:
+                self._entries[(username, prompt_id)] = _Entry(_decode(groups), expires_at)
+            except (ValueError, TypeError, ArithmeticError) as e:
+                logger.warning("Пропущена поврежденная запись выбора категории @%s: %s", username, e)
+        if rows:
+            logger.info("Восстановлено незавершенных выборов категории: %s", len(self._entries))
+
+    def put(self, username: str, prompt_id: int, groups: List[Group]) -> None:
+        """Сохраняет расходы, ожидающие выбора категории, и продлевает срок жизни записи."""
+        key = (username, prompt_id)
+        entry = _Entry(list(groups), time.time() + self._ttl)
+        evicted: List[Key] = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self._evicted += len(evicted)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)",
+                        (username, prompt_id, _encode(entry.groups), entry.expires_at),
+                    )
+                    self._conn.executemany("DELETE FROM pending WHERE username = ? AND prompt_id = ?", evicted)
+        if evicted:
+            logger.debug("Достигнут лимит незавершенных выборов категории, вытеснено: %s", len(evicted))
+        self._maybe_sweep()
+
+    def get(self, username: str, prompt_id: int) -> Optional[List[Group]]:
+        """
+        Возвращает запись, не удаляя её.
+
+        Returns:
+            Optional[List[Group]]: Ожидающие расходы или None, если записи нет или она истекла
+        """
+        with self._lock:
+            entry = self._entries.get((username, prompt_id))
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return list(entry.groups)
+
+    def take(self, username: str, prompt_id: int) -> Optional[List[Group]]:
+        """
+        Забирает запись (удаляя её из хранилища).
+
+        Returns:
+            Optional[List[Group]]: Ожидающие расходы или None, если записи нет
+            или она истекла (например, вопрос уже обработан)
+        """
+        key = (username, prompt_id)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM pending WHERE username = ? AND prompt_id = ?", key)
+        self._maybe_sweep()
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return entry.groups
+
+    def _maybe_sweep(self) -> None:
+        if time.time() - self._last_sweep >= self._sweep_interval:
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Удаляет истекшие записи. Возвращает количество удаленных."""
+        now = time.time()
+        expired: List[Key] = []
+        with self._lock:
+            self._last_sweep = now
+            while self._entries:
+                key, entry = next(iter(self._entries.items()))
+                if entry.expires_at > now:
+                    break
+                del self._entries[key]
+                expired.append(key)
+            self._expired += len(expired)
+            if expired and self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM pending WHERE expires_at <= ?", (now,))
+        if expired:
+            logger.info("Удалено брошенных выборов категории: %s", len(expired))
+        return len(expired)
+
+    def stats(self) -> PendingStats:
+        with self._lock:
+            return PendingStats(len(self._entries), self._expired, self._evicted)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _encode(groups: List[Group]) -> str:
+    return json.dumps([[comment, [str(a) for a in amounts]] for comment, amounts in groups], ensure_ascii=False)
+
+
+def _decode(data: str) -> List[Group]:
+    return [(comment, [Decimal(a) for a in amounts]) for comment, amounts in json.loads(data)]
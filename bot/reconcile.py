@@ -0,0 +1,189 @@
+"""
+Сверка локального хранилища с Google Таблицей.
+
+Если Sheets был недоступен дольше, чем живет очередь отправки (или строки
+были отброшены при ее переполнении), расходы остаются только локально.
+Сверка читает строки листа одним запросом ``get``, находит расходы за период,
+которых нет в листе, и дописывает их одним ``append_rows``.
+
+    python -m bot.reconcile --since 2025-06-01
+    python -m bot.reconcile --since 2025-06-01 --dry-run
+
+Работающий бот сам сверяет последние ``DEFAULT_DAYS`` дней раз в
+``RECONCILE_INTERVAL`` часов (задача JobQueue, см. ``reconcile_recent``).
+
+Строки, записанные до появления колонки идентификаторов, сопоставляются по
+содержимому: пользователь, комментарий, категория, сумма и время отправки не
+дальше ``LEGACY_TOLERANCE`` от времени расхода. Поэтому ни ручная, ни плановая
+сверка не дублирует в листе старые строки.
+В шардированном режиме сверка запускается для каждого шарда (DATA_DIR=data/shard-<i>).
+"""
+import argparse
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .logging_setup import setup_logging
+from .spreadsheet import ID_COLUMN, sheet_row
+from .storage import Expense, ExpenseStorage, amount_to_kopecks, expense_id
+
+logger = logging.getLogger(__name__)
+
+# Константы
+GRACE_PERIOD = timedelta(minutes=10)  # Свежие расходы еще могут быть в пути к Sheets
+DEFAULT_DAYS = 7                      # Период сверки по умолчанию
+# Старые строки листа хранят время отправки, а не записи расхода (отправка шла сразу после записи)
+LEGACY_TOLERANCE = timedelta(minutes=1)
+SHEET_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LegacyKey = Tuple[str, str, str, int]  # (пользователь, комментарий, категория, копейки)
+
+
+class ReconcileReport(NamedTuple):
+    """Итог сверки."""
+    local: int    # Расходов за период в хранилище
+    sheet: int    # Распознанных строк в листе: с идентификатором и старых, без него
+    queued: int   # Расходов за период, ожидающих отправки в очереди
+    missing: int  # Расходов, которых нет ни в листе, ни в очереди
+    pushed: int   # Дописано в лист
+
+
+def _legacy_key(username: str, comment: str, category: str, kopecks: int) -> LegacyKey:
+    return username, comment, category, kopecks
+
+
+def _parse_legacy_row(row: List[str]) -> Optional[Tuple[LegacyKey, datetime]]:
+    """Разбирает строку листа без идентификатора: время, сумма, категория, комментарий, пользователь."""
+    if len(row) < 5:
+        return None
+    try:
+        sent_at = datetime.strptime(row[0].strip(), SHEET_DATETIME_FORMAT)
+        amount = Decimal(row[1].strip().replace(" ", "").replace(",", "."))
+    except (ValueError, InvalidOperation):
+        return None  # заголовок или строка, заполненная вручную
+    return _legacy_key(row[4].strip(), row[3].strip(), row[2].strip(), amount_to_kopecks(amount)), sent_at
+
+
+def _take_legacy(legacy: Dict[LegacyKey, List[datetime]], expense: Expense) -> bool:
+    """Находит и вычеркивает старую строку листа, совпадающую с расходом по содержимому."""
+    times = legacy.get(_legacy_key(expense.username, expense.comment, expense.category,
+                                   amount_to_kopecks(expense.amount)))
+    if not times:
+        return False
+    for i, sent_at in enumerate(times):
+        if abs(sent_at - expense.datetime) <= LEGACY_TOLERANCE:
+            del times[i]
+            return True
+    return False
+
+
+def reconcile(
+    storage: ExpenseStorage,
+    worksheet: Any,
+    since: datetime,
+    until: datetime,
+    queued_ids: Iterable[str] = (),
+    id_column: str = ID_COLUMN,
+    dry_run: bool = False,
+) -> ReconcileReport:
+    """
+    Дописывает в лист расходы за период [since, until), которых в нем нет.
+
+    Идентификаторы сравниваются с учетом количества: у записей, сохраненных
+    до появления собственного идентификатора, он вычисляется из содержимого,
+    и две одинаковые такие записи должны встречаться в листе дважды. Строки
+    листа без идентификатора (записанные до его появления) сопоставляются
+    с расходами по содержимому, каждая — не больше чем с одним расходом.
+
+    Args:
+        storage: Локальное хранилище расходов
+        worksheet: Лист gspread или фейковый лист с методами ``get`` и ``append_rows``
+        since: Начало периода (включительно)
+        until: Конец периода (не включительно)
+        queued_ids: Идентификаторы строк, которые еще ждут отправки в очереди
+        id_column: Буква колонки с идентификаторами
+        dry_run: Только посчитать недостающие строки
+
+    Returns:
+        ReconcileReport: Счетчики сверки
+    """
+    id_index = ord(id_column.upper()) - ord("A")
+    in_sheet: Counter = Counter()
+    legacy: Dict[LegacyKey, List[datetime]] = defaultdict(list)
+    sheet_rows = 0
+    for row in worksheet.get(f"A:{id_column}"):
+        if len(row) > id_index and row[id_index].strip():
+            in_sheet[row[id_index].strip()] += 1
+            sheet_rows += 1
+            continue
+        parsed = _parse_legacy_row(row)
+        if parsed is not None:
+            legacy[parsed[0]].append(parsed[1])
+            sheet_rows += 1
+    in_queue = Counter(queued_ids)
+    local = queued = 0
+    missing: List[List[str]] = []
+    for expense in storage.iter_expenses(start=since, end=until):
+        local += 1
+        row_id = expense_id(expense)
+        if in_sheet[row_id] > 0:
+            in_sheet[row_id] -= 1
+        elif _take_legacy(legacy, expense):
+            continue
+        elif in_queue[row_id] > 0:
+            in_queue[row_id] -= 1
+            queued += 1
+        else:
+            missing.append(sheet_row(expense))
+    if missing and not dry_run:
+        worksheet.append_rows(missing)
+        logger.info("В Google Sheets дописано недостающих строк: %s", len(missing))
+    return ReconcileReport(local, sheet_rows, queued, len(missing), 0 if dry_run else len(missing))
+
+
+def reconcile_recent(days: int = DEFAULT_DAYS, dry_run: bool = False) -> ReconcileReport:
+    """
+    Сверяет последние ``days`` дней, кроме расходов моложе ``GRACE_PERIOD``.
+
+    Строки, ожидающие в очереди отправки, не считаются недостающими; снимок
+    очереди берется до чтения листа, поэтому строка, отправленная между ними,
+    найдется в листе.
+    """
+    from .spreadsheet import open_worksheet, sync_queue
+    from .storage import get_storage
+
+    now = datetime.now()
+    queued_ids = [row[5] for row in sync_queue.pending() if len(row) > 5]
+    return reconcile(get_storage(), open_worksheet(), now - timedelta(days=days), now - GRACE_PERIOD,
+                     queued_ids, dry_run=dry_run)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Push expenses missing from the Google Sheet in one batched call")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help=f"start of the period, YYYY-MM-DD[ HH:MM] (default: {DEFAULT_DAYS} days ago)")
+    parser.add_argument("--until", type=datetime.fromisoformat,
+                        help="end of the period (default: now minus the grace period)")
+    parser.add_argument("--dry-run", action="store_true", help="only count the missing rows")
+    args = parser.parse_args()
+
+    setup_logging(log_file=None)
+    from .spreadsheet import open_worksheet, sync_queue
+    from .storage import close_storage, get_storage
+
+    now = datetime.now()
+    since = args.since or now - timedelta(days=DEFAULT_DAYS)
+    until = args.until or now - GRACE_PERIOD
+    queued_ids = [row[5] for row in sync_queue.pending() if len(row) > 5]
+    try:
+        report = reconcile(get_storage(), open_worksheet(), since, until, queued_ids, dry_run=args.dry_run)
+    finally:
+        close_storage()
+    print(f"local: {report.local}, in sheet: {report.sheet}, queued: {report.queued}, "
+          f"missing: {report.missing}, pushed: {report.pushed}")
+
+
+if __name__ == "__main__":
+    main()
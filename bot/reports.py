@@ -0,0 +1,102 @@
+import re
+from datetime import date
+from typing import List, Tuple
+
+from .rollups import Rollups
+from .storage import kopecks_to_amount
+
+MONTH_NAMES = [
+    "январь", "февраль", "март", "апрель", "май", "июнь",
+    "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь",
+]
+
+REPORT_USAGE = """📊 Отчеты:
+/report — текущий месяц по категориям
+/report prev — прошлый месяц по категориям
+/report days — текущий месяц по дням
+/report days prev — прошлый месяц по дням
+/report 2025-06 — указанный месяц по категориям
+/report days 2025-06 — указанный месяц по дням"""
+
+_MONTH_RE = re.compile(r"^(\d{4})-(\d{1,2})$")
+
+
+def format_amount(kopecks: int) -> str:
+    """Форматирует сумму в копейках: 123450 -> «1 234.50 ₽»."""
+    amount = kopecks_to_amount(kopecks)
+    integer, _, fraction = str(amount).partition(".")
+    integer = f"{int(integer):,}".replace(",", " ")
+    return f"{integer}.{fraction} ₽" if fraction else f"{integer} ₽"
+
+
+def previous_month(year: int, month: int) -> Tuple[int, int]:
+    """Возвращает (год, месяц) предыдущего месяца."""
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def parse_report_args(args: List[str], today: date) -> Tuple[str, int, int]:
+    """
+    Разбирает аргументы /report.
+
+    Returns:
+        Tuple[str, int, int]: (вид отчета «categories» или «days», год, месяц)
+
+    Raises:
+        ValueError: Если аргументы не распознаны
+    """
+    kind = "categories"
+    year, month = today.year, today.month
+    for arg in (a.lower() for a in args):
+        if arg in ("days", "дни", "day"):
+            kind = "days"
+        elif arg in ("categories", "категории", "month", "месяц"):
+            kind = "categories"
+        elif arg in ("prev", "прошлый"):
+            year, month = previous_month(today.year, today.month)
+        elif _MONTH_RE.match(arg):
+            y, m = (int(x) for x in _MONTH_RE.match(arg).groups())
+            if not 1 <= m <= 12:
+                raise ValueError(f"Неверный месяц: {arg}")
+            year, month = y, m
+        else:
+            raise ValueError(f"Неизвестный параметр: {arg}")
+    return kind, year, month
+
+
+def _month_title(year: int, month: int) -> str:
+    return f"{MONTH_NAMES[month - 1].capitalize()} {year}"
+
+
+def build_report(rollups: Rollups, username: str, args: List[str], today: date) -> str:
+    """
+    Строит текст отчета из предагрегированных сумм.
+
+    Args:
+        rollups: Агрегаты расходов
+        username: Имя пользователя
+        args: Аргументы команды /report
+        today: Текущая дата (определяет «текущий» и «прошлый» месяц)
+
+    Raises:
+        ValueError: Если аргументы не распознаны
+    """
+    kind, year, month = parse_report_args(args, today)
+    title = _month_title(year, month)
+
+    if kind == "days":
+        totals = rollups.month_by_day(username, year, month)
+        if not totals:
+            return f"📊 {title}: расходов нет."
+        lines = [f"📊 {title} по дням:"]
+        lines += [f"{day:02d}.{month:02d} — {format_amount(totals[day])}" for day in sorted(totals)]
+    else:
+        totals = rollups.month_by_category(username, year, month)
+        if not totals:
+            return f"📊 {title}: расходов нет."
+        lines = [f"📊 {title} по категориям:"]
+        lines += [
+            f"{category} — {format_amount(kopecks)}"
+            for category, kopecks in sorted(totals.items(), key=lambda item: -item[1])
+        ]
+    lines.append(f"Итого: {format_amount(sum(totals.values()))}")
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from .storage import CATCH_UP_OVERLAP, CatchUpBuffer, Expense, ExpenseStorage, amount_to_kopecks
+
+logger = logging.getLogger(__name__)
+
+Month = Tuple[int, int]  # (год, месяц)
+
+
+class Rollups:
+    """
+    Предагрегированные суммы расходов в копейках: пользователь × месяц × категория
+    и пользователь × день × категория.
+
+    Суммы обновляются при каждой записи расхода и пересчитываются из истории
+    в фоне после старта, поэтому отчет за месяц читает несколько десятков чисел
+    вместо всех сохраненных расходов. Пока идет пересчет, ``ready`` ложно и
+    отчеты строятся из хранилища (``user_rollups``).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._monthly: Dict[str, Dict[Month, Dict[str, int]]] = {}
+        self._daily: Dict[str, Dict[Month, Dict[int, Dict[str, int]]]] = {}
+        self._catch_up = CatchUpBuffer()
+        self._ready = threading.Event()
+        self._ready.set()
+
+    def _add(self, username: str, day: date, category: str, kopecks: int) -> None:
+        month = (day.year, day.month)
+        by_category = self._monthly.setdefault(username, {}).setdefault(month, defaultdict(int))
+        by_category[category] += kopecks
+        days = self._daily.setdefault(username, {}).setdefault(month, {})
+        days.setdefault(day.day, defaultdict(int))[category] += kopecks
+
+    def add(self, expense: Expense) -> None:
+        """Учитывает новый расход."""
+        self.add_many([expense])
+
+    def add_many(self, expenses: List[Expense]) -> None:
+        """Учитывает новые расходы (во время пересчета — откладывает их до его конца)."""
+        with self._lock:
+            for e in self._catch_up.offer(expenses):
+                self._add(e.username, e.datetime.date(), e.category, amount_to_kopecks(e.amount))
+
+    @property
+    def ready(self) -> bool:
+        """Посчитаны ли суммы по всей истории."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Ждет конца пересчета не дольше ``timeout`` секунд; возвращает ``ready``."""
+        return self._ready.wait(timeout)
+
+    def begin_rebuild(self) -> None:
+        """Помечает суммы устаревшими до конца ``rebuild``; новые расходы откладываются."""
+        with self._lock:
+            self._catch_up.start()
+            self._ready.clear()
+
+    def rebuild(self, storage: ExpenseStorage, now: Optional[datetime] = None) -> None:
+        """
+        Пересчитывает суммы из истории хранилища.
+
+        История до ``now - CATCH_UP_OVERLAP`` читается суммами по дням, хвост —
+        поштучно; расходы, записанные во время пересчета, учитываются ровно
+        один раз (см. ``CatchUpBuffer``). Запись расходов пересчет не блокирует.
+
+        Args:
+            storage: Хранилище расходов
+            now: Текущий момент (по умолчанию ``datetime.now()``)
+        """
+        self.begin_rebuild()
+        cutoff = (now or datetime.now()) - CATCH_UP_OVERLAP
+        rollups = Rollups()
+        rows = 0
+        try:
+            for username, day, category, kopecks in storage.iter_daily_totals(end=cutoff):
+                rollups._add(username, day, category, kopecks)
+                rows += 1
+            tail = list(storage.iter_expenses(start=cutoff))
+        except BaseException:
+            # Суммы остаются неготовыми (отчеты идут из хранилища), но расходы больше не копятся
+            with self._lock:
+                self._catch_up.finish([], cutoff)
+            raise
+        with self._lock:
+            for e in self._catch_up.finish(tail, cutoff):
+                rollups._add(e.username, e.datetime.date(), e.category, amount_to_kopecks(e.amount))
+            self._monthly, self._daily = rollups._monthly, rollups._daily
+            self._ready.set()
+        logger.info("Агрегаты расходов пересчитаны: %s строк по дням, пользователей: %s", rows, len(self._monthly))
+
+    def month_by_category(self, username: str, year: int, month: int) -> Dict[str, int]:
+        """Возвращает суммы за месяц по категориям, в копейках."""
+        with self._lock:
+            return dict(self._monthly.get(username, {}).get((year, month), {}))
+
+    def month_category_total(self, username: str, year: int, month: int, category: str) -> int:
+        """Возвращает сумму категории за месяц, в копейках."""
+        with self._lock:
+            return self._monthly.get(username, {}).get((year, month), {}).get(category, 0)
+
+    def month_by_day(self, username: str, year: int, month: int) -> Dict[int, int]:
+        """Возвращает суммы за месяц по дням (день месяца -> копейки)."""
+        with self._lock:
+            days = self._daily.get(username, {}).get((year, month), {})
+            return {day: sum(categories.values()) for day, categories in days.items()}
+
+    def day_by_category(self, username: str, day: date) -> Dict[str, int]:
+        """Возвращает суммы за день по категориям, в копейках."""
+        with self._lock:
+            days = self._daily.get(username, {}).get((day.year, day.month), {})
+            return dict(days.get(day.day, {}))
+
+    def range_by_category(self, username: str, start: date, end: date) -> Dict[str, int]:
+        """Возвращает суммы по категориям за дни с ``start`` по ``end`` включительно, в копейках."""
+        totals: Dict[str, int] = defaultdict(int)
+        with self._lock:
+            months = self._daily.get(username, {})
+            year, month = start.year, start.month
+            while (year, month) <= (end.year, end.month):
+                for day, categories in months.get((year, month), {}).items():
+                    if start <= date(year, month, day) <= end:
+                        for category, kopecks in categories.items():
+                            totals[category] += kopecks
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return dict(totals)
+
+
+def user_rollups(storage: ExpenseStorage, username: str) -> Rollups:
+    """Считает агрегаты одного пользователя прямо из хранилища (пока общие агрегаты пересчитываются)."""
+    rollups = Rollups()
+    for e in storage.iter_expenses(username=username):
+        rollups._add(e.username, e.datetime.date(), e.category, amount_to_kopecks(e.amount))
+    return rollups
+
+
+# Общие агрегаты бота: обновляются в handlers.save_expenses, пересчитываются в фоне после старта
+rollups = Rollups()
@@ -0,0 +1,80 @@
+import logging
+from typing import Any, Dict
+
+from telegram.ext import Application, ApplicationBuilder
+from config.settings import (
+    BOT_TOKEN, CONCURRENT_UPDATES, BOT_MODE,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+    CONNECTION_POOL_SIZE, POOL_TIMEOUT, BOT_API_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Константы
+BOT_MODES = ("polling", "webhook")
+
+
+def application_builder() -> ApplicationBuilder:
+    """Возвращает построитель приложения с токеном, настройками параллельности и пула соединений."""
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .connection_pool_size(CONNECTION_POOL_SIZE)
+        .pool_timeout(POOL_TIMEOUT)
+    )
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL.rstrip('/')}/bot").base_file_url(f"{BOT_API_URL.rstrip('/')}/file/bot")
+    return builder
+
+
+def check_bot_mode() -> None:
+    """
+    Raises:
+        ValueError: Если BOT_MODE не polling и не webhook
+    """
+    if BOT_MODE not in BOT_MODES:
+        raise ValueError(f"BOT_MODE должен быть polling или webhook, получено: {BOT_MODE}")
+
+
+def webhook_options() -> Dict[str, Any]:
+    """
+    Параметры встроенного HTTP-сервера webhook (общие для ``run_webhook`` и ``Updater.start_webhook``).
+
+    Запросы без верного заголовка X-Telegram-Bot-Api-Secret-Token отклоняются
+    с кодом 403, поэтому WEBHOOK_SECRET обязателен.
+
+    Raises:
+        ValueError: Если не задан WEBHOOK_SECRET
+    """
+    if not WEBHOOK_SECRET:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET")
+    return {
+        "listen": WEBHOOK_LISTEN,
+        "port": WEBHOOK_PORT,
+        "url_path": WEBHOOK_PATH,
+        "webhook_url": WEBHOOK_URL or f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}",
+        "secret_token": WEBHOOK_SECRET,
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+    }
+
+
+def run_webhook(app: Application) -> None:
+    """
+    Принимает обновления встроенным HTTP-сервером (нужен python-telegram-bot[webhooks]).
+
+    Raises:
+        ValueError: Если не задан WEBHOOK_SECRET
+    """
+    options = webhook_options()
+    logger.info("Бот запущен в режиме webhook на %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+    app.run_webhook(**options)
+
+
+def run(app: Application) -> None:
+    """Принимает обновления в режиме BOT_MODE (polling или webhook) до остановки процесса."""
+    if BOT_MODE == "webhook":
+        run_webhook(app)
+    else:
+        logger.info("Бот запущен и ожидает сообщения...")
+        app.run_polling()
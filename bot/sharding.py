@@ -0,0 +1,293 @@
+"""
+Шардированный режим: несколько процессов-обработчиков на одной машине.
+
+Разбор и лемматизация упираются в GIL, поэтому один процесс использует одно
+ядро. Здесь диспетчер принимает обновления (polling или webhook, см. BOT_MODE)
+и по хэшу имени пользователя передает каждое одному из N воркеров. Воркер —
+обычный бот из bot.main со своим каталогом данных DATA_DIR/shard-<i>:
+хранилищем, незавершенными выборами категории, кэшем лемм и очередью Google
+Sheets. Обновления пользователя всегда попадают в один и тот же воркер, поэтому
+его файлы (включая словарь config/user_dicts/<user>.jsonl) пишет только один
+процесс. Ответы воркеры отправляют в Bot API сами, лог пишет диспетчер.
+
+    python -m bot.sharding --shards 4
+    python -m bot.sharding --shards 4 --split   # разложить существующие расходы по шардам
+
+Отчеты, выгрузка и /stats воркера видят только его шард; у каждого воркера свой
+эндпоинт метрик на порту METRICS_PORT + 1 + номер шарда.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from .logging_setup import forward_logging, setup_logging
+from .metrics import metrics, start_metrics_server
+from .serving import application_builder, check_bot_mode, run
+from config.settings import METRICS_HOST, METRICS_PORT, SHARD_QUEUE_SIZE, SHARDS
+
+logger = logging.getLogger(__name__)
+
+# Константы
+STARTUP_TIMEOUT = 120  # Сколько ждать готовности воркеров при запуске, в секундах
+SHUTDOWN_TIMEOUT = 30  # Сколько ждать завершения воркера после сигнала остановки, в секундах
+POLL_INTERVAL = 1.0  # Как часто воркер проверяет, жив ли диспетчер, в секундах
+SPLIT_BATCH_SIZE = 1000  # Расходов в одной записи при раскладке по шардам
+
+
+def shard_for(username: Optional[str], user_id: Optional[int], shards: int) -> int:
+    """
+    Возвращает номер шарда пользователя.
+
+    Ключ — имя пользователя, как и у всех данных бота; для пользователей без
+    имени — id. crc32 не зависит от PYTHONHASHSEED, поэтому номер одинаков
+    во всех процессах и между перезапусками.
+    """
+    key = username or (str(user_id) if user_id is not None else "")
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+def shard_data_dir(data_dir: Path, index: int) -> Path:
+    """Каталог данных шарда ``index``."""
+    return data_dir / f"shard-{index}"
+
+
+def _next_update(updates: "multiprocessing.Queue", parent_pid: int) -> Optional[Dict[str, Any]]:
+    """Ждет следующее обновление; None — сигнал остановки или завершение диспетчера."""
+    while True:
+        try:
+            return updates.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                return None
+
+
+async def _serve(bot: Any, timer: Any, index: int, metrics_port: int,
+                 updates: "multiprocessing.Queue", ready: "multiprocessing.Queue", parent_pid: int) -> None:
+    app = bot.build_application(updater=False)
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.start()
+        await bot.startup_hook(timer, metrics_port)(app)
+        ready.put(index)
+        try:
+            while True:
+                data = await loop.run_in_executor(None, _next_update, updates, parent_pid)
+                if data is None:
+                    break
+                await app.update_queue.put(Update.de_json(data, app.bot))
+        finally:
+            await app.stop()
+    await bot.on_shutdown(app)
+
+
+def _worker_main(index: int, data_dir: str, updates: "multiprocessing.Queue", ready: "multiprocessing.Queue",
+                 log_records: "multiprocessing.Queue", parent_pid: int) -> None:
+    """Точка входа процесса-воркера шарда ``index``."""
+    # Останавливает воркер диспетчер (через очередь), а не сигнал терминала
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Пути к данным вычисляются при импорте модулей бота, поэтому окружение задается до импорта
+    os.environ["DATA_DIR"] = str(shard_data_dir(Path(data_dir), index))
+    forward_logging(log_records)
+    from .startup import StartupTimer
+
+    timer = StartupTimer()
+    from . import main as bot
+
+    timer.mark("импорт")
+    bot.prepare(timer)
+    metrics_port = METRICS_PORT + 1 + index if METRICS_PORT else 0
+    asyncio.run(_serve(bot, timer, index, metrics_port, updates, ready, parent_pid))
+
+
+class ShardPool:
+    """
+    Процессы-воркеры и их очереди обновлений.
+
+    Args:
+        shards: Число воркеров
+        data_dir: Общий каталог данных; воркер ``i`` работает в ``data_dir/shard-<i>``
+        log_records: Очередь, в которую воркеры отправляют записи лога
+        queue_size: Размер очереди обновлений воркера; когда она заполнена,
+            диспетчер ждет, а не копит обновления в памяти
+    """
+
+    def __init__(self, shards: int, data_dir: Path, log_records: "multiprocessing.Queue",
+                 queue_size: int = SHARD_QUEUE_SIZE) -> None:
+        if shards < 1:
+            raise ValueError("Число шардов должно быть положительным")
+        self._context = multiprocessing.get_context("spawn")
+        self.shards = shards
+        self._data_dir = data_dir
+        self._log_records = log_records
+        self._queues = [self._context.Queue(queue_size) for _ in range(shards)]
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self, timeout: float = STARTUP_TIMEOUT) -> None:
+        """
+        Запускает воркеры и ждет, пока все будут готовы принимать обновления.
+
+        Raises:
+            RuntimeError: Если воркер завершился или не успел запуститься
+        """
+        ready = self._context.Queue()
+        for index, updates in enumerate(self._queues):
+            process = self._context.Process(
+                target=_worker_main, name=f"bot-shard-{index}",
+                args=(index, str(self._data_dir), updates, ready, self._log_records, os.getpid()),
+            )
+            process.start()
+            self._processes.append(process)
+        started = set()
+        deadline = time.monotonic() + timeout
+        while len(started) < self.shards:
+            try:
+                started.add(ready.get(timeout=POLL_INTERVAL))
+                continue
+            except queue.Empty:
+                pass
+            dead = [p.name for p in self._processes if not p.is_alive()]
+            if dead:
+                raise RuntimeError(f"Воркеры завершились при запуске: {', '.join(dead)}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Воркеры не запустились за {timeout} с: готовы {sorted(started)}")
+        logger.info("Запущено воркеров: %s", self.shards)
+
+    def queue_depth(self, index: int) -> int:
+        return self._queues[index].qsize()
+
+    def put(self, index: int, data: Dict[str, Any]) -> None:
+        """Передает обновление воркеру (блокируется, если его очередь заполнена)."""
+        self._queues[index].put(data)
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Просит воркеры обработать принятые обновления и завершиться; зависшие завершает принудительно."""
+        for process, updates in zip(self._processes, self._queues):
+            if process.is_alive():
+                updates.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.error("Воркер %s не завершился за %s с, останавливаем принудительно", process.name, timeout)
+                process.kill()
+                process.join()
+        self._processes = []
+
+
+def build_dispatcher(pool: ShardPool) -> Application:
+    """
+    Собирает приложение диспетчера: единственный обработчик передает обновление воркеру.
+
+    Обновления разбираются по одному, поэтому порядок сообщений пользователя сохраняется.
+    """
+    async def route(update: Update, context) -> None:
+        user = update.effective_user
+        index = shard_for(user.username if user else None, user.id if user else None, pool.shards)
+        # Запись в очередь процесса может ждать места — не блокируем прием обновлений
+        await asyncio.get_running_loop().run_in_executor(None, pool.put, index, update.to_dict())
+        metrics.inc("bot_routed_updates_total")
+
+    app = application_builder().concurrent_updates(False).build()
+    app.add_handler(TypeHandler(Update, route))
+    return app
+
+
+def split_storage(data_dir: Path, shards: int) -> List[int]:
+    """
+    Раскладывает расходы из общего хранилища ``data_dir`` по хранилищам шардов.
+
+    Нужна один раз при переходе на шардированный режим. Очередь Google Sheets
+    нужно предварительно отправить обычным запуском бота.
+
+    Returns:
+        List[int]: Число перенесенных расходов в каждом шарде
+
+    Raises:
+        RuntimeError: Если хранилище шарда уже не пустое
+    """
+    from .storage import CSV_PATH, SQLITE_PATH, CSVStorage, SQLiteStorage, close_storage, get_storage
+
+    backend = os.getenv("STORAGE_BACKEND", "sqlite")
+    targets = []
+    for index in range(shards):
+        directory = shard_data_dir(data_dir, index)
+        directory.mkdir(parents=True, exist_ok=True)
+        if backend == "csv":
+            targets.append(CSVStorage(directory / CSV_PATH.name))
+        else:
+            targets.append(SQLiteStorage(directory / SQLITE_PATH.name))
+    counts = [0] * shards
+    try:
+        for index, target in enumerate(targets):
+            if target.count():
+                raise RuntimeError(f"Хранилище шарда {index} не пустое, раскладка уже выполнялась")
+        batches: List[list] = [[] for _ in range(shards)]
+        for expense in get_storage().iter_expenses():
+            index = shard_for(expense.username, None, shards)
+            batches[index].append(expense)
+            if len(batches[index]) >= SPLIT_BATCH_SIZE:
+                targets[index].add_many(batches[index])
+                counts[index] += len(batches[index])
+                batches[index] = []
+        for index, batch in enumerate(batches):
+            if batch:
+                targets[index].add_many(batch)
+                counts[index] += len(batch)
+    finally:
+        for target in targets:
+            target.close()
+        close_storage()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the bot as a dispatcher and N worker processes sharded by username")
+    parser.add_argument("--shards", type=int, default=SHARDS, help="number of worker processes")
+    parser.add_argument("--split", action="store_true",
+                        help="copy expenses from DATA_DIR into the per-shard storages and exit")
+    args = parser.parse_args()
+
+    from config.paths import DATA_DIR
+
+    if args.split:
+        setup_logging(log_file=None)
+        try:
+            counts = split_storage(DATA_DIR, args.shards)
+        except RuntimeError as e:
+            parser.error(str(e))
+        for index, count in enumerate(counts):
+            print(f"shard-{index}: {count}")
+        return
+
+    check_bot_mode()
+    log_records = multiprocessing.get_context("spawn").Queue()
+    setup_logging(records=log_records)
+    # Перенос старого общего словаря до запуска воркеров: иначе его начнут переносить все сразу
+    from .categories import load_custom_keywords
+
+    load_custom_keywords()
+    pool = ShardPool(args.shards, DATA_DIR, log_records)
+    for index in range(pool.shards):
+        metrics.gauge(f"bot_shard_{index}_queue_depth", f"Обновления в очереди воркера {index}",
+                      lambda index=index: pool.queue_depth(index))
+    try:
+        pool.start()
+        if METRICS_PORT:
+            start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+        run(build_dispatcher(pool))
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
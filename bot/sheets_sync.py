@@ -0,0 +1,360 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Iterator, List, NamedTuple, Optional, Tuple
+
+from config.paths import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Константы
+QUEUE_PATH = DATA_DIR / "sheets_queue.jsonl"
+MAX_QUEUE_SIZE = 10000      # Максимум строк очереди в памяти; остальные ждут в файле
+BATCH_SIZE = 50             # Отправляем пачку, как только накопилось столько строк
+FLUSH_INTERVAL = 5.0        # ...или через столько секунд после первой строки в очереди
+INITIAL_BACKOFF = 1.0       # Первая пауза после ошибки Sheets
+MAX_BACKOFF = 300.0         # Максимальная пауза между повторами
+COMPACT_BYTES = 1 << 20     # Отправленная часть журнала, после которой он переписывается
+
+
+class SyncStats(NamedTuple):
+    """Состояние очереди синхронизации с Google Sheets."""
+    queue_depth: int
+    flushed_rows: int
+    # Строки сверх лимита памяти: хранятся только в файле очереди и подгружаются по мере отправки
+    spilled_rows: int
+    failed_attempts: int
+    last_flush_latency: Optional[float]
+    last_error: Optional[str]
+
+
+def _encode(row: List[str]) -> bytes:
+    return (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class SheetsSyncQueue:
+    """
+    Очередь отложенной записи строк в Google Sheets.
+
+    Строки дописываются в JSONL-журнал на диске, а фоновый поток отправляет
+    их пачками через ``append_rows``. Журнал только дописывается: после
+    успешной отправки сохраняется смещение первой неотправленной строки
+    (файл ``<журнал>.offset``), а сам журнал обнуляется, когда отправлено
+    все, или переписывается, когда отправленная часть больше ``COMPACT_BYTES``
+    и половины файла. Поэтому запись строки и отправка пачки не зависят от
+    длины очереди. Пока Sheets недоступен, поток повторяет попытки
+    с экспоненциальной паузой, а строки остаются в журнале и переживают рестарт.
+
+    В памяти держится не больше ``max_size`` строк. Строки сверх лимита не
+    отбрасываются: они остаются только в журнале и подгружаются по мере
+    отправки. Без журнала (``queue_path=None``) все строки хранятся в памяти.
+    При отправке пачки (и после рестарта) может повториться пачка, отправленная
+    перед сбоем, — по идентификаторам ее находит ``bot.reconcile``.
+
+    Args:
+        worksheet_factory: Функция, открывающая лист (вызывается один раз
+            и повторно только после ошибки). Для тестов можно передать
+            фабрику локального фейкового листа с методом ``append_rows``.
+        queue_path: Путь к журналу очереди или None, чтобы хранить только в памяти
+        max_size: Максимум строк очереди в памяти
+        batch_size: Размер пачки для ``append_rows``
+        flush_interval: Максимальное время ожидания неполной пачки, в секундах
+    """
+
+    def __init__(
+        self,
+        worksheet_factory: Callable[[], Any],
+        queue_path: Optional[Path] = QUEUE_PATH,
+        max_size: int = MAX_QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        initial_backoff: float = INITIAL_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ) -> None:
+        if max_size <= 0 or batch_size <= 0:
+            raise ValueError("max_size и batch_size должны быть положительными")
+        self._worksheet_factory = worksheet_factory
+        self._worksheet: Any = None
+        self._queue_path = queue_path
+        self._offset_path = queue_path.with_suffix(queue_path.suffix + ".offset") if queue_path else None
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+
+        # Строки в памяти с длиной их записи в журнале, в порядке журнала
+        self._rows: Deque[Tuple[List[str], int]] = deque()
+        self._committed = 0   # Смещение первой неотправленной строки в журнале
+        self._window_end = 0  # Смещение, с которого подгружаются строки сверх памяти
+        self._file_end = 0    # Размер журнала
+        self._spilled = 0     # Строк в журнале за пределами памяти
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_at_exit = False  # stop() уже зарегистрирован в atexit
+        self._oldest_enqueued_at: Optional[float] = None
+        self._backoff = 0.0
+
+        self._flushed_rows = 0
+        self._failed_attempts = 0
+        self._last_flush_latency: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+        self._load()
+
+    def _read_offset(self) -> int:
+        try:
+            return int(self._offset_path.read_text(encoding="utf-8").strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать смещение очереди Sheets, журнал будет отправлен целиком: %s", e)
+            return 0
+
+    def _write_offset(self, offset: int) -> None:
+        tmp_path = self._offset_path.with_suffix(self._offset_path.suffix + ".tmp")
+        tmp_path.write_text(str(offset), encoding="utf-8")
+        os.replace(tmp_path, self._offset_path)
+
+    def _load(self) -> None:
+        """Восстанавливает неотправленные строки из журнала."""
+        if self._queue_path is None or not self._queue_path.exists():
+            return
+        offset = self._read_offset()
+        with open(self._queue_path, "rb+") as f:
+            data = f.read()
+            # Недописанная при сбое последняя строка отрезается, иначе к ней приклеится следующая
+            valid_end = data.rfind(b"\n") + 1
+            if valid_end < len(data):
+                f.truncate(valid_end)
+        # Смещение больше файла остается, если сбой случился между сжатием журнала и записью смещения
+        self._committed = self._window_end = offset if offset <= valid_end else 0
+        self._file_end = valid_end
+        self._spilled = data.count(b"\n", self._committed, valid_end)
+        self._refill()
+        if self._rows:
+            self._oldest_enqueued_at = time.monotonic()
+            logger.info("Восстановлено строк в очереди Sheets: %s", len(self._rows) + self._spilled)
+
+    def _read_rows(self, start: int, limit: Optional[int]) -> Iterator[Tuple[List[str], int]]:
+        """Читает строки журнала, начиная со смещения ``start``: (строка или None, длина записи)."""
+        with open(self._queue_path, "rb") as f:
+            f.seek(start)
+            read = 0
+            for raw in f:
+                if limit is not None and read >= limit:
+                    return
+                read += 1
+                try:
+                    yield json.loads(raw), len(raw)
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    logger.warning("Пропущена повреждённая строка очереди Sheets: %r", raw[:100])
+                    yield None, len(raw)
+
+    def _refill(self) -> None:
+        """Подгружает в память строки, ожидающие в журнале сверх лимита."""
+        if not self._spilled or len(self._rows) >= self._max_size:
+            return
+        skipped = 0
+        for row, size in self._read_rows(self._window_end, self._max_size - len(self._rows)):
+            self._window_end += size
+            self._spilled -= 1
+            if row is None:
+                # Поврежденная запись учитывается в смещении, но не отправляется
+                if self._rows:
+                    last, last_size = self._rows.pop()
+                    self._rows.append((last, last_size + size))
+                else:
+                    skipped += size
+                continue
+            self._rows.append((row, size))
+        if skipped:
+            self._committed += skipped
+
+    def enqueue(self, row: List[str]) -> None:
+        """
+        Ставит строку в очередь на отправку. Не обращается к сети.
+
+        Args:
+            row: Значения ячеек строки
+        """
+        self.enqueue_many([row])
+
+    def enqueue_many(self, rows: List[List[str]]) -> None:
+        """Ставит строки в очередь одной записью в журнал. Не обращается к сети."""
+        if not rows:
+            return
+        encoded = [_encode(row) for row in rows]
+        with self._cond:
+            if self._queue_path is not None:
+                self._queue_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self._queue_path, "ab") as f:
+                    f.write(b"".join(encoded))
+            for row, data in zip(rows, encoded):
+                self._file_end += len(data)
+                if self._queue_path is not None and (self._spilled or len(self._rows) >= self._max_size):
+                    self._spilled += 1
+                else:
+                    self._rows.append((row, len(data)))
+                    self._window_end += len(data)
+            if self._oldest_enqueued_at is None:
+                self._oldest_enqueued_at = time.monotonic()
+            self._cond.notify()
+
+    def _commit(self) -> None:
+        """Сдвигает смещение после отправки; обнуляет или сжимает журнал."""
+        if self._queue_path is None:
+            return
+        if not self._rows and not self._spilled:
+            # Отправлено все: журнал обнуляется до записи смещения, поэтому сбой между ними ничего не повторит
+            with open(self._queue_path, "wb"):
+                pass
+            self._committed = self._window_end = self._file_end = 0
+        elif self._committed > COMPACT_BYTES and self._committed * 2 > self._file_end:
+            tmp_path = self._queue_path.with_suffix(self._queue_path.suffix + ".tmp")
+            with open(self._queue_path, "rb") as src, open(tmp_path, "wb") as dst:
+                src.seek(self._committed)
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, self._queue_path)
+            self._window_end -= self._committed
+            self._file_end -= self._committed
+            self._committed = 0
+        self._write_offset(self._committed)
+
+    def flush(self) -> int:
+        """
+        Отправляет одну пачку строк в Sheets синхронно.
+
+        Returns:
+            int: Количество отправленных строк
+
+        Raises:
+            Exception: Ошибка открытия листа или ``append_rows``; строки
+                при этом остаются в очереди
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = [row for _, (row, _) in zip(range(self._batch_size), self._rows)]
+                if self._spilled:
+                    logger.warning("Очередь Sheets больше лимита памяти (%s): %s строк ждут в журнале",
+                                   self._max_size, self._spilled)
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                if self._worksheet is None:
+                    self._worksheet = self._worksheet_factory()
+                self._worksheet.append_rows(batch)
+            except Exception as e:
+                # Хэндл мог протухнуть, при следующей попытке откроем лист заново
+                self._worksheet = None
+                with self._cond:
+                    self._failed_attempts += 1
+                    self._last_error = str(e)
+                raise
+
+            with self._cond:
+                for _ in range(len(batch)):
+                    self._committed += self._rows.popleft()[1]
+                self._refill()
+                self._commit()
+                self._flushed_rows += len(batch)
+                self._last_flush_latency = time.perf_counter() - started
+                self._last_error = None
+                self._oldest_enqueued_at = time.monotonic() if self._rows else None
+            logger.info("В Google Sheets отправлено строк: %s за %.3f с", len(batch), self._last_flush_latency)
+            return len(batch)
+
+    def flush_all(self) -> int:
+        """Отправляет все строки из очереди. Возвращает количество отправленных строк."""
+        total = 0
+        while True:
+            sent = self.flush()
+            if not sent:
+                return total
+            total += sent
+
+    def _ready(self) -> bool:
+        if not self._rows:
+            return False
+        if len(self._rows) >= self._batch_size:
+            return True
+        return time.monotonic() - self._oldest_enqueued_at >= self._flush_interval
+
+    def _wait_timeout(self) -> Optional[float]:
+        if not self._rows:
+            return None
+        return max(0.0, self._flush_interval - (time.monotonic() - self._oldest_enqueued_at))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set() and not self._ready():
+                    self._cond.wait(self._wait_timeout())
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+                self._backoff = 0.0
+            except Exception as e:
+                self._backoff = min(self._max_backoff, max(self._initial_backoff, self._backoff * 2))
+                logger.warning("Не удалось отправить строки в Google Sheets: %s. Повтор через %.1f с", e, self._backoff)
+                self._stop.wait(self._backoff)
+
+    def start(self) -> None:
+        """Запускает фоновый поток отправки, если он ещё не запущен."""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+            self._thread.start()
+            if not self._stop_at_exit:
+                atexit.register(self.stop)
+                self._stop_at_exit = True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Останавливает фоновый поток и пытается отправить остаток очереди.
+        Неотправленные строки остаются в файле до следующего запуска.
+        """
+        with self._cond:
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        try:
+            self.flush_all()
+        except Exception as e:
+            logger.warning("Остаток очереди Sheets не отправлен при остановке: %s", e)
+
+    def pending(self) -> List[List[str]]:
+        """Возвращает строки, ожидающие отправки, включая ждущие в журнале сверх лимита памяти."""
+        with self._cond:
+            rows = [row for row, _ in self._rows]
+            if self._spilled:
+                rows += [row for row, _ in self._read_rows(self._window_end, None) if row is not None]
+            return rows
+
+    def stats(self) -> SyncStats:
+        """Возвращает глубину очереди, счетчики и задержку последней отправки."""
+        with self._cond:
+            return SyncStats(
+                queue_depth=len(self._rows) + self._spilled,
+                flushed_rows=self._flushed_rows,
+                spilled_rows=self._spilled,
+                failed_attempts=self._failed_attempts,
+                last_flush_latency=self._last_flush_latency,
+                last_error=self._last_error,
+            )
@@ -1,18 +1,64 @@
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
-from decimal import Decimal
+import threading
+from typing import TYPE_CHECKING, List
+from .sheets_sync import SheetsSyncQueue, SyncStats
+from .storage import Expense, expense_id
+
+if TYPE_CHECKING:
+    import gspread
 
 # Путь к credentials.json
 SERVICE_ACCOUNT_FILE = "config/credentials.json"
 SPREADSHEET_ID = "1MsCZAkWvn38XQ7trEx2hPl5SsgIcjwGu_Q2da1COOY8"
 SHEET_NAME = "Лист1"
+# Колонка с идентификатором расхода (A — время, B — сумма, C — категория, D — комментарий, E — пользователь)
+ID_COLUMN = "F"
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
 
-def save_to_google_sheets(amount: Decimal, category: str, comment: str, username: str) -> None:
-    client = gspread.authorize(credentials)
-    sheet = client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    sheet.append_row([now, str(amount), category, comment, username])
\ No newline at end of file
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> "gspread.Client":
+    """
+    Возвращает авторизованный клиент gspread, создавая его один раз.
+
+    gspread и ключ сервисного аккаунта загружаются только здесь, поэтому импорт
+    модуля не требует credentials.json и не замедляет старт бота.
+
+    Raises:
+        FileNotFoundError: Если нет файла credentials.json
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import gspread
+            from google.oauth2.service_account import Credentials
+            credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+            _client = gspread.authorize(credentials)
+        return _client
+
+def open_worksheet() -> "gspread.Worksheet":
+    """Открывает рабочий лист. Хэндл кэширует очередь синхронизации."""
+    return get_client().open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
+
+sync_queue = SheetsSyncQueue(open_worksheet)
+
+def sheet_row(expense: Expense) -> List[str]:
+    """Строка листа для расхода: время записи расхода (а не отправки) и его идентификатор."""
+    return [
+        expense.datetime.strftime("%Y-%m-%d %H:%M:%S"), str(expense.amount),
+        expense.category, expense.comment, expense.username, expense_id(expense),
+    ]
+
+def save_to_google_sheets(expense: Expense) -> None:
+    """Ставит строку расхода в очередь отложенной записи в Google Sheets."""
+    save_many_to_google_sheets([expense])
+
+def save_many_to_google_sheets(expenses: List[Expense]) -> None:
+    """Ставит строки расходов в очередь отложенной записи в Google Sheets одной записью в журнал."""
+    sync_queue.enqueue_many([sheet_row(e) for e in expenses])
+    sync_queue.start()
+
+def get_sync_stats() -> SyncStats:
+    """Возвращает глубину очереди и задержку последней отправки в Sheets."""
+    return sync_queue.stats()
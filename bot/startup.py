@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Константы
+WARMUP_MODES = ("eager", "background", "lazy")
+
+
+class StartupTimer:
+    """
+    Замеряет этапы запуска бота.
+
+    Args:
+        started: Момент начала отсчета по ``time.perf_counter`` (по умолчанию — создание таймера)
+    """
+
+    def __init__(self, started: Optional[float] = None) -> None:
+        self._started = time.perf_counter() if started is None else started
+        self._last = self._started
+        self._lock = threading.Lock()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> None:
+        """Записывает этап, длившийся с конца предыдущего этапа до текущего момента."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((name, now - self._last))
+            self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замеряет этап, выполняемый внутри блока ``with``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.phases.append((name, finished - started))
+                self._last = max(self._last, finished)
+
+    @property
+    def elapsed(self) -> float:
+        """Время с начала отсчета, в секундах."""
+        return time.perf_counter() - self._started
+
+    def report(self) -> str:
+        """Возвращает разбивку по этапам одной строкой."""
+        with self._lock:
+            parts = [f"{name}: {seconds * 1000:.0f} мс" for name, seconds in self.phases]
+        return f"{self.elapsed * 1000:.0f} мс ({', '.join(parts)})"
+
+
+def warm_up(timer: StartupTimer) -> None:
+    """
+    Заранее загружает тяжелые ресурсы, которые иначе загрузятся при первом сообщении:
+    словари pymorphy, скомпилированный базовый словарь категорий, индекс подсказок
+    по базовому словарю и клиент Google Sheets.
+    Ошибка одного этапа не мешает остальным.
+    """
+    from .handlers import fuzzy_index
+    from .parser import category_matcher, get_morph
+    from .spreadsheet import get_client
+
+    steps = (
+        ("словари pymorphy", get_morph),
+        ("словарь категорий", category_matcher.warm),
+        ("индекс подсказок", fuzzy_index.warm),
+        ("клиент Google Sheets", get_client),
+    )
+    for name, step in steps:
+        try:
+            with timer.phase(name):
+                step()
+        except Exception as e:
+            logger.warning("Прогрев «%s» не удался, ресурс загрузится при первом обращении: %s", name, e)
+
+
+def start_background_sync(timer: StartupTimer, steps: Sequence[Tuple[str, Callable[[], None]]]) -> threading.Thread:
+    """
+    Пересчитывает данные из хранилища (агрегаты, аналитику) в фоновом потоке,
+    чтобы бот принимал обновления, не дожидаясь чтения всей истории.
+    Ошибка одного этапа не мешает остальным.
+    """
+    def run() -> None:
+        for name, step in steps:
+            try:
+                with timer.phase(name):
+                    step()
+            except Exception as e:
+                logger.exception("Фоновый пересчет «%s» не удался: %s", name, e)
+        logger.info("Фоновый пересчет из хранилища завершен: %s", timer.report())
+
+    thread = threading.Thread(target=run, name="storage-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_background_warm_up(timer: StartupTimer) -> threading.Thread:
+    """Запускает ``warm_up`` в фоновом потоке и логирует разбивку по его завершении."""
+    def run() -> None:
+        warm_up(timer)
+        logger.info("Фоновый прогрев завершен: %s", timer.report())
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,714 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from config.paths import DATA_DIR
+from .logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Константы
+CSV_PATH = DATA_DIR / "expenses.csv"
+SQLITE_PATH = DATA_DIR / "expenses.sqlite3"
+QUARANTINE_PATH = DATA_DIR / "expenses_quarantine.csv"
+CSV_HEADER = ['datetime', 'amount', 'category', 'comment', 'username']
+CSV_ID_FIELD = 'id'        # Колонка идентификатора; в файлах старого формата ее нет
+WRITE_BATCH_SIZE = 500     # Максимум строк в одной транзакции писателя
+READ_CHUNK_SIZE = 1000     # Строк за один fetchmany при чтении
+# Хвост истории, который пересчет читает поштучно: расход получает время перед самой записью,
+# поэтому записанный во время пересчета расход всегда попадает в этот хвост
+CATCH_UP_OVERLAP = timedelta(minutes=10)
+
+_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d{1,6})?$")
+
+
+class Expense(NamedTuple):
+    """Запись о расходе."""
+    datetime: datetime
+    amount: Decimal
+    category: str
+    comment: str
+    username: str
+    # Идентификатор, присвоенный при записи (new_expense_id); пустой у записей, сделанных до его появления
+    id: str = ""
+
+
+def amount_to_kopecks(amount: Decimal) -> int:
+    """Переводит сумму в рублях в целое число копеек (с округлением до копейки)."""
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def kopecks_to_amount(kopecks: int) -> Decimal:
+    """Переводит копейки в рубли: 20000 -> 200, 50090 -> 500.90."""
+    if kopecks % 100 == 0:
+        return Decimal(kopecks // 100)
+    return Decimal(kopecks).scaleb(-2)
+
+
+def format_datetime(value: datetime) -> str:
+    """Форматирует дату так, чтобы строки сортировались в хронологическом порядке."""
+    return value.isoformat(sep=' ', timespec='microseconds')
+
+
+def new_expense_id() -> str:
+    """Возвращает новый уникальный идентификатор расхода."""
+    return uuid.uuid4().hex
+
+
+def with_ids(expenses: List[Expense]) -> List[Expense]:
+    """Присваивает идентификаторы расходам, у которых их еще нет."""
+    return [e if e.id else e._replace(id=new_expense_id()) for e in expenses]
+
+
+def expense_id(expense: Expense) -> str:
+    """
+    Возвращает идентификатор расхода: тот же в SQLite, CSV и Google Таблице.
+
+    Новые записи получают случайный идентификатор при записи и хранят его,
+    поэтому одинаковые строки одного сообщения различимы. У записей, сделанных
+    до появления идентификаторов, он вычисляется из содержимого (время
+    с микросекундами, сумма в копейках, категория, комментарий, пользователь) —
+    так же, как он был записан в Google Таблицу.
+    """
+    if expense.id:
+        return expense.id
+    key = "\x1f".join((
+        format_datetime(expense.datetime), str(amount_to_kopecks(expense.amount)),
+        expense.category, expense.comment, expense.username,
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class CatchUpBuffer:
+    """
+    Согласует пересчет из хранилища с расходами, записанными во время пересчета.
+
+    Пересчет читает историю до ``cutoff`` агрегированно, а хвост начиная с
+    ``cutoff`` — поштучно, с идентификаторами. Пока он идет, расходы от
+    подписчика ``on_expenses_saved`` откладываются; после пересчета из них
+    учитываются только те, которых нет в прочитанном хвосте, а расходы хвоста,
+    о которых подписчик сообщит позже, пропускаются. Ни один расход не теряется
+    и не учитывается дважды. Методы вызываются под блокировкой владельца.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: Optional[List[Expense]] = None
+        self._seen: Set[str] = set()
+
+    @property
+    def active(self) -> bool:
+        """Идет ли пересчет."""
+        return self._buffer is not None
+
+    def start(self) -> None:
+        """Начинает откладывать новые расходы."""
+        if self._buffer is None:
+            self._buffer = []
+
+    def offer(self, expenses: Iterable[Expense]) -> List[Expense]:
+        """Возвращает расходы, которые нужно учесть сейчас (пустой список, пока идет пересчет)."""
+        if self._buffer is not None:
+            self._buffer.extend(expenses)
+            return []
+        fresh = []
+        for e in expenses:
+            if e.id in self._seen:
+                self._seen.discard(e.id)
+            else:
+                fresh.append(e)
+        return fresh
+
+    def finish(self, tail: List[Expense], cutoff: datetime) -> List[Expense]:
+        """
+        Завершает пересчет.
+
+        Args:
+            tail: Расходы хранилища начиная с ``cutoff``, прочитанные после истории до ``cutoff``
+            cutoff: Граница между агрегированной историей и хвостом
+
+        Returns:
+            List[Expense]: Хвост и отложенные расходы, которых в нем нет
+        """
+        buffered = self._buffer or []
+        self._buffer = None
+        tail_ids = {e.id for e in tail if e.id}
+        delivered = {e.id for e in buffered}
+        self._seen = tail_ids - delivered
+        return tail + [e for e in buffered if e.datetime >= cutoff and e.id not in tail_ids]
+
+
+class ExpenseStorage(ABC):
+    """Интерфейс хранилища расходов."""
+
+    def add(self, expense: Expense) -> None:
+        """
+        Сохраняет один расход.
+
+        Raises:
+            OSError, sqlite3.Error: Если не удалось сохранить данные
+        """
+        self.add_many([expense])
+
+    @abstractmethod
+    def add_many(self, expenses: List[Expense]) -> None:
+        """Сохраняет несколько расходов одной записью (идентификаторы — как есть, см. ``with_ids``)."""
+
+    @abstractmethod
+    def iter_expenses(
+        self,
+        username: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[Expense]:
+        """
+        Возвращает расходы в хронологическом порядке.
+
+        Args:
+            username: Только расходы этого пользователя
+            start: Не раньше этого момента (включительно)
+            end: Раньше этого момента (не включительно)
+        """
+
+    def count(self) -> int:
+        """Возвращает количество сохраненных расходов."""
+        return sum(1 for _ in self.iter_expenses())
+
+    def watermark(self) -> Tuple[int, str]:
+        """
+        Возвращает отметку содержимого: число расходов и идентификатор последнего
+        по времени расхода (при равном времени — наибольший идентификатор).
+        """
+        count, last = 0, None
+        for e in self.iter_expenses():
+            count += 1
+            key = (e.datetime, expense_id(e))
+            if last is None or key > last:
+                last = key
+        return count, last[1] if last else ""
+
+    def iter_daily_totals(self, end: Optional[datetime] = None) -> Iterator[Tuple[str, date, str, int]]:
+        """
+        Возвращает суммы по (username, день, категория) в копейках.
+
+        Args:
+            end: Учитывать только расходы раньше этого момента
+        """
+        totals: Dict[Tuple[str, date, str], int] = {}
+        for e in self.iter_expenses(end=end):
+            key = (e.username, e.datetime.date(), e.category)
+            totals[key] = totals.get(key, 0) + amount_to_kopecks(e.amount)
+        for (username, day, category), kopecks in totals.items():
+            yield username, day, category, kopecks
+
+    def close(self) -> None:
+        """Дописывает отложенные данные и освобождает ресурсы."""
+
+
+class CSVStorage(ExpenseStorage):
+    """
+    Хранилище расходов в CSV файле (исходный формат бота).
+
+    Рядом с файлом ведется индекс смещений (``expenses.csv.idx``): для каждой
+    записанной строки — пользователь, месяц и байтовый диапазон строки в CSV.
+    Выборка расходов одного пользователя читает только его строки через seek,
+    а не весь файл; полное чтение тоже идет по индексу, помесячно, чтобы
+    отдавать расходы в хронологическом порядке. Индекс дописывается вместе с CSV и догоняет файл при
+    открытии, если в CSV есть строки, записанные в обход индекса.
+    """
+
+    def __init__(self, path: Path = CSV_PATH) -> None:
+        self.path = path
+        self.index_path = path.with_name(path.name + ".idx")
+        self._lock = threading.Lock()
+        # username -> "YYYY-MM" -> [(начало, конец), ...] в байтах
+        self._offsets: Dict[str, Dict[str, List[Tuple[int, int]]]] = {}
+        self._ensure_file()
+        self._load_index()
+
+    def _ensure_file(self) -> None:
+        """Создает директорию и файл с заголовком, если они не существуют."""
+        try:
+            if not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True)
+                logger.info("Created directory: %s", self.path.parent)
+            if not self.path.exists():
+                with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerow(CSV_HEADER + [CSV_ID_FIELD])
+                logger.info("Created file: %s", self.path)
+        except OSError as e:
+            logger.error("Failed to create data directory or file: %s", e)
+            raise
+
+    def _remember(self, username: str, month: str, start: int, end: int) -> None:
+        self._offsets.setdefault(username, {}).setdefault(month, []).append((start, end))
+
+    def _load_index(self) -> None:
+        """Читает индекс смещений и индексирует строки CSV, которых в нем нет."""
+        indexed_end = 0
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 4 or not line.endswith('\n'):
+                        continue
+                    username, month, start, end = parts[0], parts[1], int(parts[2]), int(parts[3])
+                    self._remember(username, month, start, end)
+                    indexed_end = max(indexed_end, end)
+        size = self.path.stat().st_size
+        if indexed_end > size:
+            # CSV заменили или обрезали — индекс недействителен
+            logger.warning("Offset index %s is ahead of %s, rebuilding", self.index_path, self.path)
+            self._offsets = {}
+            self.index_path.unlink()
+            indexed_end = 0
+        if indexed_end < size:
+            self._index_tail(indexed_end)
+
+    def _index_tail(self, offset: int) -> None:
+        """Индексирует строки CSV начиная с байта ``offset``."""
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            position = offset
+            for raw in f:
+                start, position = position, position + len(raw)
+                row = next(csv.reader([raw.decode('utf-8', errors='replace')]), [])
+                expense, _ = parse_csv_row(row)
+                if expense is not None:
+                    month = expense.datetime.strftime('%Y-%m')
+                    self._remember(expense.username, month, start, position)
+                    entries.append(f"{expense.username}\t{month}\t{start}\t{position}\n")
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.writelines(entries)
+        logger.info("Indexed %s rows of %s from offset %s", len(entries), self.path, offset)
+
+    def add_many(self, expenses: List[Expense]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        encoded = []
+        for e in expenses:
+            writer.writerow([e.datetime, e.amount, e.category, e.comment, e.username, e.id])
+            encoded.append(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+        with self._lock:
+            entries = []
+            with open(self.path, 'ab') as f:
+                position = f.tell()
+                for e, raw in zip(expenses, encoded):
+                    month = e.datetime.strftime('%Y-%m')
+                    self._remember(e.username, month, position, position + len(raw))
+                    entries.append(f"{e.username}\t{month}\t{position}\t{position + len(raw)}\n")
+                    position += len(raw)
+                f.write(b''.join(encoded))
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.writelines(entries)
+
+    def iter_expenses(
+        self,
+        username: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[Expense]:
+        """
+        Читает строки по индексу смещений помесячно в хронологическом порядке.
+
+        Строки дописываются в порядке сохранения, а импорт может добавить
+        расходы задним числом, поэтому строки каждого месяца сортируются по
+        времени (при равном времени — в порядке записи, как в SQLite).
+        """
+        first = start.strftime('%Y-%m') if start is not None else None
+        last = end.strftime('%Y-%m') if end is not None else None
+        with self._lock:
+            users = [self._offsets.get(username, {})] if username is not None else list(self._offsets.values())
+            by_month: Dict[str, List[Tuple[int, int]]] = {}
+            for months in users:
+                for month, ranges in months.items():
+                    if (first is None or month >= first) and (last is None or month <= last):
+                        by_month.setdefault(month, []).extend(ranges)
+        with open(self.path, 'rb') as f:
+            for month in sorted(by_month):
+                expenses = []
+                for row_start, row_end in sorted(by_month[month]):
+                    f.seek(row_start)
+                    raw = f.read(row_end - row_start).decode('utf-8')
+                    expense, _ = parse_csv_row(next(csv.reader([raw]), []))
+                    if expense is None:
+                        continue
+                    if start is not None and expense.datetime < start:
+                        continue
+                    if end is not None and expense.datetime >= end:
+                        continue
+                    expenses.append(expense)
+                expenses.sort(key=lambda e: e.datetime)
+                yield from expenses
+
+
+class _WriteRequest:
+    """Пачка расходов, ожидающая записи писателем SQLite."""
+
+    def __init__(self, expenses: List[Expense]) -> None:
+        self.expenses = expenses
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class SQLiteStorage(ExpenseStorage):
+    """
+    Хранилище расходов в SQLite.
+
+    База работает в режиме WAL, суммы хранятся целыми копейками, а индекс
+    (username, datetime) превращает выборки пользователя за период в поиск
+    по индексу. Все записи выполняет один поток-писатель: запросы, пришедшие
+    одновременно из разных потоков, попадают в одну транзакцию (групповой
+    коммит), а ``add_many`` возвращает управление только после коммита.
+
+    Args:
+        path: Путь к файлу базы
+        batch_size: Максимум расходов в одной транзакции
+    """
+
+    def __init__(self, path: Path = SQLITE_PATH, batch_size: int = WRITE_BATCH_SIZE) -> None:
+        self.path = path
+        self._batch_size = batch_size
+        self._local = threading.local()
+        self._requests: "queue.Queue[Optional[_WriteRequest]]" = queue.Queue()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                self._create_schema(conn)
+        finally:
+            conn.close()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY,
+                datetime TEXT NOT NULL,
+                amount_kopecks INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                comment TEXT NOT NULL,
+                username TEXT NOT NULL,
+                expense_id TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(expenses)")}
+        if "expense_id" not in columns:
+            # База до появления идентификаторов: у старых строк он вычисляется из содержимого (expense_id)
+            conn.execute("ALTER TABLE expenses ADD COLUMN expense_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_username_datetime ON expenses (username, datetime)")
+
+    def _reader(self) -> sqlite3.Connection:
+        """Возвращает соединение для чтения, отдельное для каждого потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            batch = [request]
+            rows = len(request.expenses)
+            stop = False
+            # Забираем всё, что успело накопиться, — это будет одна транзакция
+            while rows < self._batch_size:
+                try:
+                    more = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                batch.append(more)
+                rows += len(more.expenses)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO expenses (datetime, amount_kopecks, category, comment, username, expense_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (format_datetime(e.datetime), amount_to_kopecks(e.amount), e.category, e.comment, e.username,
+                             e.id or None)
+                            for r in batch for e in r.expenses
+                        ],
+                    )
+            except Exception as e:
+                logger.error("Failed to write %s expenses to SQLite: %s", rows, e)
+                for r in batch:
+                    r.error = e
+            for r in batch:
+                r.done.set()
+            if stop:
+                break
+        conn.close()
+
+    def add_many(self, expenses: List[Expense]) -> None:
+        if not expenses:
+            return
+        if not self._writer.is_alive():
+            raise sqlite3.OperationalError("SQLite writer is stopped")
+        request = _WriteRequest(list(expenses))
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+    def iter_expenses(
+        self,
+        username: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[Expense]:
+        conditions, params = [], []
+        if username is not None:
+            conditions.append("username = ?")
+            params.append(username)
+        if start is not None:
+            conditions.append("datetime >= ?")
+            params.append(format_datetime(start))
+        if end is not None:
+            conditions.append("datetime < ?")
+            params.append(format_datetime(end))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._reader().execute(
+            f"SELECT datetime, amount_kopecks, category, comment, username, expense_id "
+            f"FROM expenses {where} ORDER BY datetime, id",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(READ_CHUNK_SIZE)
+            if not rows:
+                break
+            for dt, kopecks, category, comment, user, row_id in rows:
+                yield Expense(datetime.fromisoformat(dt), kopecks_to_amount(kopecks), category, comment, user, row_id or "")
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    def watermark(self) -> Tuple[int, str]:
+        reader = self._reader()
+        count = reader.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        rows = reader.execute(
+            "SELECT datetime, amount_kopecks, category, comment, username, expense_id "
+            "FROM expenses WHERE datetime = (SELECT MAX(datetime) FROM expenses)"
+        ).fetchall()
+        last = (
+            expense_id(Expense(datetime.fromisoformat(dt), kopecks_to_amount(kopecks), category, comment, user, row_id or ""))
+            for dt, kopecks, category, comment, user, row_id in rows
+        )
+        return count, max(last, default="")
+
+    def iter_daily_totals(self, end: Optional[datetime] = None) -> Iterator[Tuple[str, date, str, int]]:
+        where, params = ("WHERE datetime < ?", [format_datetime(end)]) if end is not None else ("", [])
+        cursor = self._reader().execute(
+            "SELECT username, substr(datetime, 1, 10), category, SUM(amount_kopecks) "
+            f"FROM expenses {where} GROUP BY username, substr(datetime, 1, 10), category",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(READ_CHUNK_SIZE)
+            if not rows:
+                break
+            for username, day, category, kopecks in rows:
+                yield username, date.fromisoformat(day), category, kopecks
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._requests.put(None)
+            self._writer.join()
+
+
+def parse_csv_row(row: List[str]) -> Tuple[Optional[Expense], Optional[str]]:
+    """
+    Разбирает строку CSV в расход.
+
+    Returns:
+        Tuple[Optional[Expense], Optional[str]]: (расход, None) или (None, причина отказа)
+    """
+    if row and row[0] in ('date', 'datetime') and len(row) <= len(CSV_HEADER) + 1:
+        return None, "header"
+    if len(row) not in (len(CSV_HEADER), len(CSV_HEADER) + 1):
+        return None, f"expected {len(CSV_HEADER)} or {len(CSV_HEADER) + 1} fields, got {len(row)}"
+    raw_dt, raw_amount, category, comment, username = (value.strip() for value in row[:len(CSV_HEADER)])
+    row_id = row[len(CSV_HEADER)].strip() if len(row) > len(CSV_HEADER) else ""
+    if not _DATETIME_RE.match(raw_dt):
+        return None, f"bad datetime: {raw_dt[:40]}"
+    try:
+        dt = datetime.fromisoformat(raw_dt)
+    except ValueError:
+        return None, f"bad datetime: {raw_dt[:40]}"
+    try:
+        amount = Decimal(raw_amount)
+    except InvalidOperation:
+        return None, f"bad amount: {raw_amount[:40]}"
+    if not amount.is_finite() or amount <= 0:
+        return None, f"bad amount: {raw_amount[:40]}"
+    if not category or not comment or not username:
+        return None, "empty field"
+    if comment.startswith("Произошла ошибка"):
+        return None, "error text stored as comment"
+    return Expense(dt, amount, category, comment, username, row_id), None
+
+
+class MigrationReport(NamedTuple):
+    """Итог переноса расходов из CSV."""
+    imported: int
+    quarantined: int
+
+
+def migrate_csv(
+    storage: ExpenseStorage,
+    csv_path: Path = CSV_PATH,
+    quarantine_path: Path = QUARANTINE_PATH,
+) -> MigrationReport:
+    """
+    Переносит расходы из CSV в хранилище.
+
+    Строки, которые не удалось разобрать (склеенный заголовок, мусор перед
+    датой, текст ошибки вместо комментария, пустая сумма), не теряются:
+    они записываются в отдельный CSV-файл карантина с номером строки и причиной.
+
+    Returns:
+        MigrationReport: Количество перенесенных и отложенных в карантин строк
+    """
+    imported = 0
+    bad: List[List[str]] = []
+    batch: List[Expense] = []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row:
+                continue
+            expense, reason = parse_csv_row(row)
+            if expense is None:
+                if reason != "header":
+                    bad.append([str(line_no), reason, ','.join(row)])
+                continue
+            batch.append(expense)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                storage.add_many(batch)
+                imported += len(batch)
+                batch = []
+    if batch:
+        storage.add_many(batch)
+        imported += len(batch)
+
+    if bad:
+        with open(quarantine_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'reason', 'raw'])
+            writer.writerows(bad)
+        logger.warning("Quarantined %s bad rows from %s into %s", len(bad), csv_path, quarantine_path)
+    logger.info("Migrated %s expenses from %s", imported, csv_path)
+    return MigrationReport(imported, len(bad))
+
+
+def export_csv(storage: ExpenseStorage, path: Path, username: Optional[str] = None) -> int:
+    """Выгружает расходы из хранилища в CSV файл. Возвращает количество строк."""
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER + [CSV_ID_FIELD])
+        for e in storage.iter_expenses(username=username):
+            writer.writerow([e.datetime, e.amount, e.category, e.comment, e.username, expense_id(e)])
+            exported += 1
+    return exported
+
+
+_storage: Optional[ExpenseStorage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> ExpenseStorage:
+    """
+    Возвращает хранилище расходов, выбранное переменной окружения STORAGE_BACKEND
+    (``sqlite`` по умолчанию или ``csv``).
+
+    При первом запуске SQLite-хранилища с пустой базой расходы переносятся
+    из существующего data/expenses.csv.
+    """
+    global _storage
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.getenv("STORAGE_BACKEND", "sqlite")
+            if backend == "csv":
+                _storage = CSVStorage()
+            elif backend == "sqlite":
+                storage = SQLiteStorage()
+                if storage.count() == 0 and CSV_PATH.exists():
+                    migrate_csv(storage)
+                _storage = storage
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+            logger.info("Expense storage: %s", backend)
+        return _storage
+
+
+def close_storage() -> None:
+    """Закрывает хранилище расходов, дожидаясь записи отложенных данных."""
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
+
+
+def main() -> None:
+    """Командная строка: перенос CSV в SQLite и выгрузка SQLite в CSV."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Expense storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="import expenses.csv into SQLite")
+    migrate.add_argument("--csv", type=Path, default=CSV_PATH)
+    migrate.add_argument("--db", type=Path, default=SQLITE_PATH)
+    migrate.add_argument("--quarantine", type=Path, default=QUARANTINE_PATH)
+    export = subparsers.add_parser("export", help="export SQLite expenses to CSV")
+    export.add_argument("output", type=Path)
+    export.add_argument("--db", type=Path, default=SQLITE_PATH)
+    export.add_argument("--username")
+    args = parser.parse_args()
+
+    setup_logging(log_file=None)
+    storage = SQLiteStorage(args.db)
+    try:
+        if args.command == "migrate":
+            report = migrate_csv(storage, args.csv, args.quarantine)
+            print(f"imported: {report.imported}, quarantined: {report.quarantined}")
+        else:
+            print(f"exported: {export_csv(storage, args.output, args.username)}")
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
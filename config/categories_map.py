@@ -1,61 +1,30 @@
-CATEGORY_MAP = {
-    # Жильё и финансы
-    "ипотека": "Ипотека",
-    "ку": "КУ",
-    "кредит": "Кредитные выплаты и долги",
-    "долг": "Кредитные выплаты и долги",
-    "страховка": "Страховки",
-    "страховки": "Страховки",
-    "связь": "Связь",
-    # Транспорт
-    "транспорт": "Транспорт",
-    "такси": "Транспорт (такси, билеты)",
-    "билеты": "Транспорт (такси, билеты)",
-    # Продукты и быт
-    "продукты": "Продукты",
-    "еда": "Продукты",
-    "магазин": "Продукты",
-    "быт": "Бытовые расходы",
-    "бытовые": "Бытовые расходы",
-    "заказ": "Заказ услуг",
-    "услуга": "Заказ услуг",
-    "техника": "Техника, мебель",
-    "мебель": "Техника, мебель",
-    # Здоровье и спорт
-    "здоровье": "Здоровье",
-    "тренировка": "Тренировки",
-    "спорт": "Тренировки",
-    # Образование
-    "образование": "Образование",
-    # Подписки и ПО
-    "подписка": "Подписки и ПО",
-    "подписки": "Подписки и ПО",
-    "по": "Подписки и ПО",
-    # Еда вне дома
-    "кофе": "Еда вне дома",
-    "кафе": "Еда вне дома",
-    "ресторан": "Еда вне дома",
-    "столовая": "Еда вне дома",
-    "еда вне дома": "Еда вне дома",
-    # Красота и уход
-    "красота": "Красота и уход",
-    "уход": "Красота и уход",
-    # Одежда
-    "одежда": "Одежда и обувь",
-    "обувь": "Одежда и обувь",
-    # Развлечения
-    "развлечения": "Развлечения и досуг",
-    "досуг": "Развлечения и досуг",
-    # Подарки
-    "подарок": "Подарки и благотворительность",
-    "подарки": "Подарки и благотворительность",
-    "благотворительность": "Подарки и благотворительность",
-    # Прочее
-    "продолбалась": "Продолбалась",
-    # Финансовая подушка и накопления
-    "подушка": "Подушка",
-    "маневренный фонд": "Маневренный фонд",
-    "путешествия": "Путешествия",
-    "инвестиции": "Инвестиции и накопления",
-    "накопления": "Инвестиции и накопления",
-}
\ No newline at end of file
+import json
+from pathlib import Path
+from typing import Dict
+
+# Базовый словарь «ключ -> категория» хранится в categories_map.json рядом с этим модулем.
+# Бот перечитывает файл на лету (см. bot.dict_watch), перезапуск не нужен.
+CATEGORY_MAP_PATH = Path(__file__).with_name("categories_map.json")
+
+
+def load_category_map(path: Path = CATEGORY_MAP_PATH) -> Dict[str, str]:
+    """
+    Читает базовый словарь категорий.
+
+    Raises:
+        OSError: Если файл не удалось прочитать
+        ValueError: Если файл не является непустым JSON-объектом со строковыми ключами и значениями
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{path}: ожидается непустой JSON-объект")
+    mapping = {}
+    for key, category in data.items():
+        if not isinstance(category, str) or not key.strip() or not category.strip():
+            raise ValueError(f"{path}: неверное соответствие {key!r} -> {category!r}")
+        mapping[" ".join(key.lower().split())] = category
+    return mapping
+
+
+CATEGORY_MAP = load_category_map()
@@ -0,0 +1,6 @@
+import os
+from pathlib import Path
+
+# Каталог с данными бота (расходы, очереди, кэши).
+# Переопределяется переменной окружения DATA_DIR.
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
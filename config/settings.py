@@ -7,3 +7,62 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 if BOT_TOKEN is None:
     raise ValueError("BOT_TOKEN is not set in the .env")
+
+# Параллельная обработка обновлений
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "32"))
+
+# Сохранять кэш лемм между перезапусками (data/lemma_cache.json)
+LEMMA_CACHE_PERSIST = os.getenv("LEMMA_CACHE_PERSIST", "1") == "1"
+
+# Незавершенные выборы категории: лимит записей, время жизни (секунды) и сохранение между перезапусками
+PENDING_MAX_ENTRIES = int(os.getenv("PENDING_MAX_ENTRIES", "10000"))
+PENDING_TTL = int(os.getenv("PENDING_TTL", str(24 * 60 * 60)))
+PENDING_PERSIST = os.getenv("PENDING_PERSIST", "1") == "1"
+
+# Загрузка тяжелых ресурсов (pymorphy, словарь категорий, клиент Sheets):
+# eager — до начала приема обновлений, background — в фоне после старта, lazy — при первом обращении
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+
+# Администраторы (через запятую, без @): им доступна команда /stats
+ADMIN_USERNAMES = {name.strip().lstrip("@") for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+# Локальный HTTP-эндпоинт метрик в формате Prometheus (0 — выключен)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Webhook: встроенный HTTP-сервер слушает WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH,
+# Telegram отправляет обновления на WEBHOOK_URL и подписывает их WEBHOOK_SECRET
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Исходящие запросы к Bot API: размер пула соединений и ожидание свободного соединения
+CONNECTION_POOL_SIZE = int(os.getenv("CONNECTION_POOL_SIZE", "64"))
+POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", "5"))
+# Адрес Bot API (например, локального фейкового сервера для нагрузочных тестов)
+BOT_API_URL = os.getenv("BOT_API_URL")
+
+# Шардированный режим (python -m bot.sharding): число процессов-обработчиков
+# и размер очереди обновлений каждого из них
+SHARDS = int(os.getenv("SHARDS", str(os.cpu_count() or 1)))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+
+# Сходство комментария с известным, от которого категория назначается без вопроса (больше 1 — не назначать)
+FUZZY_AUTO_SIMILARITY = float(os.getenv("FUZZY_AUTO_SIMILARITY", "0.8"))
+
+# Как часто проверять, не изменились ли файлы словарей категорий, в секундах (0 — не следить)
+DICT_RELOAD_INTERVAL = float(os.getenv("DICT_RELOAD_INTERVAL", "5"))
+
+# Сводки /digest: начало рассылки (местное время ЧЧ:ММ), длительность окна в минутах,
+# по которому распределяются подписчики, и максимум сообщений в секунду (лимит Telegram — около 30)
+DIGEST_TIME = os.getenv("DIGEST_TIME", "09:00")
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "60"))
+DIGEST_RATE = int(os.getenv("DIGEST_RATE", "20"))
+
+# Как часто сверять последние дни с Google Таблицей и дописывать недостающие строки, в часах (0 — не сверять)
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "6"))
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Настройки читаются при импорте модулей бота, поэтому окружение задается до них
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bot-tests-"))
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("LEMMA_CACHE_PERSIST", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
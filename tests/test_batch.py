@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from bot.main import category_prompt
+from bot.parser import LemmaCache
+
+
+class CountingAnalyzer:
+    """Анализатор, который считает разобранные слова."""
+
+    def __init__(self) -> None:
+        self.parsed = []
+
+    def parse(self, word):
+        self.parsed.append(word)
+        return [type("Parse", (), {"normal_form": word})()]
+
+
+def test_last_batch_question_keeps_comment_and_amount():
+    assert category_prompt([("шаурма", [Decimal("250")])]) == (
+        "Не удалось определить категорию для «шаурма» (250 ₽). Пожалуйста, выбери:"
+    )
+
+
+def test_batch_question_counts_lines_and_remaining():
+    prompt = category_prompt([("такси", [Decimal("300"), Decimal("200")]), ("шаурма", [Decimal("250")])])
+    assert "«такси» (500 ₽, строк: 2)" in prompt
+    assert "Осталось вопросов: 2." in prompt
+
+
+def test_missing_skips_cached_words():
+    analyzer = CountingAnalyzer()
+    cache = LemmaCache(lambda: analyzer)
+    cache.update({"кофе": "кофе"})
+    assert cache.missing(["кофе", "такси", "такси", "метро"]) == ["такси", "метро"]
+    assert analyzer.parsed == []
+    assert cache.stats().hits == 1
@@ -0,0 +1,43 @@
+import asyncio
+import json
+from collections import deque
+from datetime import date, time
+from types import SimpleNamespace
+
+from bot.digests import DigestScheduler, DigestStore, Delivery
+from bot.rollups import Rollups
+
+DAY = date(2025, 6, 2)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+def test_sent_marks_are_saved_once_per_run(tmp_path, monkeypatch):
+    store = DigestStore(tmp_path / "digests.json")
+    users = [f"user{i}" for i in range(10)]
+    for i, username in enumerate(users):
+        store.subscribe(username, i, ("daily",))
+    saves = []
+    save = store._save
+    monkeypatch.setattr(store, "_save", lambda: (saves.append(1), save()))
+    scheduler = DigestScheduler(store, Rollups(), time(9), 60, rate=3)
+    scheduler._day = DAY
+    scheduler._queue = deque(Delivery(0.0, username, i, "сводка") for i, username in enumerate(users))
+    context = SimpleNamespace(bot=FakeBot())
+
+    async def run():
+        while scheduler.queue_depth():
+            await scheduler._send_due(context)
+
+    asyncio.run(run())
+    assert len(context.bot.sent) == 10
+    # Четыре пачки, одна запись файла — после последней
+    assert saves == [1]
+    data = json.loads((tmp_path / "digests.json").read_text(encoding="utf-8"))
+    assert {item["sent"] for item in data.values()} == {DAY.isoformat()}
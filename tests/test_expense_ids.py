@@ -0,0 +1,128 @@
+import csv
+import sqlite3
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bench.fakes import FakeWorksheet
+from bot.reconcile import reconcile
+from bot.spreadsheet import sheet_row
+from bot.storage import CSV_HEADER, CSVStorage, Expense, SQLiteStorage, expense_id, with_ids
+
+NOW = datetime(2025, 6, 2, 12, 0)
+
+
+def twins():
+    """Две одинаковые строки одного сообщения: «200 кофе» дважды с общим временем."""
+    expense = Expense(NOW, Decimal("200"), "Кафе", "кофе", "marina")
+    return [expense, expense]
+
+
+def test_identical_rows_get_distinct_ids():
+    first, second = with_ids(twins())
+    assert first.id and second.id and first.id != second.id
+    assert expense_id(first) != expense_id(second)
+    # Уже назначенный идентификатор не меняется
+    assert with_ids([first]) == [first]
+
+
+def test_sqlite_keeps_ids_and_legacy_rows_fall_back_to_hash(tmp_path):
+    path = tmp_path / "expenses.sqlite3"
+    legacy = Expense(NOW - timedelta(days=1), Decimal("50"), "Кафе", "чай", "marina")
+    storage = SQLiteStorage(path)
+    try:
+        storage.add_many(with_ids(twins()) + [legacy])
+        stored = list(storage.iter_expenses())
+    finally:
+        storage.close()
+    assert len({expense_id(e) for e in stored}) == 3
+    stored_legacy = next(e for e in stored if e.comment == "чай")
+    assert stored_legacy.id == "" and expense_id(stored_legacy) == expense_id(legacy)
+
+
+def test_sqlite_adds_id_column_to_old_database(tmp_path):
+    path = tmp_path / "expenses.sqlite3"
+    storage = SQLiteStorage(path)
+    storage.close()
+    # База предыдущей версии: без колонки идентификатора
+    with sqlite3.connect(path) as conn:
+        conn.execute("ALTER TABLE expenses DROP COLUMN expense_id")
+    storage = SQLiteStorage(path)
+    try:
+        saved = with_ids(twins())
+        storage.add_many(saved)
+        assert sorted(e.id for e in storage.iter_expenses()) == sorted(e.id for e in saved)
+    finally:
+        storage.close()
+
+
+def test_csv_reads_old_and_new_rows(tmp_path):
+    path = tmp_path / "expenses.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerow(["2025-06-01 10:00:00", "50", "Кафе", "чай", "marina"])
+    storage = CSVStorage(path)
+    storage.add_many(with_ids(twins()))
+    stored = list(storage.iter_expenses())
+    assert [e.id for e in stored][0] == ""
+    assert len({expense_id(e) for e in stored}) == 3
+
+
+def test_reconcile_pushes_both_identical_rows(tmp_path):
+    storage = SQLiteStorage(tmp_path / "expenses.sqlite3")
+    try:
+        first, second = with_ids(twins())
+        storage.add_many([first, second])
+        sheet = FakeWorksheet()
+        sheet.append_rows([sheet_row(first)])
+        report = reconcile(storage, sheet, NOW - timedelta(days=1), NOW + timedelta(minutes=1))
+    finally:
+        storage.close()
+    assert report.missing == 1 and report.pushed == 1
+    assert [row[5] for row in sheet.values] == [first.id, second.id]
+
+
+def test_reconcile_matches_legacy_rows_without_ids(tmp_path):
+    storage = SQLiteStorage(tmp_path / "expenses.sqlite3")
+    try:
+        # Расходы до появления идентификаторов: в хранилище без id, в листе — без колонки F
+        old = [
+            Expense(NOW - timedelta(days=1, microseconds=-250000), Decimal("200"), "Кафе", "кофе", "marina"),
+            Expense(NOW - timedelta(days=1), Decimal("200"), "Кафе", "кофе", "marina"),
+            Expense(NOW - timedelta(hours=5), Decimal("99.50"), "Такси", "такси", "marina"),
+        ]
+        lost = Expense(NOW - timedelta(hours=3), Decimal("50"), "Кафе", "чай", "marina")
+        storage.add_many(old + [lost])
+        sheet = FakeWorksheet()
+        sheet.append_rows([["datetime", "amount", "category", "comment", "username"]])
+        # Время в листе — момент отправки, на секунду позже записи
+        sheet.append_rows([sheet_row(e)[:5] for e in old])
+        sheet.values[-1][0] = (old[-1].datetime + timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")
+        report = reconcile(storage, sheet, NOW - timedelta(days=7), NOW)
+    finally:
+        storage.close()
+    assert report.sheet == 3
+    assert report.missing == 1 and report.pushed == 1
+    assert sheet.values[-1][3] == "чай"
+    assert len(sheet.values) == 1 + 3 + 1
+
+
+def test_csv_iterates_chronologically_after_backdated_import(tmp_path):
+    storage = CSVStorage(tmp_path / "expenses.csv")
+    recent = [Expense(NOW + timedelta(minutes=i), Decimal("10"), "Кафе", "кофе", user) for i, user in enumerate(["marina", "oleg"])]
+    storage.add_many(with_ids(recent))
+    # Импорт дописывает в конец файла расходы задним числом, в том числе за тот же месяц
+    backdated = [
+        Expense(NOW - timedelta(days=40), Decimal("1"), "Кафе", "чай", "oleg"),
+        Expense(NOW - timedelta(hours=1), Decimal("2"), "Кафе", "чай", "marina"),
+        Expense(NOW - timedelta(hours=2), Decimal("3"), "Кафе", "чай", "oleg"),
+    ]
+    storage.add_many(with_ids(backdated))
+    stored = [e.datetime for e in storage.iter_expenses()]
+    assert stored == sorted(e.datetime for e in recent + backdated)
+    assert [e.datetime for e in storage.iter_expenses(username="oleg")] == sorted(
+        e.datetime for e in recent + backdated if e.username == "oleg"
+    )
+    assert [e.datetime for e in CSVStorage(tmp_path / "expenses.csv").iter_expenses(start=NOW - timedelta(hours=1))] == [
+        NOW - timedelta(hours=1), NOW, NOW + timedelta(minutes=1)
+    ]
@@ -0,0 +1,70 @@
+import random
+import statistics
+import threading
+import time
+
+from bot.fuzzy import MAX_POSTINGS, FuzzyCategoryIndex, TrigramIndex, trigrams
+
+WORDS = ["кофе", "продукты", "такси", "вкусвилл", "пятерочка", "метро", "обед", "аптека", "подписка", "доставка"]
+CATEGORIES = ["Кафе", "Транспорт", "Продукты"]
+
+
+def history(size, seed=1):
+    rng = random.Random(seed)
+    return [
+        (" ".join(rng.sample(WORDS, rng.randint(1, 3))) + f" {rng.randint(0, 99999)}", rng.choice(CATEGORIES))
+        for _ in range(size)
+    ]
+
+
+def test_cold_user_gets_no_suggestion_until_index_is_built():
+    started = threading.Event()
+    release = threading.Event()
+
+    def load_user(username):
+        started.set()
+        release.wait(5)
+        return [("вкусвилл", "Продукты")]
+
+    index = FuzzyCategoryIndex({"такси": "Транспорт"}, load_user)
+    index.warm()
+    assert index.suggest("вкусвил", "marina") == []
+    assert started.wait(5)
+    # Соответствие, пришедшее во время построения, не теряется
+    index.add("marina", "кофейня", "Кафе")
+    assert index.stats().building == 1
+    release.set()
+    index.wait_built(5)
+    assert [s.category for s in index.suggest("вкусвил", "marina")] == ["Продукты"]
+    assert [s.category for s in index.suggest("кофейня у дома", "marina")] == ["Кафе"]
+
+
+def test_capped_search_matches_exhaustive_dice():
+    comments = dict(history(MAX_POSTINGS // 10, seed=2))
+    index = TrigramIndex()
+    for comment, category in comments.items():
+        index.add(comment, category)
+    for query in ["вкусвил 123", "такси метро", "пятерочка доставка 5"]:
+        grams = trigrams(query)
+        expected = {}
+        for comment, category in comments.items():
+            known = trigrams(comment)
+            similarity = 2 * len(grams & known) / (len(grams) + len(known))
+            if similarity >= 0.45:
+                expected[category] = max(expected.get(category, 0.0), similarity)
+        found = index.search(query)
+        assert {category: s.similarity for category, s in found.items()} == expected
+
+
+def test_warm_suggest_latency_on_large_history():
+    index = FuzzyCategoryIndex({"такси": "Транспорт"}, lambda username: history(100_000))
+    index.warm()
+    index.suggest("кофе", "marina")
+    index.wait_built(30)
+    timings = []
+    for query in ["вкусвил молоко", "кофее утром", "такси домой 500", "аптека витамины"] * 25:
+        started = time.perf_counter()
+        index.suggest(query, "marina")
+        timings.append(time.perf_counter() - started)
+    # Без ограничения списков триграмм медиана на такой истории — десятки миллисекунд
+    assert statistics.median(timings) < 0.005
@@ -0,0 +1,19 @@
+import bot.importer as importer
+from bot.storage import SQLiteStorage
+
+
+def test_import_writes_storage_only(tmp_path, monkeypatch):
+    storage = SQLiteStorage(tmp_path / "expenses.sqlite3")
+    monkeypatch.setattr(importer, "get_storage", lambda: storage)
+    statement = tmp_path / "statement.txt"
+    statement.write_text("200 кофе\n200 кофе\nкофе без суммы\n", encoding="utf-8")
+    try:
+        report = importer.import_statement(statement, "marina", unknown_category="Бытовые расходы")
+        saved = list(storage.iter_expenses())
+    finally:
+        storage.close()
+    assert report == importer.ImportReport(2, 0, 1)
+    # Одинаковые строки получают разные идентификаторы
+    assert len({e.id for e in saved}) == 2 and all(e.id for e in saved)
+    # Слушатели бота (очередь Sheets, кэш аналитики) в процессе импорта не подключаются
+    assert not hasattr(importer, "save_expenses")
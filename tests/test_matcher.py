@@ -0,0 +1,85 @@
+import random
+
+from bot.matcher import CategoryMatcher, PhraseTrie
+
+
+def lemmatize(word):
+    # «кофе» и «кофеы» дают одну лемму: ключи с одинаковыми леммами
+    return word[:-1] if word.endswith("ы") else word
+
+
+class CountingLemmatizer:
+    def __init__(self):
+        self.words = []
+
+    def __call__(self, word):
+        self.words.append(word)
+        return lemmatize(word)
+
+
+def phrases(trie):
+    """Все фразы дерева: {леммы: категория}."""
+    found = {}
+    stack = [((), trie._root)]
+    while stack:
+        prefix, node = stack.pop()
+        for key, child in node.items():
+            if key == "":
+                found[prefix] = child
+            else:
+                stack.append((prefix + (key,), child))
+    return found
+
+
+def compiled(base_map, lemmatizer=lemmatize):
+    matcher = CategoryMatcher(base_map, lemmatizer, lambda username: {})
+    matcher.warm()
+    return matcher
+
+
+def test_patched_trie_leaves_original_unchanged():
+    trie = PhraseTrie()
+    trie.add(("еда", "вне", "дом"), "Кафе")
+    trie.add(("еда",), "Продукты")
+    before = phrases(trie)
+    patched = trie.patched([("еда", "вне", "дом")], [(("еда", "домой"), "Доставка")])
+    assert phrases(trie) == before and len(trie) == 2
+    assert phrases(patched) == {("еда",): "Продукты", ("еда", "домой"): "Доставка"}
+    assert len(patched) == 2
+    # Опустевшие узлы удалены
+    assert "вне" not in patched._root["еда"]
+
+
+def test_reload_lemmatizes_only_added_keys():
+    lemmatizer = CountingLemmatizer()
+    matcher = compiled({"кофе": "Кафе", "такси": "Транспорт"}, lemmatizer)
+    lemmatizer.words.clear()
+    matcher.set_base({"кофе": "Напитки", "метро": "Транспорт"})
+    assert lemmatizer.words == ["метро"]
+    assert matcher.match("утром кофе", "marina") == "Напитки"
+    assert matcher.match("вечером такси", "marina") is None
+
+
+def test_patched_reload_matches_full_build():
+    rng = random.Random(1)
+    words = ["кофе", "кофеы", "еда", "вне", "дом", "такси", "метро", "чай"]
+    categories = ["Кафе", "Транспорт", "Продукты"]
+
+    def random_map():
+        keys = {" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(12)}
+        return {key: rng.choice(categories) for key in keys}
+
+    matcher = compiled(random_map())
+    for _ in range(50):
+        base_map = random_map()
+        matcher.set_base(base_map)
+        patched = matcher._base_index
+        assert patched.trie is not None
+        # Порядок ключей с одинаковыми леммами может отличаться, поэтому сравниваем
+        # фразы и проверяем, что категория совпадающих лемм принадлежит одному из их ключей
+        fresh = compiled(base_map)._base_index
+        assert phrases(patched.trie).keys() == phrases(fresh.trie).keys()
+        assert len(patched.trie) == len(fresh.trie)
+        for lemmas, category in phrases(patched.trie).items():
+            assert category == base_map[patched.owners[lemmas][-1]]
+            assert set(patched.owners[lemmas]) == set(fresh.owners[lemmas])
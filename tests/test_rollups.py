@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from bot.rollups import Rollups, user_rollups
+from bot.storage import Expense, SQLiteStorage, with_ids
+
+NOW = datetime(2025, 6, 2, 12, 0)
+
+
+def expense(amount, when=NOW, username="marina"):
+    return with_ids([Expense(when, Decimal(amount), "Кафе", "кофе", username)])[0]
+
+
+class HookedStorage:
+    """Хранилище, которое вызывает ``hooks[этап]()`` посреди пересчета."""
+
+    def __init__(self, inner, hooks):
+        self.inner = inner
+        self.hooks = hooks
+
+    def iter_daily_totals(self, end=None):
+        yield from self.inner.iter_daily_totals(end=end)
+        self.hooks.get("totals", lambda: None)()
+
+    def iter_expenses(self, **kwargs):
+        rows = list(self.inner.iter_expenses(**kwargs))
+        self.hooks.get("tail", lambda: None)()
+        return iter(rows)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(tmp_path / "expenses.sqlite3")
+    yield storage
+    storage.close()
+
+
+def save(storage, rollups, expenses):
+    """Как handlers.save_expenses: сначала запись, потом подписчик."""
+    storage.add_many(expenses)
+    rollups.add_many(expenses)
+
+
+def month_total(rollups):
+    return sum(rollups.month_by_category("marina", NOW.year, NOW.month).values())
+
+
+def test_writes_during_rebuild_are_counted_once(storage):
+    rollups = Rollups()
+    storage.add_many([expense("100", NOW - timedelta(days=1)), expense("10", NOW - timedelta(minutes=1))])
+    rollups.begin_rebuild()
+    assert not rollups.ready
+    # Запись, пока читаются суммы по дням: попадет и в хвост, и в отложенные
+    # Запись после чтения хвоста: только в отложенные
+    late_listener = expense("7", NOW)
+    hooks = {
+        "totals": lambda: save(storage, rollups, [expense("20", NOW)]),
+        "tail": lambda: (save(storage, rollups, [expense("3", NOW)]), storage.add_many([late_listener])),
+    }
+    rollups.rebuild(HookedStorage(storage, hooks), now=NOW)
+    assert rollups.ready
+    # Подписчик сообщает о расходе, который уже был в прочитанном хвосте
+    rollups.add_many([late_listener])
+    rollups.add_many([expense("5", NOW)])
+    assert month_total(rollups) == (100 + 10 + 20 + 3 + 7 + 5) * 100
+
+
+def test_failed_rebuild_stays_not_ready(storage):
+    rollups = Rollups()
+
+    def fail():
+        raise OSError("диск недоступен")
+
+    with pytest.raises(OSError):
+        rollups.rebuild(HookedStorage(storage, {"totals": fail}), now=NOW)
+    assert not rollups.ready
+    assert not rollups.wait_ready(0)
+
+
+def test_user_rollups_reads_storage(storage):
+    storage.add_many([expense("100"), expense("50", username="other")])
+    assert month_total(user_rollups(storage, "marina")) == 100 * 100
@@ -0,0 +1,122 @@
+import pytest
+
+from bench.fakes import FakeWorksheet
+from bot.sheets_sync import SheetsSyncQueue
+
+
+class FailingWorksheet(FakeWorksheet):
+    """Лист, который отвечает ошибкой, пока ``fail`` истинно."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fail = True
+
+    def append_rows(self, rows, value_input_option=None):
+        if self.fail:
+            raise ConnectionError("Sheets недоступен")
+        super().append_rows(rows, value_input_option)
+
+
+def make_queue(path, sheet, **kwargs):
+    return SheetsSyncQueue(lambda: sheet, queue_path=path, **kwargs)
+
+
+def rows(n, start=0):
+    return [[str(i), "кофе"] for i in range(start, start + n)]
+
+
+def test_flush_sends_batches_in_order(tmp_path):
+    sheet = FakeWorksheet()
+    queue = make_queue(tmp_path / "q.jsonl", sheet, batch_size=3)
+    queue.enqueue_many(rows(7))
+    assert queue.flush_all() == 7
+    assert sheet.values == rows(7)
+    assert sheet.calls["append_rows"] == 3
+    assert queue.stats().queue_depth == 0
+    # Полностью отправленный журнал обнуляется
+    assert (tmp_path / "q.jsonl").stat().st_size == 0
+
+
+def test_overflow_keeps_rows_on_disk(tmp_path):
+    sheet = FailingWorksheet()
+    queue = make_queue(tmp_path / "q.jsonl", sheet, max_size=5, batch_size=4)
+    for row in rows(20):
+        queue.enqueue(row)
+    stats = queue.stats()
+    assert stats.queue_depth == 20
+    assert stats.spilled_rows == 15
+    assert queue.pending() == rows(20)
+    with pytest.raises(ConnectionError):
+        queue.flush()
+
+    sheet.fail = False
+    assert queue.flush_all() == 20
+    assert sheet.values == rows(20)
+    assert queue.stats().spilled_rows == 0
+
+
+def test_restart_replays_unsent_rows(tmp_path):
+    path = tmp_path / "q.jsonl"
+    sheet = FakeWorksheet()
+    queue = make_queue(path, sheet, batch_size=2)
+    queue.enqueue_many(rows(5))
+    assert queue.flush() == 2
+
+    restarted_sheet = FakeWorksheet()
+    restarted = make_queue(path, restarted_sheet, max_size=2, batch_size=2)
+    assert restarted.stats().queue_depth == 3
+    assert restarted.flush_all() == 3
+    assert restarted_sheet.values == rows(3, start=2)
+
+
+def test_restart_drops_torn_last_line(tmp_path):
+    path = tmp_path / "q.jsonl"
+    queue = make_queue(path, FakeWorksheet())
+    queue.enqueue_many(rows(2))
+    with open(path, "ab") as f:
+        f.write('["2", "ко'.encode("utf-8"))
+
+    sheet = FakeWorksheet()
+    restarted = make_queue(path, sheet)
+    restarted.enqueue_many(rows(1, start=3))
+    assert restarted.flush_all() == 3
+    assert sheet.values == rows(2) + rows(1, start=3)
+
+
+def test_journal_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr("bot.sheets_sync.COMPACT_BYTES", 100)
+    path = tmp_path / "q.jsonl"
+    sheet = FakeWorksheet()
+    queue = make_queue(path, sheet, batch_size=10)
+    queue.enqueue_many(rows(30))
+    assert queue.flush() == 10
+    assert queue.flush() == 10
+    size = path.stat().st_size
+    assert size < 12 * len('["00", "кофе"]\n'.encode("utf-8"))
+
+    restarted_sheet = FakeWorksheet()
+    restarted = make_queue(path, restarted_sheet)
+    assert restarted.flush_all() == 10
+    assert restarted_sheet.values == rows(10, start=20)
+
+
+def test_offset_past_end_after_interrupted_compaction(tmp_path):
+    path = tmp_path / "q.jsonl"
+    queue = make_queue(path, FakeWorksheet())
+    queue.enqueue_many(rows(3))
+    # Журнал уже сжат, а смещение еще старое
+    (tmp_path / "q.jsonl.offset").write_text("100000", encoding="utf-8")
+
+    sheet = FakeWorksheet()
+    assert make_queue(path, sheet).flush_all() == 3
+    assert sheet.values == rows(3)
+
+
+def test_restart_registers_exit_hook_once(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr("bot.sheets_sync.atexit.register", registered.append)
+    queue = make_queue(tmp_path / "q.jsonl", FakeWorksheet())
+    for _ in range(3):
+        queue.start()
+        queue.stop()
+    assert registered == [queue.stop]
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from bench.fake_bot_api import FakeBotApi
+from bench.fakes import FakeWorksheet
+from bench.webhook_load import SECRET, WEBHOOK_PATH, _free_port, _update
+from bot.sheets_sync import SheetsSyncQueue
+
+REPLY_TIMEOUT = 30.0
+
+
+@pytest.fixture
+def api():
+    api = FakeBotApi().start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture
+def webhook_settings(api, monkeypatch, tmp_path):
+    """Настройки webhook, указывающие на фейковый Bot API и свободный локальный порт."""
+    import bot.serving as serving
+    import bot.spreadsheet as spreadsheet
+
+    # Словари пользователей лежат относительно рабочего каталога, строки Sheets уходят в фейковый лист
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(spreadsheet, "sync_queue", SheetsSyncQueue(FakeWorksheet, queue_path=None))
+
+    port = _free_port()
+    monkeypatch.setattr(serving, "BOT_API_URL", api.url)
+    monkeypatch.setattr(serving, "WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setattr(serving, "WEBHOOK_PORT", port)
+    monkeypatch.setattr(serving, "WEBHOOK_PATH", WEBHOOK_PATH)
+    monkeypatch.setattr(serving, "WEBHOOK_URL", None)
+    monkeypatch.setattr(serving, "WEBHOOK_SECRET", SECRET)
+    return f"http://127.0.0.1:{port}/{WEBHOOK_PATH}"
+
+
+def test_webhook_secret_is_required(monkeypatch):
+    import bot.serving as serving
+
+    monkeypatch.setattr(serving, "WEBHOOK_SECRET", None)
+    with pytest.raises(ValueError):
+        serving.webhook_options()
+
+
+def test_webhook_app_replies_to_update(api, webhook_settings):
+    import bot.main
+    from bot.serving import webhook_options
+
+    async def scenario():
+        app = bot.main.build_application()
+        async with app:
+            await app.start()
+            await app.updater.start_webhook(**webhook_options())
+            try:
+                assert api.webhook_set.is_set()
+                assert api.webhook["secret_token"] == SECRET
+                async with httpx.AsyncClient(timeout=REPLY_TIMEOUT) as client:
+                    rejected = await client.post(webhook_settings, json=_update(1, 42, "200 кофе"),
+                                                 headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+                    accepted = await client.post(webhook_settings, json=_update(2, 42, "200 кофе"),
+                                                 headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                deadline = time.monotonic() + REPLY_TIMEOUT
+                while not api.sent and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+            finally:
+                await app.updater.stop()
+                await app.stop()
+        return rejected.status_code, accepted.status_code
+
+    rejected, accepted = asyncio.run(scenario())
+    assert rejected == 403
+    assert accepted == 200
+    assert len(api.sent) == 1
+    assert api.sent[0].chat_id == 42
+    assert api.sent[0].text.startswith("Записано: 200 ₽")